@@ -0,0 +1,119 @@
+''' Measure how long each ytbdl sub-command spends importing modules, using
+python -X importtime, and fail if any sub-command goes over its budget or
+imports a module it should not need.
+
+beets and yt-dlp take most of ytbdl's start up time, so only the sub-commands
+that download or tag music should import them.
+
+Usage:
+    python benchmarks/bench_import_time.py [--runs N]
+'''
+#pylint: disable=consider-using-f-string
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+
+
+# (arguments, budget in milliseconds, modules that must not be imported). The
+# budget is for the modules imported on top of those the interpreter imports
+# when it starts
+HEAVY_MODULES = ('yt_dlp', 'beets', 'mediafile', 'musicbrainzngs')
+SUB_COMMANDS = [
+    (['--help'], 120, HEAVY_MODULES),
+    (['config', 'path'], 120, HEAVY_MODULES),
+    (['config', 'dump'], 120, HEAVY_MODULES),
+    (['get', '--help'], 120, HEAVY_MODULES),
+    (['batch', '--help'], 120, HEAVY_MODULES),
+    (['review', '--help'], 120, HEAVY_MODULES),
+    (['serve', '--help'], 120, HEAVY_MODULES),
+    (['sync', '--help'], 120, HEAVY_MODULES),
+]
+
+RUN_SUB_COMMAND = (
+    'import sys; sys.argv = ["ytbdl", *sys.argv[1:]]; '
+    'from ytbdl.application import main; main()'
+)
+
+IMPORT_TIME_LINE = re.compile(
+    r'^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \| (?P<indent>\s*)(?P<module>\S+)$'
+)
+
+
+def measure(code: str, arguments: list = None, startup_modules: set = None) -> tuple:
+    ''' Run Python code with -X importtime
+
+    Args:
+        code (str): The code to run
+        arguments (list): The arguments to pass to the code
+        startup_modules (set): Top level modules whose import time should
+            not be counted
+
+    Returns:
+        (tuple): The total import time in milliseconds, the set of modules
+            that were imported, and the set of top level modules
+    '''
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code, *(arguments or [])],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=False,
+    )
+    total_us = 0
+    modules = set()
+    top_level_modules = set()
+    for line in result.stderr.splitlines():
+        match_obj = IMPORT_TIME_LINE.match(line)
+        if match_obj is None:
+            continue
+        modules.add(match_obj.group('module'))
+        # Only count the top level imports, their cumulative times include
+        # everything they import
+        if match_obj.group('indent'):
+            continue
+        top_level_modules.add(match_obj.group('module'))
+        if match_obj.group('module') not in (startup_modules or set()):
+            total_us += int(match_obj.group('cumulative'))
+    return total_us / 1000, modules, top_level_modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ytbdl import times')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='The number of times to run each sub-command')
+    args = parser.parse_args()
+
+    _, _, startup_modules = measure('pass')
+
+    failures = 0
+    for arguments, budget, forbidden in SUB_COMMANDS:
+        times = []
+        imported = set()
+        for _ in range(args.runs):
+            total, modules, _ = measure(RUN_SUB_COMMAND, arguments, startup_modules)
+            times.append(total)
+            imported |= modules
+        median = statistics.median(times)
+
+        problems = []
+        if median > budget:
+            problems.append('over budget of {0} ms'.format(budget))
+        leaked = sorted(
+            module for module in imported
+            if any(module == name or module.startswith(name + '.') for name in forbidden)
+        )
+        top_level_leaked = sorted({module.split('.')[0] for module in leaked})
+        if top_level_leaked:
+            problems.append('imported {0}'.format(', '.join(top_level_leaked)))
+
+        print('ytbdl {0:<16} {1:7.1f} ms  {2}'.format(
+            ' '.join(arguments), median, '; '.join(problems) or 'ok'
+        ))
+        if problems:
+            failures += 1
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,397 @@
+''' Benchmark downloading and tagging albums end to end, with no network.
+
+Each scenario runs DownloadApp.start_execution once per album in a fresh
+process, with a fresh config directory and music library, like a user running
+ytbdl get for each album. Everything is served by a local HTTP server:
+
+- Each album is an RSS feed listing its tracks, which yt-dlp's generic
+  extractor resolves as a playlist
+- Each track is a synthetic WAV file, so yt-dlp has nothing to convert
+- MusicBrainz never finds a match, so beets imports each album as-is without
+  asking any questions
+
+For each scenario, the albums per minute, the latency of each phase recorded
+with --metrics-out, the peak memory use, and the start up time are reported.
+Results can be saved and compared against a baseline with --output and
+--baseline.
+
+To see how downloads behave when a site is busy, the server can throttle
+every Nth audio request with an HTTP 429 error (--throttle-every), and delay
+every audio response (--latency). Every track must still be imported.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--albums 1 10 100] [--tracks N]
+        [--jobs N] [--requests-per-second N] [--throttle-every N]
+        [--latency SECONDS] [--output results.json] [--baseline results.json]
+'''
+#pylint: disable=consider-using-f-string
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import quote
+import argparse
+import io
+import json
+import math
+import os
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+
+SAMPLE_RATE = 8000
+
+# Titles like those of YouTube videos, so that titles are cleaned
+TRACK_TITLE = 'Artist {album} - Song {track} (Official Audio)'
+
+CONFIG = '''\
+ytdl_args:
+  - --no-progress
+download_archive: yes
+
+directory: "{{import_dir}}" # DO NOT REMOVE
+
+import:
+    move: yes
+    quiet: yes
+    quiet_fallback: asis
+
+musicbrainz:
+    host: 127.0.0.1:{port}
+    ratelimit: 1000
+
+rate_limit:
+    requests_per_second: {requests_per_second}
+    backoff: 0.5
+    max_backoff: 5
+
+pluginpath: "{{beetsplug_dir}}" # DO NOT REMOVE
+
+plugins: # DO NOT REMOVE
+    - fromdirname # DO NOT REMOVE
+    - fromyoutubetitle # DO NOT REMOVE
+'''
+
+EMPTY_SEARCH = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#">'
+    '<{0}-list count="0" offset="0"/></metadata>'
+)
+
+# Runs one scenario in a new process. Arguments: the albums JSON file, the
+# metrics report path, the results path, and the number of batch jobs (0 to
+# run ytbdl get for each album instead)
+RUN_SCENARIO = '''
+import json, resource, sys, time
+from pathlib import Path
+from ytbdl.apps.batch import BatchApp
+from ytbdl.apps.get import DownloadApp
+from ytbdl.metrics import get_metrics
+albums_path, metrics_path, results_path, jobs = sys.argv[1:]
+ready = time.time()
+options = dict(verbose=False, resume=False, headless=False, ytdl_args=[])
+if int(jobs):
+    BatchApp().start_execution(None, manifest=Path(albums_path), jobs=int(jobs),
+                               fail_fast=False, **options)
+else:
+    for album in json.load(open(albums_path)):
+        DownloadApp().start_execution(None, **album, **options)
+finished = time.time()
+get_metrics().write_report(metrics_path)
+with open(results_path, 'w') as results_file:
+    json.dump({
+        'ready': ready,
+        'finished': finished,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'children_max_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }, results_file)
+'''
+
+
+def synthetic_wav(seconds: float, frequency: float) -> bytes:
+    ''' Create a mono 16-bit WAV file with a sine wave
+
+    Args:
+        seconds (float): The length of the audio
+        frequency (float): The frequency of the sine wave
+
+    Returns:
+        (bytes): The WAV file
+    '''
+    frames = b''.join(
+        struct.pack('<h', int(8000 * math.sin(2 * math.pi * frequency * n / SAMPLE_RATE)))
+        for n in range(int(seconds * SAMPLE_RATE))
+    )
+    wav_file = io.BytesIO()
+    with wave.open(wav_file, 'wb') as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(SAMPLE_RATE)
+        writer.writeframes(frames)
+    return wav_file.getvalue()
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    ''' Serves album feeds, synthetic audio, and empty MusicBrainz searches
+    '''
+    def __init__(self, *args, fixtures=None, **kwargs):
+        self.fixtures = fixtures
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path.startswith('/ws/2/'):
+            entity = path[len('/ws/2/'):].strip('/')
+            self.send_body(EMPTY_SEARCH.format(entity).encode('utf-8'), 'application/xml')
+        elif path.startswith('/feeds/'):
+            album = int(Path(path).stem)
+            self.send_body(self.fixtures.feed(album), 'application/rss+xml')
+        elif path.startswith('/audio/'):
+            if self.fixtures.should_throttle():
+                self.send_response(429)
+                self.send_header('Retry-After', str(self.fixtures.retry_after))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            time.sleep(self.fixtures.latency)
+            self.send_body(self.fixtures.audio, 'audio/wav')
+        else:
+            self.send_error(404)
+
+    def send_body(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args): #pylint: disable=arguments-differ
+        pass
+
+
+class Fixtures:
+    ''' The albums served by the local HTTP server
+    '''
+    def __init__(self, tracks: int, seconds: float, throttle_every: int = 0,
+                 latency: float = 0.0, retry_after: int = 1):
+        self.tracks = tracks
+        self.audio = synthetic_wav(seconds, 440)
+        self.throttle_every = throttle_every
+        self.latency = latency
+        self.retry_after = retry_after
+        self.audio_requests = 0
+        self.lock = threading.Lock()
+        self.server = None
+        self.base_url = None
+
+    def should_throttle(self) -> bool:
+        with self.lock:
+            self.audio_requests += 1
+            return bool(self.throttle_every) and \
+                self.audio_requests % self.throttle_every == 0
+
+    def start(self):
+        handler = partial(FixtureHandler, fixtures=self)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.base_url = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def feed(self, album: int) -> bytes:
+        items = []
+        for track in range(1, self.tracks + 1):
+            title = TRACK_TITLE.format(album=album, track=track)
+            url = '{0}/audio/{1}.wav'.format(self.base_url, quote(title))
+            items.append(
+                '<item><title>{0}</title><link>{1}</link>'
+                '<enclosure url="{1}" type="audio/wav"/></item>'.format(title, url)
+            )
+        return (
+            '<?xml version="1.0"?><rss version="2.0"><channel>'
+            '<title>Album {0}</title><link>{1}</link>{2}</channel></rss>'.format(
+                album, self.base_url, ''.join(items)
+            )
+        ).encode('utf-8')
+
+    def albums(self, count: int) -> list:
+        return [{
+            'artist': 'Artist {0}'.format(album),
+            'album': 'Album {0}'.format(album),
+            'urls': ['{0}/feeds/{1}.xml'.format(self.base_url, album)],
+        } for album in range(1, count + 1)]
+
+
+def run_scenario(fixtures: Fixtures, albums: int, jobs: int, work_dir: Path,
+                 requests_per_second: float) -> dict:
+    ''' Download and tag a number of albums in a new process
+
+    Args:
+        fixtures (Fixtures): The albums being served
+        albums (int): The number of albums to download
+        jobs (int): The number of batch jobs, or 0 to use ytbdl get
+        work_dir (Path): An empty directory to run the scenario in
+        requests_per_second (float): ytbdl's rate limit for the server
+
+    Returns:
+        (dict): The results of the scenario
+    '''
+    home = work_dir / 'home'
+    config_dir = home / '.config' / 'ytbdl'
+    config_dir.mkdir(parents=True)
+    host = fixtures.base_url[len('http://'):]
+    (config_dir / 'config.yaml').write_text(
+        CONFIG.format(port=host.split(':')[1], requests_per_second=requests_per_second),
+        encoding='utf-8'
+    )
+    albums_path = work_dir / ('albums.yaml' if jobs else 'albums.json')
+    # JSON is valid YAML, so the same file works as a batch manifest
+    albums_path.write_text(json.dumps(fixtures.albums(albums)), encoding='utf-8')
+    music_dir = work_dir / 'music'
+    music_dir.mkdir()
+
+    env = dict(os.environ, HOME=str(home), XDG_CONFIG_HOME=str(home / '.config'))
+    # The fixtures are served locally, proxies would get in the way
+    for variable in ('http_proxy', 'HTTP_PROXY', 'https_proxy', 'HTTPS_PROXY'):
+        env.pop(variable, None)
+
+    metrics_path = work_dir / 'metrics.json'
+    results_path = work_dir / 'results.json'
+    log_path = work_dir / 'ytbdl.log'
+    launched = time.time()
+    with open(log_path, 'w', encoding='utf-8') as log_file:
+        result = subprocess.run(
+            [sys.executable, '-c', RUN_SCENARIO, str(albums_path), str(metrics_path),
+             str(results_path), str(jobs)],
+            cwd=music_dir, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+            check=False,
+        )
+    if result.returncode != 0 or not results_path.exists():
+        log = log_path.read_text(encoding='utf-8').splitlines()
+        raise RuntimeError('Scenario with {0} album(s) failed:\n{1}'.format(
+            albums, '\n'.join(log[-20:])
+        ))
+
+    results = json.loads(results_path.read_text(encoding='utf-8'))
+    metrics = json.loads(metrics_path.read_text(encoding='utf-8'))
+    imported = len(list(music_dir.glob('*/*/*.wav')))
+    elapsed = results['finished'] - results['ready']
+
+    phases = {}
+    for phase in metrics['phases']:
+        phases.setdefault(phase['name'], []).append(phase['duration'] * 1000)
+    return {
+        'albums': albums,
+        'jobs': jobs,
+        'tracks_imported': imported,
+        'albums_per_minute': albums / elapsed * 60,
+        'startup_ms': (results['ready'] - launched) * 1000,
+        'max_rss_mb': results['max_rss_kb'] / 1024,
+        'children_max_rss_mb': results['children_max_rss_kb'] / 1024,
+        'bytes_downloaded': metrics['counters'].get('bytes_downloaded', 0),
+        'retries': metrics['counters'].get('retries', 0),
+        'throttled_requests': metrics['counters'].get('throttled_requests', 0),
+        'track_retries': metrics['counters'].get('track_retries', 0),
+        'phases': {
+            name: {
+                'count': len(durations),
+                'p50_ms': statistics.median(durations),
+                'p95_ms': percentile(durations, 95),
+                'total_ms': sum(durations),
+            } for name, durations in phases.items()
+        },
+    }
+
+
+def percentile(values: list, percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[max(0, index)]
+
+
+def print_result(result: dict, baseline: dict = None):
+    print('{0} album(s){1}: {2:.1f} albums/min{3}, start up {4:.0f} ms, '
+          'peak RSS {5:.0f} MB (children {6:.0f} MB), {7} tracks imported'.format(
+        result['albums'],
+        ' with {0} jobs'.format(result['jobs']) if result['jobs'] else '',
+        result['albums_per_minute'],
+        ' ({0:+.0%} vs baseline)'.format(
+            result['albums_per_minute'] / baseline['albums_per_minute'] - 1
+        ) if baseline else '',
+        result['startup_ms'], result['max_rss_mb'], result['children_max_rss_mb'],
+        result['tracks_imported'],
+    ))
+    if result.get('throttled_requests') or result.get('track_retries'):
+        print('    {0} request(s) throttled, {1} track retries'.format(
+            result['throttled_requests'], result['track_retries']
+        ))
+    print('    {0:<18} {1:>6} {2:>10} {3:>10} {4:>10}'.format(
+        'phase', 'count', 'p50 ms', 'p95 ms', 'total ms'
+    ))
+    for name, phase in sorted(result['phases'].items(), key=lambda p: -p[1]['total_ms']):
+        print('    {0:<18} {1:>6} {2:>10.1f} {3:>10.1f} {4:>10.1f}'.format(
+            name, phase['count'], phase['p50_ms'], phase['p95_ms'], phase['total_ms']
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ytbdl end to end, offline')
+    parser.add_argument('--albums', type=int, nargs='+', default=[1, 10, 100],
+                        help='The number of albums in each scenario')
+    parser.add_argument('--tracks', type=int, default=3,
+                        help='The number of tracks in each album')
+    parser.add_argument('--seconds', type=float, default=2.0,
+                        help='The length of each track in seconds')
+    parser.add_argument('--jobs', type=int, default=0, help=(
+        'Download albums with ytbdl batch and this many jobs, instead of '
+        'running ytbdl get for each album'
+    ))
+    parser.add_argument('--requests-per-second', type=float, default=10.0,
+                        help="ytbdl's rate limit for requests to the server")
+    parser.add_argument('--throttle-every', type=int, default=0, metavar='N',
+                        help='Respond to every Nth audio request with HTTP 429')
+    parser.add_argument('--latency', type=float, default=0.0, metavar='SECONDS',
+                        help='Delay every audio response')
+    parser.add_argument('--output', type=Path, help='Save the results as JSON')
+    parser.add_argument('--baseline', type=Path,
+                        help='Compare with results saved with --output')
+    args = parser.parse_args()
+
+    baselines = {}
+    if args.baseline:
+        baselines = {
+            (result['albums'], result['jobs']): result
+            for result in json.loads(args.baseline.read_text(encoding='utf-8'))
+        }
+
+    fixtures = Fixtures(args.tracks, args.seconds, args.throttle_every, args.latency)
+    fixtures.start()
+    results = []
+    try:
+        for albums in args.albums:
+            with tempfile.TemporaryDirectory(prefix='ytbdl-bench-') as work_dir:
+                result = run_scenario(fixtures, albums, args.jobs, Path(work_dir),
+                                      args.requests_per_second)
+            print_result(result, baselines.get((albums, args.jobs)))
+            results.append(result)
+    finally:
+        fixtures.stop()
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding='utf-8')
+
+    if any(result['tracks_imported'] != result['albums'] * args.tracks
+           for result in results):
+        print('Not every track was imported')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
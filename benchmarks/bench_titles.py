@@ -0,0 +1,118 @@
+''' Benchmark the fromyoutubetitle plugin's title cleaning against the way it
+was done before the junk patterns were fused into one scan, using a corpus of
+real YouTube titles. Also checks that both ways give the same titles.
+
+Usage:
+    python benchmarks/bench_titles.py [--repeat N]
+'''
+#pylint: disable=consider-using-f-string
+from pathlib import Path
+import argparse
+import re
+import sys
+import time
+
+import ytbdl.beetsplug
+
+# beets adds the plugin directory to the path the same way
+sys.path.insert(0, str(Path(ytbdl.beetsplug.__file__).parent))
+
+#pylint: disable=wrong-import-position
+from ytbdl.beetsplug.fromyoutubetitle import clean_title, extra_strip, get_artist_album_junk
+
+
+CORPUS_PATH = Path(__file__).parent / 'titles.tsv'
+
+# The patterns as they were before they were fused
+LEGACY_YOUTUBE_TITLE_JUNK = [
+    re.compile(r'(?i)(?P<junk>[\(\[\{].*?(?:Explicit|Clean|Parental\sAdvisory).*?[\)\]\}])'),
+    re.compile(r'(?i)(?P<junk>[\(\[\{].*?(?:HQ|HD|CDQ).*?[\)\]\}])'),
+    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Audio.*?[\)\]\}])'),
+    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Album.*?[\)\]\}])'),
+    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Song.*?[\)\]\}])'),
+    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Video.*?[\)\]\}])'),
+    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Lyric.*?[\)\]\}])'),
+    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Visualizer.*?[\)\]\}])'),
+    re.compile(r'(?i)(?P<junk>[\(\[\{].*?iTunes.*?[\)\]\}])'),
+    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Official.*?[\)\]\}])'),
+    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Original.*?[\)\]\}])'),
+    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Version.*?[\)\]\}])'),
+    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Prod(?:uced|\.)?\sBy.*?[\)\]\}])'),
+]
+
+
+def read_corpus(path: Path) -> list:
+    corpus = []
+    with open(path, 'r', encoding='utf-8') as corpus_file:
+        for line in corpus_file:
+            line = line.rstrip('\n')
+            if not line or line.startswith('#'):
+                continue
+            artist, album, title = line.split('\t')
+            corpus.append((artist, album, title))
+    return corpus
+
+
+def legacy_clean_title(title: str, artist_name: str, album_name: str):
+    ''' The original implementation: every pattern is searched for separately,
+    and the artist and album patterns are rebuilt for every title. The string
+    patterns search the partially cleaned title, as the fused cleaner does
+    '''
+    artist_album_junk = [
+        '(?i)(?P<junk>\\({0}\\))'.format(re.escape(album_name)),
+        '(?i)(?P<junk>\\(?{0}\\)?)'.format(re.escape(artist_name))
+    ]
+    new_title = title
+    for pattern_list in (artist_album_junk, LEGACY_YOUTUBE_TITLE_JUNK):
+        for pattern in pattern_list:
+            match_obj = None
+            if isinstance(pattern, re.Pattern):
+                match_obj = pattern.search(new_title)
+            elif isinstance(pattern, str):
+                match_obj = re.search(pattern, new_title)
+            if match_obj is not None:
+                new_title = new_title.replace(match_obj.group('junk'), '')
+    return extra_strip(new_title)
+
+
+def time_cleaner(cleaner, corpus: list, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for artist, album, title in corpus:
+            cleaner(title, artist, album)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark YouTube title cleaning')
+    parser.add_argument('--repeat', type=int, default=200,
+                        help='The number of times to clean the whole corpus')
+    args = parser.parse_args()
+
+    corpus = read_corpus(CORPUS_PATH)
+
+    mismatches = 0
+    for artist, album, title in corpus:
+        expected = legacy_clean_title(title, artist, album)
+        actual = clean_title(title, artist, album)
+        if expected != actual:
+            mismatches += 1
+            print('MISMATCH: {0!r}: expected {1!r}, got {2!r}'.format(title, expected, actual))
+
+    get_artist_album_junk.cache_clear()
+    legacy = time_cleaner(legacy_clean_title, corpus, args.repeat)
+    fused = time_cleaner(clean_title, corpus, args.repeat)
+    total = len(corpus) * args.repeat
+
+    print('{0} titles, cleaned {1} times each'.format(len(corpus), args.repeat))
+    print('legacy: {0:8.2f} us/title'.format(legacy / total * 1e6))
+    print('fused:  {0:8.2f} us/title'.format(fused / total * 1e6))
+    print('speedup: {0:.2f}x'.format(legacy / fused))
+
+    if mismatches:
+        print('{0} titles were cleaned differently'.format(mismatches))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -28,7 +28,7 @@ setup(
     install_requires=[
         "beets==1.5.0",
         "requests>=2.0.0",
-        "yt-dlp>=2021.11.10.1",
+        "yt-dlp>=2023.09.24",
     ],
 
     package_data={
@@ -1,11 +1,19 @@
 import argparse
 
+from .apps.batch import BatchApp
 from .apps.config import ConfigApp
 from .apps.get import DownloadApp
+from .apps.review import ReviewApp
+from .apps.serve import ServeApp
+from .apps.sync import SyncApp
 
 ACTIVATED_APPS = {
     'config': ConfigApp,
     'get': DownloadApp,
+    'batch': BatchApp,
+    'review': ReviewApp,
+    'serve': ServeApp,
+    'sync': SyncApp,
 }
 
 def main():
@@ -18,7 +26,10 @@ def main():
 def get_app_arg_parser():
     app_parser = argparse.ArgumentParser(description=(
         'download songs with yt-dlp and auto-tag them with beets. use the get '
-        'sub-app to *get* music, and use the config sub-app to *config*ure '
+        'sub-app to *get* music, the batch sub-app to get many albums at once, '
+        'the serve sub-app to keep ytbdl running and get albums queued with it, '
+        'the sync sub-app to keep albums up to date with growing playlists, '
+        'and use the config sub-app to *config*ure '
         'yt-dlp\'s and beets\' behaviour'
     ))
     subparser = app_parser.add_subparsers(title='Sub-application Choice')
@@ -11,7 +11,8 @@ class BaseApp(ABC):
     def start_execution(self, arg_parser, **kwargs):
         pass
 
-    def get_logger(self, name, level):
+    @staticmethod
+    def get_logger(name, level):
         logger = logging.getLogger(name)
         logger.setLevel(level)
         handler = logging.StreamHandler()
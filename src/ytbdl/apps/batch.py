@@ -0,0 +1,157 @@
+#pylint: disable=consider-using-f-string
+from pathlib import Path
+import sys
+
+import confuse
+
+from ytbdl import config_exists
+from ytbdl.apps.get import DownloadApp
+from ytbdl.archive import archive_enabled
+from ytbdl.exceptions import ConfigurationError, ManifestError
+from ytbdl.manifest import read_manifest
+from ytbdl.ytdl_args import ytdl_options
+
+
+class BatchApp(DownloadApp):
+    ''' App to download and tag many albums listed in a manifest file, all in
+    the same process.
+    '''
+
+    @staticmethod
+    def add_sub_parser_arguments(sub_parser):
+        batch_parser = sub_parser.add_parser(name='batch', description=(
+            'download and tag every album listed in a manifest file. the '
+            'manifest is a YAML file with a list of jobs, or a JSON Lines '
+            '(.jsonl) file with one job per line. each job has an artist, an '
+            'album, a list of urls, and optionally its own ytdl_args'
+        ))
+        batch_parser.add_argument('-v', '--verbose', action='store_true', help=(
+            'log verbose (debug) information'
+        ))
+        batch_parser.add_argument('-y', '--ytdl-args', default=[],
+            type=ytdl_options, help=(
+            'command line arguments to pass to yt-dlp for every job. these '
+            'are combined with the ytdl_args of each job, and with the '
+            'ytdl_args config option'
+        ))
+        batch_parser.add_argument('--headless', action='store_true', help=(
+            'never ask for input while tagging. matches beets is confident in '
+            'are applied automatically, anything else is left where it was '
+            'downloaded and queued for review with "ytbdl review"'
+        ))
+        batch_parser.add_argument('-r', '--resume', action='store_true', help=(
+            'continue downloading albums whose folders already exist, e.g. '
+            'after a network failure. only the tracks that are missing are '
+            'downloaded'
+        ))
+        batch_parser.add_argument('-j', '--jobs', default=1, type=int, help=(
+            'the number of albums to download at the same time. albums are '
+            'tagged one at a time as soon as they finish downloading, while '
+            'the other albums continue to download. defaults to 1'
+        ))
+        batch_parser.add_argument('--fail-fast', action='store_true', help=(
+            'stop at the first album that fails, instead of continuing with '
+            'the rest of the manifest'
+        ))
+        DownloadApp.add_report_arguments(batch_parser)
+        batch_parser.add_argument('manifest', type=Path, help=(
+            'the YAML or JSON Lines file listing the albums to download'
+        ))
+
+    def start_execution(self, arg_parser, **kwargs):
+        self.verbose = kwargs.get('verbose')
+        self.resume = kwargs.get('resume')
+        self.configure_logging()
+        if not config_exists():
+            self.logger.info('Create a config before continuing with:')
+            self.logger.info('ytbdl config create')
+            return
+
+        #pylint: disable=import-outside-toplevel
+        from ytbdl.beets import BeetsSession
+
+        self.beets_session = BeetsSession(self.logger, headless=kwargs.get('headless'))
+
+        with self.reporting(kwargs.get('metrics_out'), kwargs.get('profile')):
+            self.run_manifest(**kwargs)
+
+    def run_manifest(self, **kwargs):
+        ''' Download and tag every album in the manifest, aborting if the
+        manifest or config can't be read
+
+        Args:
+            **kwargs: The arguments passed to the batch sub-command
+        '''
+        #pylint: disable=import-outside-toplevel
+        from ytbdl.pipeline import AlbumPipeline
+        from ytbdl.yt_dlp import close_engines
+
+        try:
+            jobs = read_manifest(kwargs.get('manifest'))
+            # The config is only resolved once for the whole manifest
+            shared_args = self.combine_ytdl_args(
+                kwargs.get('ytdl_args', []), self.get_config_ytdl_args()
+            )
+        except ManifestError as exc:
+            self.logger.error(msg='ManifestError: {0}'.format(str(exc)))
+            self.logger.warning('Aborting')
+            sys.exit(1)
+        except confuse.exceptions.ConfigTypeError:
+            self.logger.error('ytdl_args config option is not a list!')
+            self.logger.warning('Aborting')
+            sys.exit(1)
+
+        self.logger.info(msg='Found {0} album(s) in the manifest'.format(len(jobs)))
+
+        failures = []
+        albums = []
+        try:
+            for job in jobs:
+                try:
+                    album_dir = self.get_album_dir(job.artist, job.album)
+                    if any(album_dir == claimed for _, claimed, _ in albums):
+                        raise FileExistsError(
+                            'The album folder "{0}" is used by more than one job '
+                            'in the manifest'.format(str(album_dir))
+                        )
+                except FileExistsError as exc:
+                    failures.append((job, exc))
+                    continue
+                extra_args = self.combine_ytdl_args(job.ytdl_args, shared_args)
+                if kwargs.get('jobs') > 1 and '--no-progress' not in extra_args:
+                    # Progress bars from concurrent downloads would overlap
+                    extra_args.append('--no-progress')
+                albums.append((job, album_dir, extra_args))
+
+            if not (failures and kwargs.get('fail_fast')):
+                pipeline = AlbumPipeline(
+                    import_album=self.beets_session.import_album,
+                    logger=self.logger,
+                    max_workers=kwargs.get('jobs'),
+                    fail_fast=kwargs.get('fail_fast'),
+                    use_archive=archive_enabled(),
+                )
+                failures.extend(pipeline.run(albums))
+
+        except KeyboardInterrupt:
+            self.logger.info('User interrupted program.')
+            self.logger.info('Aborting.')
+            sys.exit(2)
+        except ConfigurationError as exc:
+            self.logger.error(msg='ConfigurationError encountered:')
+            self.logger.error(msg=str(exc))
+            self.logger.warning('Aborting')
+            sys.exit(1)
+        finally:
+            self.beets_session.close()
+            close_engines()
+
+        if failures:
+            self.logger.warning(msg='{0} album(s) could not be downloaded:'.format(
+                len(failures)
+            ))
+            for job, exc in failures:
+                self.logger.warning(msg='"{0}" by {1}: {2}: {3}'.format(
+                    job.album, job.artist, exc.__class__.__name__, str(exc)
+                ))
+            sys.exit(1)
@@ -1,6 +1,7 @@
 #pylint: disable=consider-using-f-string
+from contextlib import contextmanager
 from pathlib import Path
-from subprocess import CalledProcessError
+import os
 import re
 import sys
 
@@ -8,9 +9,10 @@ import confuse
 
 from ytbdl import config_exists, config
 from ytbdl.apps.base import BaseApp
-from ytbdl.beets import beet_import
-from ytbdl.exceptions import ConfigurationError
-from ytbdl.yt_dlp import ytdl_options, download_audio
+from ytbdl.archive import archive_enabled, open_archive
+from ytbdl.exceptions import ConfigurationError, DownloadError, ServerError
+from ytbdl.resume import AlbumState, has_state
+from ytbdl.ytdl_args import ytdl_options
 
 
 class DownloadApp(BaseApp):
@@ -38,6 +40,22 @@ class DownloadApp(BaseApp):
             'use. --ytdl-args are always combined with any existing args in '
             'the ytdl_args config option'
         ))
+        dl_parser.add_argument('--headless', action='store_true', help=(
+            'never ask for input while tagging. matches beets is confident in '
+            'are applied automatically, anything else is left where it was '
+            'downloaded and queued for review with "ytbdl review"'
+        ))
+        dl_parser.add_argument('-r', '--resume', action='store_true', help=(
+            'continue downloading an album whose folder already exists, e.g. '
+            'after a network failure. only the tracks that are missing are '
+            'downloaded'
+        ))
+        dl_parser.add_argument('--no-server', action='store_true', help=(
+            'download the album in this process even if a "ytbdl serve" '
+            'server is running. without this option, --headless downloads are '
+            'queued with the server when one is running'
+        ))
+        DownloadApp.add_report_arguments(dl_parser)
         dl_parser.add_argument('artist', help=(
             'the artist who created the album'
         ))
@@ -48,19 +66,69 @@ class DownloadApp(BaseApp):
             'one or more URLs to download audio from'
         ))
 
+    @staticmethod
+    def add_report_arguments(parser):
+        ''' Add the arguments used to write reports on where the time went
+        while downloading and tagging
+
+        Args:
+            parser: The parser of a sub-command
+        '''
+        parser.add_argument('--metrics-out', type=Path, metavar='PATH', help=(
+            'write a JSON report of how long each phase took (extracting, '
+            'downloading, converting, and importing), with the bytes '
+            'downloaded and the time taken for each track, and the number of '
+            'retries'
+        ))
+        parser.add_argument('--profile', type=Path, metavar='PATH', help=(
+            'profile ytbdl with cProfile and write the stats to a file, which '
+            'can be read with python -m pstats. only the main thread is '
+            'profiled'
+        ))
+
     INVALID_FILENAME_CHARS = re.compile(r'[^\w\-_\. ]')
 
     def __init__(self):
         self.verbose = False
+        self.resume = False
         self.logger = None
-        self.temp_config = None
+        self.beets_session = None
 
     def configure_logging(self):
         level = 'DEBUG' if self.verbose else 'INFO'
         self.logger = self.get_logger('ytbdl', level)
 
+    @contextmanager
+    def reporting(self, metrics_out: Path = None, profile_out: Path = None):
+        ''' Write the metrics recorded, and the profile of the code run, once
+        the context exits, even if ytbdl is aborting
+
+        Args:
+            metrics_out (Path): The file to write the metrics report to, if any
+            profile_out (Path): The file to write cProfile stats to, if any
+        '''
+        #pylint: disable=import-outside-toplevel
+        import cProfile
+        from ytbdl.metrics import get_metrics
+
+        profiler = None
+        if profile_out is not None:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(str(profile_out))
+                self.logger.info(msg='Wrote profile to {0}'.format(str(profile_out)))
+            if metrics_out is not None:
+                get_metrics().write_report(metrics_out)
+                self.logger.info(msg='Wrote metrics to {0}'.format(str(metrics_out)))
+
     def start_execution(self, arg_parser, **kwargs):
         self.verbose = kwargs.get('verbose')
+        self.resume = kwargs.get('resume')
         self.configure_logging()
         if not config_exists():
             self.logger.info('Create a config before continuing with:')
@@ -72,29 +140,69 @@ class DownloadApp(BaseApp):
         urls = kwargs.get('urls')
         extra_args = kwargs.get('ytdl_args', [])
 
+        # The server can't ask questions, and doesn't report metrics back
+        if kwargs.get('headless') and not kwargs.get('no_server') and not self.resume \
+                and not kwargs.get('metrics_out') and not kwargs.get('profile') and \
+                self.submit_to_server(artist_name, album_name, urls, extra_args):
+            return
+
+        # beets and yt-dlp take a long time to import, so they are only
+        # imported when they are needed
+        #pylint: disable=import-outside-toplevel
+        from ytbdl.beets import BeetsSession
+        self.beets_session = BeetsSession(self.logger, headless=kwargs.get('headless'))
+
+        with self.reporting(kwargs.get('metrics_out'), kwargs.get('profile')):
+            self.download_and_tag(artist_name, album_name, urls, extra_args)
+
+    def submit_to_server(self, artist_name: str, album_name: str, urls: list,
+                         extra_args: list) -> bool:
+        ''' Queue an album with the "ytbdl serve" server, if one is running
+
+        Args:
+            artist_name (str): The name of the artist
+            album_name (str): The name of the album
+            urls (list): One or more URLs to download audio from
+            extra_args (list): Extra arguments to pass to yt-dlp, which the
+                server combines with the ytdl_args config option
+
+        Returns:
+            (bool): True if the album was queued with the server
+        '''
+        #pylint: disable=import-outside-toplevel
+        from ytbdl.server import find_server
+
+        client = find_server()
+        if client is None:
+            return False
         try:
-            # Construct yt-dlp extra arguments
-            if 'ytdl_args' in config:
-                for config_arg in config['ytdl_args'].get(list):
-                    if config_arg not in extra_args:
-                        extra_args.append(config_arg)
-            else:
-                self.logger.debug('ytdl_args not found in config file')
-
-            album_dir = self.get_album_dir(artist_name, album_name)
-
-            # Download music to directory (yt-dlp will create the directory if
-            # it's missing)
-            self.logger.info(msg='Downloading "{0}" by {1}'.format(
-                album_name, artist_name
-            ))
-            download_audio(album_dir, extra_args, urls, self.logger)
+            job = client.submit(artist_name, album_name, urls, extra_args, os.getcwd())
+        except ServerError as exc:
+            self.logger.warning(msg='{0}. Downloading here instead'.format(str(exc)))
+            return False
+        self.logger.info(msg='Queued "{0}" by {1} with the ytbdl server as job {2}'.format(
+            album_name, artist_name, job['id']
+        ))
+        self.logger.info('See how it is going with: ytbdl serve --list')
+        return True
 
-            # Autotag music in directory
-            self.logger.info(msg='Autotagging album downloaded to {0}'.format(
-                str(album_dir)
-            ))
-            beet_import(album_dir, self.logger)
+    def download_and_tag(self, artist_name: str, album_name: str, urls: list,
+                         extra_args: list):
+        ''' Download and tag an album, aborting if anything goes wrong
+
+        Args:
+            artist_name (str): The name of the artist
+            album_name (str): The name of the album
+            urls (list): One or more URLs to download audio from
+            extra_args (list): Extra arguments to pass to yt-dlp, which are
+                combined with the ytdl_args config option
+        '''
+        #pylint: disable=import-outside-toplevel
+        from ytbdl.yt_dlp import close_engines
+
+        try:
+            extra_args = self.combine_ytdl_args(extra_args, self.get_config_ytdl_args())
+            self.get_album(artist_name, album_name, urls, extra_args)
 
         except confuse.exceptions.ConfigTypeError:
             self.logger.error('ytdl_args config option is not a list!')
@@ -108,22 +216,109 @@ class DownloadApp(BaseApp):
             self.logger.error(msg='FileExistsError: {0}'.format(str(exc)))
             self.logger.warning('Aborting')
             sys.exit(1)
-        except (CalledProcessError, ConfigurationError) as exc:
+        except (DownloadError, ConfigurationError) as exc:
             self.logger.error(msg='{0} encountered:'.format(
                 exc.__class__.__name__
             ))
             self.logger.error(msg=str(exc))
             self.logger.warning('Aborting')
             sys.exit(1)
+        finally:
+            self.beets_session.close()
+            close_engines()
+
+    def get_config_ytdl_args(self) -> list:
+        ''' Get the yt-dlp arguments from the ytdl_args config option
+
+        Returns:
+            (list): The arguments in the config file, or an empty list if the
+                option is not set
+        '''
+        if 'ytdl_args' in config:
+            return config['ytdl_args'].get(list)
+        self.logger.debug('ytdl_args not found in config file')
+        return []
+
+    @staticmethod
+    def combine_ytdl_args(extra_args: list, config_args: list) -> list:
+        ''' Combine yt-dlp arguments from the command line with those in the
+        config file. Arguments already present in extra_args are not repeated.
+
+        Args:
+            extra_args (list): Arguments passed on the command line
+            config_args (list): Arguments from the ytdl_args config option
 
+        Returns:
+            (list): A new list with the combined arguments
+        '''
+        combined_args = list(extra_args)
+        for config_arg in config_args:
+            if config_arg not in combined_args:
+                combined_args.append(config_arg)
+        return combined_args
+
+    def get_album(self, artist_name: str, album_name: str, urls: list,
+                  extra_args: list, parent_dir: Path = Path('.'),
+                  playlists: dict = None, merge: bool = False):
+        ''' Download an album and autotag it
+
+        Args:
+            artist_name (str): The name of the artist
+            album_name (str): The name of the album
+            urls (list): One or more URLs to download audio from
+            extra_args (list): All of the extra arguments to pass to yt-dlp
+            parent_dir (Path): The directory to create the artist folder in
+            playlists (dict): Playlists that were already resolved, by URL,
+                which are downloaded without extracting them again
+            merge (bool): Merge the tracks with the album already in the
+                beets library, if there is one
+        '''
+        #pylint: disable=import-outside-toplevel
+        from ytbdl.dedupe import remove_duplicate_files
+        from ytbdl.stream import TrackPreparer
+        from ytbdl.yt_dlp import download_audio
+
+        album_dir = self.get_album_dir(artist_name, album_name, parent_dir)
 
-    def get_album_dir(self, artist: str, album: str) -> Path:
+        # Download music to directory (yt-dlp will create the directory if
+        # it's missing)
+        self.logger.info(msg='Downloading "{0}" by {1}'.format(
+            album_name, artist_name
+        ))
+        archive = open_archive() if archive_enabled() else None
+        state = AlbumState(album_dir, self.logger)
+        state.save()
+        with TrackPreparer(self.logger, on_prepared=state.complete) as preparer:
+            files = download_audio(album_dir, extra_args, urls, self.logger, archive,
+                                   file_hook=preparer.prepare, state=state,
+                                   playlists=playlists)
+            preparer.wait()
+        self.check_cancelled()
+        remove_duplicate_files(album_dir, files, self.logger, state)
+        # The album is only imported once every track checks out
+        state.check()
+        state.remove()
+
+        # Autotag music in directory
+        self.logger.info(msg='Autotagging album downloaded to {0}'.format(
+            str(album_dir)
+        ))
+        self.beets_session.import_album(album_dir, merge=merge)
+
+    def check_cancelled(self):
+        ''' Called once an album has downloaded, before it's imported. Does
+        nothing, but apps that can cancel an album raise an exception to stop
+        it from being imported
+        '''
+
+    def get_album_dir(self, artist: str, album: str, parent_dir: Path = Path('.')) -> Path:
         ''' Get the path to the artist/album folder. If the album folder already
         exists and is not empty, an exception is raised as this may indicate
-        that the album has already been downloaded.
+        that the album has already been downloaded, unless the download is
+        being resumed. Downloads that were interrupted are always resumed.
 
-        The directory structure is created under the current directory in this
-        manner:
+        The directory structure is created under the current directory, or the
+        parent_dir if given, in this manner:
 
         .. code-block::
 
@@ -134,15 +329,21 @@ class DownloadApp(BaseApp):
         Args:
             artist (str): The name of the artist whose music is being downloaded
             album (str): The name of album by the artist
+            parent_dir (Path): The directory to create the artist folder in
 
         Returns:
-            (Path): A path to the album folder relative to the current directory
+            (Path): A path to the album folder relative to the current
+                directory, or in the parent_dir
         '''
         def sanitize_path(name):
             return self.INVALID_FILENAME_CHARS.sub('_', name)
 
-        album_folder = Path('.') / sanitize_path(artist) / sanitize_path(album)
-        if album_folder.exists() and album_folder.is_dir() and \
+        album_folder = Path(parent_dir) / sanitize_path(artist) / sanitize_path(album)
+        if not self.resume and has_state(album_folder):
+            self.logger.info(msg='Resuming the interrupted download in {0}'.format(
+                str(album_folder)
+            ))
+        elif not self.resume and album_folder.exists() and album_folder.is_dir() and \
             any(album_folder.glob('*')):
             raise FileExistsError(
                 'The album folder "{0}" already exists and is not empty'.format(
@@ -0,0 +1,110 @@
+#pylint: disable=consider-using-f-string
+from pathlib import Path
+import sys
+
+from ytbdl import config_exists
+from ytbdl.apps.base import BaseApp
+from ytbdl.exceptions import ConfigurationError
+from ytbdl.review import open_review_queue
+
+
+class ReviewApp(BaseApp):
+    ''' App to interactively import the albums that were queued for review by
+    a headless download.
+    '''
+
+    @staticmethod
+    def add_sub_parser_arguments(sub_parser):
+        review_parser = sub_parser.add_parser(name='review', description=(
+            'tag the albums that were downloaded with --headless, but that '
+            'beets could not match confidently. each album is imported '
+            'interactively with beets, like a regular download'
+        ))
+        review_parser.add_argument('-l', '--list', action='store_true', help=(
+            'list the albums waiting for review, and the matches beets found '
+            'for them, without importing them'
+        ))
+
+    def __init__(self):
+        self.logger = self.get_logger('review', 'INFO')
+
+    def start_execution(self, arg_parser, **kwargs):
+        if not config_exists():
+            self.logger.info('Create a config before continuing with:')
+            self.logger.info('ytbdl config create')
+            return
+
+        review_queue = open_review_queue()
+        entries = review_queue.entries()
+        if not entries:
+            self.logger.info('There are no albums waiting for review')
+            return
+
+        if kwargs.get('list'):
+            for entry in entries:
+                self.print_entry(entry)
+            return
+
+        #pylint: disable=import-outside-toplevel
+        from ytbdl.beets import BeetsSession
+
+        session = BeetsSession(self.logger)
+        try:
+            for number, entry in enumerate(entries, start=1):
+                if not self.has_files(entry.path):
+                    self.logger.info(msg='{0} no longer has any files, removing it '
+                                     'from the queue'.format(entry.path))
+                    review_queue.remove(entry.path)
+                    continue
+
+                self.logger.info(msg='Reviewing album {0} of {1}'.format(
+                    number, len(entries)
+                ))
+                self.print_entry(entry)
+                # The files stay in the album folder after the import with
+                # "move: no" or "copy: yes"
+                if session.import_album(Path(entry.path)):
+                    review_queue.remove(entry.path)
+                else:
+                    self.logger.info(msg='{0} was not imported, it will stay in the '
+                                     'queue'.format(entry.path))
+
+        except KeyboardInterrupt:
+            self.logger.info('User interrupted program.')
+            self.logger.info('Aborting.')
+            sys.exit(2)
+        except ConfigurationError as exc:
+            self.logger.error(msg='ConfigurationError encountered:')
+            self.logger.error(msg=str(exc))
+            self.logger.warning('Aborting')
+            sys.exit(1)
+        finally:
+            session.close()
+
+    @staticmethod
+    def has_files(album_dir: str) -> bool:
+        path = Path(album_dir)
+        return path.is_dir() and any(child.is_file() for child in path.iterdir())
+
+    @staticmethod
+    def print_entry(entry):
+        print('')
+        print(entry.path)
+        print('  Reason: {0}'.format(entry.reason))
+        if entry.artist or entry.album:
+            print('  Found: {0} - {1}'.format(entry.artist, entry.album))
+        if not entry.candidates:
+            print('  No candidates')
+        for candidate in entry.candidates:
+            if 'album' in candidate:
+                name = '{0} - {1} ({2}, {3} tracks)'.format(
+                    candidate['artist'], candidate['album'],
+                    candidate['year'], candidate['tracks']
+                )
+                identifier = candidate['album_id']
+            else:
+                name = '{0} - {1}'.format(candidate['artist'], candidate['title'])
+                identifier = candidate['track_id']
+            print('  {0:.1%} {1} [{2} {3}]'.format(
+                1 - candidate['distance'], name, candidate['data_source'], identifier
+            ))
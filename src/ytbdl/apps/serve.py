@@ -0,0 +1,260 @@
+#pylint: disable=consider-using-f-string
+from datetime import datetime
+from pathlib import Path
+import signal
+import sys
+import threading
+import time
+
+import confuse
+
+from ytbdl import config_exists
+from ytbdl.apps.get import DownloadApp
+from ytbdl.exceptions import ConfigurationError, DownloadError, JobCancelled, ServerError
+from ytbdl import jobs
+
+
+# How often the job queue is checked for jobs added without the server, in
+# seconds
+POLL_INTERVAL = 5
+
+
+class ServeApp(DownloadApp):
+    ''' App to run ytbdl as a server that downloads and tags the albums queued
+    with it, one at a time. yt-dlp and beets are only set up once, and stay
+    ready between albums. Jobs are kept in a database, so that queued jobs
+    survive restarts.
+    '''
+
+    @staticmethod
+    def add_sub_parser_arguments(sub_parser):
+        serve_parser = sub_parser.add_parser(name='serve', description=(
+            'run a server that downloads and tags albums queued with it, '
+            'without setting up yt-dlp and beets for each album. albums are '
+            'queued with "ytbdl get --headless" while the server is running, '
+            'or with the server\'s HTTP API. albums are always tagged '
+            'headless, see "ytbdl review"'
+        ))
+        serve_parser.add_argument('-v', '--verbose', action='store_true', help=(
+            'log verbose (debug) information'
+        ))
+        serve_parser.add_argument('-p', '--port', default=0, type=int, help=(
+            'the port to listen on, on localhost only. defaults to any free '
+            'port, which clients find in the server.json file next to the '
+            'config file'
+        ))
+        serve_parser.add_argument('-l', '--list', action='store_true', help=(
+            'list the jobs and their status instead of starting a server'
+        ))
+        serve_parser.add_argument('-c', '--cancel', type=int, metavar='JOB', help=(
+            'cancel a queued or running job instead of starting a server'
+        ))
+
+    def __init__(self):
+        super().__init__()
+        self.job_queue = None
+        self.running_job = None
+        self.cancelled = threading.Event()
+        self.watched_engines = set()
+
+    def start_execution(self, arg_parser, **kwargs):
+        #pylint: disable=import-outside-toplevel
+        from ytbdl.server import find_server
+
+        self.verbose = kwargs.get('verbose')
+        self.configure_logging()
+        if not config_exists():
+            self.logger.info('Create a config before continuing with:')
+            self.logger.info('ytbdl config create')
+            return
+
+        self.job_queue = jobs.open_job_queue()
+        if kwargs.get('list'):
+            self.list_jobs()
+            return
+        if kwargs.get('cancel') is not None:
+            self.cancel_job(kwargs.get('cancel'))
+            return
+        if find_server() is not None:
+            self.logger.error('A ytbdl server is already running')
+            sys.exit(1)
+        self.serve(kwargs.get('port'))
+
+    def list_jobs(self):
+        ''' Print every job in the queue
+        '''
+        queued_jobs = self.job_queue.jobs()
+        if not queued_jobs:
+            self.logger.info('There are no jobs')
+            return
+        for job in queued_jobs:
+            print('{0:>5}  {1:<9}  {2}  "{3}" by {4}'.format(
+                job.id, job.status,
+                datetime.fromtimestamp(job.added).strftime('%Y-%m-%d %H:%M'),
+                job.album, job.artist
+            ))
+            if job.error:
+                print('       {0}'.format(job.error))
+
+    def cancel_job(self, job_id: int):
+        ''' Cancel a job, with the server if one is running so that a running
+        job can be stopped
+
+        Args:
+            job_id (int): The ID of the job
+        '''
+        #pylint: disable=import-outside-toplevel
+        from ytbdl.server import find_server
+
+        client = find_server()
+        if client is not None:
+            try:
+                job = client.cancel(job_id)
+            except ServerError as exc:
+                self.logger.error(msg=str(exc))
+                sys.exit(1)
+        else:
+            job = self.job_queue.cancel(job_id)
+            if job is None:
+                self.logger.error(msg='There is no job {0}'.format(job_id))
+                sys.exit(1)
+            job = job._asdict()
+        if job['status'] == jobs.RUNNING:
+            self.logger.info(msg='Job {0} is running, it will stop at the next '
+                             'chance'.format(job_id))
+        elif job['status'] == jobs.CANCELLED:
+            self.logger.info(msg='Cancelled job {0}'.format(job_id))
+        else:
+            self.logger.warning(msg='Job {0} is already {1}'.format(job_id, job['status']))
+
+    def serve(self, port: int):
+        ''' Run jobs until the server is stopped with Ctrl+C or a SIGTERM.
+        The job that is running when the server stops is queued again, and
+        resumed when the server starts again
+
+        Args:
+            port (int): The port to listen on
+        '''
+        #pylint: disable=import-outside-toplevel
+        from ytbdl.beets import BeetsSession
+        from ytbdl.server import JobServer
+        from ytbdl.yt_dlp import close_engines
+
+        requeued = self.job_queue.requeue_running()
+        if requeued:
+            self.logger.info(msg='Queued {0} interrupted job(s) again'.format(requeued))
+        self.beets_session = BeetsSession(self.logger, headless=True)
+        server = JobServer(self.job_queue, self.cancel_running, port)
+        server.start()
+        self.logger.info(msg='Listening on http://127.0.0.1:{0}'.format(server.server_port))
+        # Stop the same way as with Ctrl+C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+        try:
+            while True:
+                server.job_added.clear()
+                job = self.job_queue.start_next()
+                if job is None:
+                    server.job_added.wait(POLL_INTERVAL)
+                    continue
+                self.run_job(job)
+        except KeyboardInterrupt:
+            self.logger.info('Stopping the server')
+            self.job_queue.requeue_running()
+        finally:
+            server.stop()
+            self.beets_session.close()
+            close_engines()
+
+    def run_job(self, job):
+        ''' Download and tag the album of a job, recording whether it worked
+
+        Args:
+            job (Job): The running job
+        '''
+        #pylint: disable=import-outside-toplevel
+        from ytbdl.metrics import get_metrics
+
+        self.logger.info(msg='Starting job {0}: "{1}" by {2}'.format(
+            job.id, job.album, job.artist
+        ))
+        self.cancelled.clear()
+        self.running_job = job.id
+        started = time.monotonic()
+        status, error = jobs.DONE, None
+        try:
+            extra_args = self.combine_ytdl_args(job.ytdl_args, self.get_config_ytdl_args())
+            self.watch_for_cancel(extra_args)
+            self.get_album(job.artist, job.album, job.urls, extra_args,
+                           parent_dir=Path(job.directory))
+        except JobCancelled:
+            status = jobs.CANCELLED
+        except (DownloadError, ConfigurationError, FileExistsError,
+                confuse.ConfigError) as exc:
+            status, error = jobs.FAILED, '{0}: {1}'.format(exc.__class__.__name__, str(exc))
+        except Exception as exc: #pylint: disable=broad-except
+            # One bad job shouldn't stop the server
+            self.logger.exception(msg='Job {0} failed unexpectedly'.format(job.id))
+            status, error = jobs.FAILED, '{0}: {1}'.format(exc.__class__.__name__, str(exc))
+        finally:
+            self.running_job = None
+
+        if self.cancelled.is_set() and status == jobs.DONE:
+            self.logger.info(msg='Job {0} was cancelled too late, once its album '
+                             'was being imported'.format(job.id))
+        self.job_queue.finish(job.id, status, error)
+        # The server runs for a long time, so metrics are not kept between jobs
+        get_metrics().collect()
+        duration = time.monotonic() - started
+        if status == jobs.FAILED:
+            self.logger.error(msg='Job {0} failed after {1:.1f} seconds: {2}'.format(
+                job.id, duration, error
+            ))
+        else:
+            self.logger.info(msg='Job {0} {1} after {2:.1f} seconds'.format(
+                job.id, status, duration
+            ))
+
+    def watch_for_cancel(self, extra_args: list):
+        ''' Have the engine that downloads with a set of arguments stop when
+        the running job is cancelled
+
+        Args:
+            extra_args (list): The arguments passed to yt-dlp
+        '''
+        #pylint: disable=import-outside-toplevel
+        from ytbdl.yt_dlp import get_engine
+
+        engine = get_engine(extra_args, self.logger)
+        if id(engine) not in self.watched_engines:
+            engine.add_progress_hook(self.stop_if_cancelled)
+            self.watched_engines.add(id(engine))
+
+    def stop_if_cancelled(self, progress: dict):
+        #pylint: disable=import-outside-toplevel
+        from yt_dlp.utils import DownloadCancelled
+
+        if self.cancelled.is_set():
+            raise DownloadCancelled('Job {0} was cancelled'.format(self.running_job))
+
+    def check_cancelled(self):
+        ''' Stop the running job's album from being imported if the job was
+        cancelled. The download stops when the job is cancelled, but the
+        engine handles that like --max-downloads being reached, not as an
+        error
+
+        Raises:
+            JobCancelled: If the running job was cancelled
+        '''
+        if self.cancelled.is_set():
+            raise JobCancelled('Job {0} was cancelled'.format(self.running_job))
+
+    def cancel_running(self, job_id: int):
+        ''' Cancel the running job, if it has the given ID. Called by the
+        server's threads
+
+        Args:
+            job_id (int): The ID of the job
+        '''
+        if self.running_job == job_id:
+            self.cancelled.set()
@@ -0,0 +1,258 @@
+#pylint: disable=consider-using-f-string
+from datetime import datetime
+from pathlib import Path
+import os
+import sys
+
+import confuse
+
+from ytbdl import config_exists
+from ytbdl.apps.get import DownloadApp
+from ytbdl.exceptions import ConfigurationError, DownloadError
+from ytbdl.sync import open_sync_store
+from ytbdl.ytdl_args import ytdl_options
+
+
+class SyncApp(DownloadApp):
+    ''' App to keep albums up to date with the playlists they were downloaded
+    from. A snapshot of each playlist is kept, and each sync only downloads
+    the videos added to the playlist since the last sync, which are then
+    merged into the album in the beets library.
+    '''
+
+    @staticmethod
+    def add_sub_parser_arguments(sub_parser):
+        sync_parser = sub_parser.add_parser(name='sync', description=(
+            'keep albums up to date with playlists that grow over time. the '
+            'first sync of an album downloads and tags it like "ytbdl get". '
+            'later syncs only download the videos added to the playlists '
+            'since, and merge them into the album in the beets library. run '
+            'without an artist and album to sync every album'
+        ))
+        sync_parser.add_argument('-v', '--verbose', action='store_true', help=(
+            'log verbose (debug) information'
+        ))
+        sync_parser.add_argument('-y', '--ytdl-args', default=[],
+            type=ytdl_options, help=(
+            'command line arguments to pass to yt-dlp when syncing this '
+            'album. they are remembered for later syncs, and combined with '
+            'the ytdl_args config option'
+        ))
+        sync_parser.add_argument('--headless', action='store_true', help=(
+            'never ask for input while tagging. matches beets is confident in '
+            'are applied automatically, anything else is left where it was '
+            'downloaded and queued for review with "ytbdl review"'
+        ))
+        sync_parser.add_argument('--adopt', action='store_true', help=(
+            'start syncing an album that was already downloaded, e.g. with '
+            '"ytbdl get", without downloading it again. only the videos added '
+            'to the playlists after this are downloaded by later syncs'
+        ))
+        sync_parser.add_argument('-l', '--list', action='store_true', help=(
+            'list the albums that are synced instead of syncing them'
+        ))
+        sync_parser.add_argument('--untrack', action='store_true', help=(
+            'stop syncing the album, without deleting anything that was '
+            'downloaded'
+        ))
+        DownloadApp.add_report_arguments(sync_parser)
+        sync_parser.add_argument('artist', nargs='?', help=(
+            'the artist who created the album'
+        ))
+        sync_parser.add_argument('album', nargs='?', help=(
+            'the name of the album to sync'
+        ))
+        sync_parser.add_argument('urls', nargs='*', help=(
+            'the URLs of the playlists to sync the album with. only needed the '
+            'first time an album is synced, or to change its playlists'
+        ))
+
+    def __init__(self):
+        super().__init__()
+        self.sync_store = None
+
+    def start_execution(self, arg_parser, **kwargs):
+        self.verbose = kwargs.get('verbose')
+        self.configure_logging()
+        if not config_exists():
+            self.logger.info('Create a config before continuing with:')
+            self.logger.info('ytbdl config create')
+            return
+
+        self.sync_store = open_sync_store()
+        if kwargs.get('list'):
+            self.list_albums()
+            return
+
+        artist_name, album_name = kwargs.get('artist'), kwargs.get('album')
+        if artist_name is not None and album_name is None:
+            arg_parser.error('the album is required along with the artist')
+        if artist_name is None:
+            if kwargs.get('untrack') or kwargs.get('adopt') or kwargs.get('ytdl_args'):
+                arg_parser.error('an artist and album are required')
+            albums = self.sync_store.albums()
+            if not albums:
+                self.logger.info('There are no albums to sync. Start syncing one with:')
+                self.logger.info('ytbdl sync ARTIST ALBUM URL [URL ...]')
+                return
+        else:
+            album = self.find_album(artist_name, album_name, kwargs.get('urls'),
+                                    kwargs.get('ytdl_args'))
+            if kwargs.get('untrack'):
+                self.sync_store.untrack(album)
+                self.logger.info(msg='Stopped syncing "{0}" by {1}'.format(
+                    album.album, album.artist
+                ))
+                return
+            albums = [album]
+
+        # beets and yt-dlp take a long time to import, so they are only
+        # imported when they are needed
+        #pylint: disable=import-outside-toplevel
+        from ytbdl.beets import BeetsSession
+        self.beets_session = BeetsSession(self.logger, headless=kwargs.get('headless'))
+
+        with self.reporting(kwargs.get('metrics_out'), kwargs.get('profile')):
+            self.sync_albums(albums, kwargs.get('adopt'))
+
+    def find_album(self, artist_name: str, album_name: str, urls: list,
+                   extra_args: list):
+        ''' Get the synced album in the current directory, starting to sync it
+        if it's new, or updating it if new URLs or yt-dlp arguments were given
+
+        Args:
+            artist_name (str): The name of the artist
+            album_name (str): The name of the album
+            urls (list): The URLs of the playlists given, if any
+            extra_args (list): The yt-dlp arguments given, if any
+
+        Returns:
+            (SyncedAlbum): The album
+        '''
+        directory = os.getcwd()
+        album = self.sync_store.get(artist_name, album_name, directory)
+        if album is None and not urls:
+            self.logger.error(msg='"{0}" by {1} is not synced in {2}. Give the URLs of '
+                              'its playlists to start syncing it'.format(
+                                  album_name, artist_name, directory))
+            sys.exit(1)
+        if urls or extra_args:
+            album = self.sync_store.track(
+                artist_name, album_name, urls or album.urls,
+                extra_args or (album.ytdl_args if album else []), directory
+            )
+        return album
+
+    def list_albums(self):
+        ''' Print every synced album
+        '''
+        albums = self.sync_store.albums()
+        if not albums:
+            self.logger.info('There are no synced albums')
+            return
+        for album in albums:
+            synced = 'never synced' if album.synced is None else \
+                'synced {0}'.format(datetime.fromtimestamp(album.synced).strftime(
+                    '%Y-%m-%d %H:%M'
+                ))
+            print('"{0}" by {1}, {2}'.format(album.album, album.artist, synced))
+            print('    in {0}'.format(album.directory))
+            for url in album.urls:
+                print('    {0}'.format(url))
+
+    def sync_albums(self, albums: list, adopt: bool = False):
+        ''' Sync albums one after the other. Albums that fail to sync are
+        reported at the end, without stopping the rest from syncing
+
+        Args:
+            albums (list): The SyncedAlbums to sync
+            adopt (bool): Record the videos in the playlists without
+                downloading them
+        '''
+        #pylint: disable=import-outside-toplevel
+        from ytbdl.yt_dlp import close_engines
+
+        failures = []
+        try:
+            config_args = self.get_config_ytdl_args()
+            for album in albums:
+                try:
+                    self.sync_album(album, config_args, adopt)
+                except (DownloadError, FileExistsError) as exc:
+                    self.logger.error(msg='Could not sync "{0}" by {1}: {2}'.format(
+                        album.album, album.artist, str(exc)
+                    ))
+                    failures.append(album)
+        except confuse.exceptions.ConfigTypeError:
+            self.logger.error('ytdl_args config option is not a list!')
+            self.logger.warning('Aborting')
+            sys.exit(1)
+        except KeyboardInterrupt:
+            self.logger.info('User interrupted program.')
+            self.logger.info('Aborting.')
+            sys.exit(2)
+        except ConfigurationError as exc:
+            self.logger.error(msg='ConfigurationError encountered:')
+            self.logger.error(msg=str(exc))
+            self.logger.warning('Aborting')
+            sys.exit(1)
+        finally:
+            self.beets_session.close()
+            close_engines()
+
+        if failures:
+            self.logger.warning(msg='{0} album(s) could not be synced'.format(len(failures)))
+            sys.exit(1)
+
+    def sync_album(self, album, config_args: list, adopt: bool = False):
+        ''' Download the videos added to an album's playlists since the last
+        sync, and import them into the album
+
+        Args:
+            album (SyncedAlbum): The album
+            config_args (list): The arguments in the ytdl_args config option
+            adopt (bool): Record the videos in the playlists without
+                downloading them
+        '''
+        #pylint: disable=import-outside-toplevel
+        from ytbdl.yt_dlp import get_engine
+
+        extra_args = self.combine_ytdl_args(album.ytdl_args, config_args)
+        engine = get_engine(extra_args, self.logger)
+        playlists, new_entries = {}, []
+        for url in album.urls:
+            info = engine.resolve(url, fresh=True, synced=album.synced)
+            if info is None:
+                self.logger.info(msg='{0} has not changed since the last sync'.format(url))
+                continue
+            entries = self.sync_store.new_entries(album, info['entries'])
+            self.logger.info(msg='Found {0} new video(s) of {1} in {2}'.format(
+                len(entries), len(info['entries']), url
+            ))
+            if entries:
+                playlists[url] = dict(info, entries=entries)
+                new_entries.extend(entries)
+
+        if adopt or not new_entries:
+            self.sync_store.record(album, new_entries)
+            if new_entries:
+                self.logger.info(msg='Recorded {0} video(s) of "{1}" by {2} as already '
+                                 'downloaded'.format(len(new_entries), album.album,
+                                                     album.artist))
+            else:
+                self.logger.info(msg='"{0}" by {1} is up to date'.format(
+                    album.album, album.artist
+                ))
+            return
+
+        # Later syncs add to the album folder of the first one. The first sync
+        # must not mix its tracks with an album that's already there
+        self.resume = album.synced is not None
+        try:
+            self.get_album(album.artist, album.album, list(playlists), extra_args,
+                           parent_dir=Path(album.directory), playlists=playlists,
+                           merge=album.synced is not None)
+        except FileExistsError as exc:
+            raise FileExistsError('{0}. To sync an album that was already downloaded, '
+                                  'use --adopt'.format(str(exc))) from exc
+        self.sync_store.record(album, new_entries)
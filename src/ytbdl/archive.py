@@ -0,0 +1,143 @@
+#pylint: disable=consider-using-f-string
+from pathlib import Path
+import os
+
+from ytbdl import config
+from ytbdl.database import Database
+
+
+# One archive is opened per process
+_ARCHIVE = None
+
+
+def get_archive_path() -> str:
+    ''' Get the path to the download archive database. This path may or may
+    not exist
+
+    Returns:
+        (str): A path to the archive database in the config directory
+    '''
+    return os.path.join(config.config_dir(), 'archive.db')
+
+
+def archive_enabled() -> bool:
+    ''' Determine whether the download archive is turned on in the config. The
+    archive is on unless the download_archive option is set to "no"
+
+    Returns:
+        (bool): True if the archive should be used, False otherwise
+    '''
+    if 'download_archive' not in config:
+        return True
+    return config['download_archive'].get(bool)
+
+
+def open_archive() -> 'DownloadArchive':
+    ''' Open the download archive, or get it if it was already opened in this
+    process
+
+    Returns:
+        (DownloadArchive): The download archive
+    '''
+    global _ARCHIVE #pylint: disable=global-statement
+    if _ARCHIVE is None:
+        _ARCHIVE = DownloadArchive(get_archive_path())
+    return _ARCHIVE
+
+
+class DownloadArchive:
+    ''' An index of every video that has been downloaded, and where the file
+    downloaded from it ended up. Each video is identified by the yt-dlp
+    extractor it was downloaded with and its ID.
+
+    The path of a video is the path it was downloaded to, until beets moves the
+    file into its library, after which it's the path in the library. The
+    album directory the video was downloaded into is kept as well, since the
+    file is tagged for that album once beets imports it.
+
+    Args:
+        db_path (str): The path to the SQLite database. It is created if it
+            does not exist
+    '''
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.database = Database(db_path)
+        with self.database.transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS downloads ('
+                'extractor TEXT NOT NULL, '
+                'video_id TEXT NOT NULL, '
+                'path TEXT NOT NULL, '
+                'album TEXT, '
+                'PRIMARY KEY (extractor, video_id))'
+            )
+            columns = [row[1] for row in
+                       connection.execute('PRAGMA table_info(downloads)').fetchall()]
+            if 'album' not in columns:
+                # Archives from before the album was recorded
+                connection.execute('ALTER TABLE downloads ADD COLUMN album TEXT')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS downloads_path ON downloads (path)'
+            )
+
+    def get_path(self, extractor: str, video_id: str, album_dir: Path = None):
+        ''' Get the path of the file downloaded from a video, if the file still
+        exists
+
+        Args:
+            extractor (str): The name of the yt-dlp extractor
+            video_id (str): The ID of the video
+            album_dir (Path): Only get the file if the video was downloaded
+                into this album directory
+
+        Returns:
+            (Path): The path to the file, or None if the video was never
+                downloaded, was downloaded for another album, or its file no
+                longer exists
+        '''
+        row = self.database.fetchone(
+            'SELECT path, album FROM downloads WHERE extractor = ? AND video_id = ?',
+            (extractor.lower(), video_id)
+        )
+        if row is None or not os.path.isfile(row[0]):
+            return None
+        if album_dir is not None and row[1] != str(Path(album_dir).resolve()):
+            return None
+        return Path(row[0])
+
+    def record(self, extractor: str, video_id: str, file_path: Path,
+               album_dir: Path = None):
+        ''' Record the file downloaded from a video
+
+        Args:
+            extractor (str): The name of the yt-dlp extractor
+            video_id (str): The ID of the video
+            file_path (Path): The path of the downloaded file
+            album_dir (Path): The album directory the video was downloaded
+                into, which is the file's directory if not given
+        '''
+        file_path = Path(file_path).resolve()
+        album_dir = file_path.parent if album_dir is None else Path(album_dir).resolve()
+        with self.database.transaction() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO downloads (extractor, video_id, path, album) '
+                'VALUES (?, ?, ?, ?)',
+                (extractor.lower(), video_id, str(file_path), str(album_dir))
+            )
+
+    def relocate(self, old_path, new_path):
+        ''' Update the path of a file that was moved
+
+        Args:
+            old_path: The path the file was moved from
+            new_path: The path the file was moved to
+        '''
+        with self.database.transaction() as connection:
+            connection.execute(
+                'UPDATE downloads SET path = ? WHERE path = ?',
+                (str(Path(new_path).resolve()), str(Path(old_path).resolve()))
+            )
+
+    def close(self):
+        self.database.close()
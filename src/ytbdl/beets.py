@@ -1,16 +1,26 @@
 #pylint: disable=consider-using-f-string
 from argparse import Namespace as ArgparseNamespace
 from pathlib import Path
-from tempfile import TemporaryDirectory
 import os
 
 from beets import config as beetsconfig
+from beets import importer
+from beets import plugins as beetsplugins
+from beets.autotag import Recommendation
+from beets.plugins import BeetsPlugin
 from beets.ui import _setup as setup_beets
 from beets.ui.commands import import_files
+from beets.util import displayable_path
+import confuse
 
 from ytbdl import beetsplug
-from ytbdl import config, config_exists, get_main_config_path
+from ytbdl import config_exists, get_main_config_path
+from ytbdl.archive import archive_enabled, open_archive
 from ytbdl.exceptions import ConfigurationError
+from ytbdl.metrics import get_metrics
+from ytbdl.musicbrainz import install_musicbrainz_cache
+from ytbdl.postprocess import install_parallel_embedding, uninstall_parallel_embedding
+from ytbdl.review import open_review_queue
 
 
 # Keys and their required content in the config file
@@ -25,84 +35,303 @@ REQUIRED_PLUGINS = (
     'fromyoutubetitle',
 )
 
+# The parsed beets config in ytbdl's config file, and the path and modification
+# time of the file it was parsed from
+_CONFIG_TEMPLATE = None
 
-def beet_import(album_dir: Path, logger):
+# The album directories beets has imported in this process, whether or not
+# their files were moved out of them
+_IMPORTED_DIRS = set()
+
+
+class YtbdlPlugin(BeetsPlugin):
+    ''' A plugin that is always loaded when ytbdl runs beets, to keep ytbdl's
+    own records up to date while beets imports music. It is not loaded by
+    name, so it does not need to be listed in the config file.
+    '''
+    def __init__(self):
+        super().__init__('ytbdl')
+        self.register_listener('import_task_files', self.record_import)
+        if archive_enabled():
+            self.register_listener('item_moved', self.update_archive)
+            self.register_listener('item_copied', self.update_archive)
+
+    @staticmethod
+    def update_archive(item, source, destination):
+        open_archive().relocate(os.fsdecode(source), os.fsdecode(destination))
+
+    @staticmethod
+    def record_import(session, task):
+        _IMPORTED_DIRS.update(Path(displayable_path(path)).resolve() for path in task.paths)
+
+
+class HeadlessImportSession(importer.ImportSession):
+    ''' An import session that never asks the user for input. Albums and items
+    that beets matches with a strong recommendation are imported with that
+    match. Everything else is skipped, which leaves the files where they are,
+    and is added to the review queue so that it can be imported interactively
+    later with :code:`ytbdl review`.
+
+    Args:
+        lib (Library): The beets library to import into
+        paths (list): The (bytes) paths to import
+        review_queue (ReviewQueue): The queue to add skipped albums to
+        logger: A logging object
+    '''
+
+    def __init__(self, lib, paths, review_queue, logger):
+        super().__init__(lib, None, paths, None)
+        self.review_queue = review_queue
+        self.ytbdl_logger = logger
+
+    def choose_match(self, task):
+        if task.rec == Recommendation.strong:
+            return task.candidates[0]
+        self.quarantine(task, 'No strong match found (recommendation: {0})'.format(
+            task.rec.name
+        ))
+        return importer.action.SKIP
+
+    def choose_item(self, task):
+        return self.choose_match(task)
+
+    def resolve_duplicate(self, task, found_duplicates):
+        self.quarantine(task, 'Already in the library ({0} duplicate(s))'.format(
+            len(found_duplicates)
+        ))
+        task.set_choice(importer.action.SKIP)
+
+    def should_resume(self, path):
+        return True
+
+    def quarantine(self, task, reason: str):
+        ''' Add the task's album to the review queue
+
+        Args:
+            task (ImportTask): The task that could not be imported
+            reason (str): Why the task could not be imported
+        '''
+        album_dir = displayable_path(task.paths[0]) if task.paths else \
+            displayable_path(task.toppath)
+        self.ytbdl_logger.warning(msg='Queued {0} for review: {1}'.format(
+            album_dir, reason
+        ))
+        self.review_queue.add(
+            album_dir,
+            reason,
+            artist=getattr(task, 'cur_artist', None),
+            album=getattr(task, 'cur_album', None),
+            candidates=[describe_match(match) for match in task.candidates],
+        )
+
+
+def describe_match(match) -> dict:
+    ''' Describe an AlbumMatch or a TrackMatch, so that it can be shown to the
+    user later
+
+    Args:
+        match: An AlbumMatch or a TrackMatch
+
+    Returns:
+        (dict): A JSON serializable description of the match
+    '''
+    info = match.info
+    description = {
+        'distance': float(match.distance),
+        'artist': info.artist,
+        'data_source': info.data_source,
+    }
+    if hasattr(info, 'tracks'):
+        description.update({
+            'album': info.album,
+            'album_id': info.album_id,
+            'year': info.year,
+            'tracks': len(info.tracks),
+            'extra_items': len(match.extra_items),
+            'extra_tracks': len(match.extra_tracks),
+        })
+    else:
+        description.update({
+            'title': info.title,
+            'track_id': info.track_id,
+        })
+    return description
+
+
+class BeetsSession:
     ''' Emulates the behaviour of calling Beets' import function from a shell,
     in an embedded fashion. This bypasses a lot of the overhead required in
     creating a new subprocess as well as for other set up. Since the default
     beets config and library are used, no custom processing is required to set
     those up.
 
+    Beets is set up once, the first time an album is imported. Every album
+    imported afterwards re-uses the same config, plugins, and library, until
+    the session is closed.
+
     Behind the scenes, beets will open a
-    :code:`beets.ui.commands.TerminalImportSession` so that users can enter
-    input via stdin. That function will emit the cli_exit event in case the user
-    has activated any plugins that rely on this event. All of this functionality
-    is emulated here.
+    :code:`beets.ui.commands.TerminalImportSession` for each album so that users
+    can enter input via stdin. When the session is closed, the cli_exit event is
+    emitted once, in case the user has activated any plugins that rely on this
+    event. All of this functionality is emulated here.
+
+    In headless mode, a HeadlessImportSession is used instead, so that the user
+    is never asked for input.
 
     Args:
-        album_dir (Path): A path to an album directory where some music exists
         logger: A logging object
+        headless (bool): Import albums without asking the user for input
     '''
-    import_dir = str(Path(album_dir).parent.parent.resolve()).replace('\\', '/')
-    beetsplug_dir = str(Path(beetsplug.__file__).parent.resolve()).replace('\\', '/')
 
-    config_content = get_custom_config_contents(
-        import_dir=import_dir,
-        beetsplug_dir=beetsplug_dir
-    )
+    def __init__(self, logger, headless: bool = False):
+        self.logger = logger
+        self.headless = headless
+        self.import_dir = None
+        self.plugins = None
+        self.library = None
+
+    def __enter__(self):
+        return self
 
-    with TemporaryDirectory() as temp_dir:
-        temp_file_path = os.path.join(temp_dir, 'config.yaml')
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-        with open(temp_file_path, 'w', encoding='utf-8') as temp_config:
-            temp_config.write(config_content)
+    def open(self, import_dir: Path):
+        ''' Set up beets' config, plugins, and library
 
-        logger.debug(msg=('Created a temporary beets config at: {0}'.format(
-            temp_file_path
-        )))
+        Args:
+            import_dir (Path): The directory that contains the artist folders
+                of the albums being imported
+        '''
+        self.import_dir = Path(import_dir).resolve()
+        beetsplug_dir = str(Path(beetsplug.__file__).parent.resolve()).replace('\\', '/')
+
+        config_content = fill_config_template(
+            get_config_template(),
+            import_dir=str(self.import_dir).replace('\\', '/'),
+            beetsplug_dir=beetsplug_dir
+        )
+
+        # Overlaid on beets' config in memory, where beets would put a config
+        # file passed with --config. Since it's there before beets is set up,
+        # beets also uses it to configure MusicBrainz
+        beetsconfig.set(confuse.ConfigSource(config_content, get_main_config_path()))
+        self.logger.debug(msg='Overlaid the beets config in {0}'.format(
+            get_main_config_path()
+        ))
 
         setup_options = ArgparseNamespace(
             directory=None,
-            config=temp_file_path,
+            config=None,
             plugins=None,
             library=None,
         )
 
-        _, plugins, library = setup_beets(setup_options)
+        # Must be added before beets loads the plugins for the first time
+        beetsplugins._classes.add(YtbdlPlugin)
+        _, self.plugins, self.library = setup_beets(setup_options)
+
+        install_musicbrainz_cache()
+        install_parallel_embedding()
+
+    def import_album(self, album_dir: Path, merge: bool = False) -> bool:
+        ''' Import an album, setting up beets first if this is the first album
+        in the session
+
+        Args:
+            album_dir (Path): A path to an album directory where some music
+                exists
+            merge (bool): Merge the tracks with the album already in the
+                library, if there is one, instead of treating them as a
+                duplicate
 
-        # Start the import
+        Returns:
+            (bool): True if beets imported the album, False if it was skipped
+        '''
+        import_dir = Path(album_dir).parent.parent.resolve()
+        if self.library is not None and import_dir != self.import_dir:
+            # The library directory is fixed when beets is set up
+            self.close()
+        metrics = get_metrics()
+        if self.library is None:
+            with metrics.phase('beets_setup'):
+                self.open(import_dir)
+
+        album_dir = Path(album_dir).resolve()
+        _IMPORTED_DIRS.discard(album_dir)
         paths = [str(album_dir).encode('utf-8')]
-        import_files(library, paths, None)
+        # beets reads the duplicate action from its config while importing.
+        # The source is removed afterwards, since every set adds another one
+        merge_source = None
+        if merge:
+            merge_source = confuse.ConfigSource.of({'import': {'duplicate_action': 'merge'}})
+            beetsconfig.set(merge_source)
+        try:
+            with metrics.phase('import', album=str(album_dir), headless=self.headless):
+                if self.headless:
+                    HeadlessImportSession(self.library, paths, open_review_queue(),
+                                          self.logger).run()
+                    self.plugins.send('import', lib=self.library, paths=paths)
+                else:
+                    import_files(self.library, paths, None)
+        finally:
+            if merge_source is not None:
+                beetsconfig.sources = [
+                    source for source in beetsconfig.sources if source is not merge_source
+                ]
+        return album_dir in _IMPORTED_DIRS
 
-        # Clean up
-        plugins.send('cli_exit', lib=library)
-        library._close()
+    def close(self):
+        ''' Emit the cli_exit event, give beets back its own album art
+        embedding, and close the library. Does nothing if no albums were
+        imported
+        '''
+        if self.library is None:
+            return
+        self.plugins.send('cli_exit', lib=self.library)
+        uninstall_parallel_embedding()
+        self.library._close()
         beetsconfig.clear()
+        # Otherwise beets' default config is not read again by the next session
+        beetsconfig._materialized = False #pylint: disable=protected-access
+        self.plugins = None
+        self.library = None
 
 
-def get_custom_config_contents(**template_args) -> str:
-    ''' Get the content of the custom beets configuration specified in ytbdl's
-    config, and verify that the options with "DO NOT REMOVE" were not removed by
-    the user.
+def get_config_template() -> dict:
+    ''' Get the custom beets configuration specified in ytbdl's config, with
+    its template arguments still unfilled, and verify that the options with "DO
+    NOT REMOVE" were not removed by the user.
 
-    Args:
-        **template_args: Supplied arguments to fill ytbdl's string template
+    The config file is only read and verified again when it is modified, so
+    setting up beets for each album does not re-read it.
 
     Returns:
-        (str): ytbdl's config, with filled template arguments
+        (dict): ytbdl's config, parsed
     '''
+    global _CONFIG_TEMPLATE #pylint: disable=global-statement
     if not config_exists():
         raise ConfigurationError('Could not find a config file')
 
+    config_path = get_main_config_path()
+    modified = os.stat(config_path).st_mtime_ns
+    if _CONFIG_TEMPLATE is not None and _CONFIG_TEMPLATE[0] == (config_path, modified):
+        return _CONFIG_TEMPLATE[1]
+
+    try:
+        template = confuse.load_yaml(config_path) or {}
+    except confuse.ConfigReadError as exc:
+        raise ConfigurationError(str(exc)) from exc
+
     for required_key, required_content in REQUIRED_VARIABLES:
-        if required_key not in config:
+        if required_key not in template:
             raise ConfigurationError(
                 'The "{0}" key is missing from the configuration file. Add it '
                 'back, and set it to: "{1}" (keep the quotes)'.format(
                     required_key, required_content
                 )
             )
-        found_content = config[required_key].as_str()
+        found_content = str(template[required_key])
         if found_content != required_content:
             raise ConfigurationError(
                 'The "{0}" key in the configuration file must be set to '
@@ -111,7 +340,9 @@ def get_custom_config_contents(**template_args) -> str:
                 )
             )
 
-    plugin_list = config['plugins'].get(list)
+    plugin_list = template.get('plugins') or []
+    if isinstance(plugin_list, str):
+        plugin_list = plugin_list.split()
     for required_plugin in REQUIRED_PLUGINS:
         if required_plugin not in plugin_list:
             raise ConfigurationError(
@@ -121,8 +352,26 @@ def get_custom_config_contents(**template_args) -> str:
                 )
             )
 
-    raw_beets_template = ''
-    with open(get_main_config_path(), 'r', encoding='utf-8') as file_pointer:
-        raw_beets_template = file_pointer.read()
+    _CONFIG_TEMPLATE = ((config_path, modified), template)
+    return template
+
 
-    return raw_beets_template.format(**template_args)
+def fill_config_template(value, **template_args):
+    ''' Fill the template arguments in every string of a parsed config
+
+    Args:
+        value: The parsed config, or a value in it
+        **template_args: Supplied arguments to fill ytbdl's string template
+
+    Returns:
+        A copy of the value with its template arguments filled
+    '''
+    if isinstance(value, str):
+        return value.format(**template_args)
+    if isinstance(value, dict):
+        return {
+            key: fill_config_template(item, **template_args) for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [fill_config_template(item, **template_args) for item in value]
+    return value
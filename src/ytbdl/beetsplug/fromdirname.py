@@ -3,30 +3,18 @@ the directories the file is in. Looks above the file for the album, and above
 the album for the artist name.
 """
 
-from pathlib import Path
-
 from beets.plugins import BeetsPlugin
-from beets.util import displayable_path
 
-import tagsfrompath as frompath
+try:
+    from infertags import infer_task_tags
+except ImportError:
+    # Imported from ytbdl rather than loaded by beets
+    from ytbdl.beetsplug.infertags import infer_task_tags
 
 
 class FromDirectoryNamePlugin(BeetsPlugin):
     def __init__(self):
         super(FromDirectoryNamePlugin, self).__init__()
-        self.register_listener('import_task_start', update_album_artist_with_dirnames)
-
-
-def update_album_artist_with_dirnames(task, session):
-    items = task.items if task.is_album else [task.item]
-
-    for item in items:
-        if item.album and item.artist:
-            continue
-
-        file_path = Path(displayable_path(item.path))
-
-        if not item.album:
-            item.album = frompath.get_album_name(file_path)
-        if not item.artist:
-            item.artist = frompath.get_artist_name(file_path)
+        # The album and artist are inferred along with the titles, see
+        # infertags
+        self.register_listener('import_task_start', infer_task_tags)
@@ -1,12 +1,9 @@
 """ fromyoutubetitle Beets Plugin """
 
-from pathlib import Path
+from functools import lru_cache
 import re
 
 from beets.plugins import BeetsPlugin
-from beets.util import displayable_path
-
-import tagsfrompath as frompath
 
 
 class FromYoutubeTitlePlugin(BeetsPlugin):
@@ -16,66 +13,136 @@ class FromYoutubeTitlePlugin(BeetsPlugin):
     Assumes the music is in an Artist/Album/Song folder structure, and that the
     song file names are the names of the YouTube videos they were extracted
     from.
+    Common prefixes and suffixes, like the name of the channel every video in
+    the album was uploaded by, are removed from the titles as well, and the
+    tracks are numbered in the order they were in the playlist. The work is
+    done for the whole import task at once, see infertags.
     """
     def __init__(self):
         super(FromYoutubeTitlePlugin, self).__init__()
-        self.register_listener('import_task_start', set_titles_no_junk)
-
-
-YOUTUBE_TITLE_JUNK = [
-    re.compile(r'(?i)(?P<junk>[\(\[\{].*?(?:Explicit|Clean|Parental\sAdvisory).*?[\)\]\}])'),
-    re.compile(r'(?i)(?P<junk>[\(\[\{].*?(?:HQ|HD|CDQ).*?[\)\]\}])'),
-    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Audio.*?[\)\]\}])'),
-    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Album.*?[\)\]\}])'),
-    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Song.*?[\)\]\}])'),
-    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Video.*?[\)\]\}])'),
-    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Lyric.*?[\)\]\}])'),
-    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Visualizer.*?[\)\]\}])'),
-    re.compile(r'(?i)(?P<junk>[\(\[\{].*?iTunes.*?[\)\]\}])'),
-    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Official.*?[\)\]\}])'),
-    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Original.*?[\)\]\}])'),
-    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Version.*?[\)\]\}])'),
-    re.compile(r'(?i)(?P<junk>[\(\[\{].*?Prod(?:uced|\.)?\sBy.*?[\)\]\}])'),
+        # infertags uses clean_title, so it can't be imported before this
+        # module has finished loading
+        try:
+            from infertags import infer_task_tags
+        except ImportError:
+            from ytbdl.beetsplug.infertags import infer_task_tags
+        self.register_listener('import_task_start', infer_task_tags)
+
+
+# Junk in YouTube titles is a bracketed group containing one of these keywords,
+# i.e., text matching [\(\[\{].*?KEYWORD.*?[\)\]\}]. Each entry is a list of
+# alternative keywords
+YOUTUBE_TITLE_JUNK_KEYWORDS = [
+    ['Explicit', 'Clean', r'Parental\sAdvisory'],
+    ['HQ', 'HD', 'CDQ'],
+    ['Audio'],
+    ['Album'],
+    ['Song'],
+    ['Video'],
+    ['Lyric'],
+    ['Visualizer'],
+    ['iTunes'],
+    ['Official'],
+    ['Original'],
+    ['Version'],
+    [r'Prod(?:uced|\.)?\sBy'],
 ]
 
 
+# Finds any of the keywords. The group that matched tells which entry in
+# YOUTUBE_TITLE_JUNK_KEYWORDS was found. Checking the first letter before trying
+# each keyword makes searching much faster
+YOUTUBE_TITLE_JUNK_SCANNER = re.compile(
+    r'(?i)(?=[' + ''.join(sorted({
+        keyword[0] for keywords in YOUTUBE_TITLE_JUNK_KEYWORDS for keyword in keywords
+    })) + '])(?:' + '|'.join(
+        '({0})'.format('|'.join(keywords)) for keywords in YOUTUBE_TITLE_JUNK_KEYWORDS
+    ) + ')'
+)
+
+
+OPENING_BRACKET = re.compile(r'[\(\[\{]')
+CLOSING_BRACKET = re.compile(r'[\)\]\}]')
+
+
 EXTRA_STRIP_PATTERNS = [
     re.compile(r'^\s*[-_\|]\s*(?P<title>.+)$'),
     re.compile(r'^(?P<title>.+)\s*[-_\|]\s*$')
 ]
 
 
-def set_titles_no_junk(task, session):
-    items = task.items if task.is_album else [task.item]
-
-    for item in items:
-        if item.title:
-            continue
-        item_file_path = Path(displayable_path(item.path))
-        youtube_title = frompath.get_title(item_file_path)
-        album_name = frompath.get_album_name(item_file_path)
-        artist_name = frompath.get_artist_name(item_file_path)
-        artist_album_junk = [
-            '(?i)(?P<junk>\\({0}\\))'.format(re.escape(album_name)),
-            '(?i)(?P<junk>\\(?{0}\\)?)'.format(re.escape(artist_name))
-        ]
-        item.title = remove_junk(youtube_title, artist_album_junk, YOUTUBE_TITLE_JUNK)
-
-
-def remove_junk(title: str, *junk_patterns):
+def clean_title(title: str, artist_name: str, album_name: str):
+    """ Remove the album and artist name from a title, then remove the
+    bracketed junk.
+    """
     new_title = title
-
-    for pattern_list in junk_patterns:
-        for pattern in pattern_list:
-            match_obj = None
-            if isinstance(pattern, re.Pattern):
-                match_obj = pattern.search(new_title)
-            elif isinstance(pattern, str):
-                match_obj = re.search(pattern, title)
-            if match_obj is not None:
-                new_title = new_title.replace(match_obj.group('junk'), '')
-
-    return extra_strip(new_title)
+    for pattern in get_artist_album_junk(artist_name, album_name):
+        match_obj = pattern.search(new_title)
+        if match_obj is not None:
+            new_title = new_title.replace(match_obj.group('junk'), '')
+    return extra_strip(remove_bracketed_junk(new_title))
+
+
+@lru_cache(maxsize=256)
+def get_artist_album_junk(artist_name: str, album_name: str):
+    """ Get the patterns matching the album and artist name in a title. Every
+    track in an album shares the same patterns, so they are only compiled once
+    per album.
+    """
+    return (
+        re.compile('(?i)(?P<junk>\\({0}\\))'.format(re.escape(album_name))),
+        re.compile('(?i)(?P<junk>\\(?{0}\\)?)'.format(re.escape(artist_name))),
+    )
+
+
+def remove_bracketed_junk(title: str):
+    """ Remove the junk matched by the YOUTUBE_TITLE_JUNK_KEYWORDS patterns, as
+    if each pattern was searched for in order and the text it matched was
+    removed, without searching for each pattern separately.
+
+    Each pattern's match starts at the first opening bracket in the title, so
+    the pattern that matches first is the earliest pattern whose keyword is
+    found after that bracket with a closing bracket somewhere after it. Its
+    match ends at the first closing bracket after the keyword. After the match
+    is removed, the next match starts at the new first opening bracket, and
+    only the patterns after the one that matched are left to search for.
+    """
+    new_title = title
+    next_pattern = 0
+    while next_pattern < len(YOUTUBE_TITLE_JUNK_KEYWORDS):
+        opening = OPENING_BRACKET.search(new_title)
+        if opening is None:
+            break
+        last_closing = max(new_title.rfind(bracket) for bracket in ')]}')
+
+        matched_pattern = None
+        keyword_end = None
+        position = opening.end()
+        while True:
+            # Keywords may overlap, so the next search starts right after the
+            # start of the last keyword instead of after its end
+            keyword = YOUTUBE_TITLE_JUNK_SCANNER.search(new_title, position)
+            if keyword is None:
+                break
+            position = keyword.start() + 1
+            pattern = keyword.lastindex - 1
+            if pattern < next_pattern:
+                continue
+            if matched_pattern is not None and pattern >= matched_pattern:
+                continue
+            if keyword.end(keyword.lastindex) <= last_closing:
+                matched_pattern = pattern
+                keyword_end = keyword.end(keyword.lastindex)
+                if matched_pattern == next_pattern:
+                    break
+        if matched_pattern is None:
+            break
+
+        closing = CLOSING_BRACKET.search(new_title, keyword_end)
+        new_title = new_title.replace(new_title[opening.start():closing.end()], '')
+        next_pattern = matched_pattern + 1
+
+    return new_title
 
 
 def extra_strip(string: str):
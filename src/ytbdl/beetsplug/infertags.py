@@ -0,0 +1,184 @@
+""" Infers the album, artist, title, and track number of every item in an import
+task at once. The fromdirname and fromyoutubetitle plugins both run this when
+an import task starts, and whichever runs first does the work for both.
+
+Working on the whole task at once means the tags that come from a directory
+are only worked out once per directory, and the titles can be compared with
+each other, e.g. to find a channel name every video title starts with.
+"""
+
+from pathlib import Path
+import os
+import re
+import weakref
+
+from beets.util import displayable_path
+
+try:
+    import tagsfrompath as frompath
+    from fromyoutubetitle import YOUTUBE_TITLE_JUNK_SCANNER, clean_title
+except ImportError:
+    # Imported from ytbdl rather than loaded by beets
+    from ytbdl.beetsplug import tagsfrompath as frompath
+    from ytbdl.beetsplug.fromyoutubetitle import YOUTUBE_TITLE_JUNK_SCANNER, clean_title
+
+try:
+    from ytbdl.metadata import open_metadata_cache
+except ImportError:
+    open_metadata_cache = None
+
+try:
+    from ytbdl.metrics import timed
+except ImportError:
+    def timed(_name):
+        return lambda listener: listener
+
+
+# A prefix or suffix is only removed if every title in the album has it, and
+# it names the album, the artist, or the uploader, or is junk like "Official
+# Audio". Otherwise it's part of the titles, like the "Love: " in "Love: Part
+# 1", "Love: Part 2" and "Love: Part 3". With fewer titles than this, even a
+# prefix with a name in it is too likely to be part of the titles
+MIN_AFFIX_TITLES = 3
+
+# A prefix shared by every title must end with one of these, and a suffix must
+# start with one, e.g. the " - " in "Channel Name - Song"
+AFFIX_SEPARATOR = re.compile(r'\s+[-–—|/~]+\s+|:\s+')
+
+# The tasks whose tags have been inferred. Both plugins listen for every task,
+# but the tags are only inferred once
+_INFERRED_TASKS = weakref.WeakSet()
+
+# The items numbered from the order of their videos. When a synced album is
+# merged with the album already in the library, beets imports these items
+# again in a new task, along with the library's items
+_NUMBERED_ITEMS = weakref.WeakSet()
+
+
+def infer_task_tags(task, session):
+    """ Infer the tags of an import task's items, unless they already were
+    """
+    if task in _INFERRED_TASKS:
+        return
+    _INFERRED_TASKS.add(task)
+    infer_tags(task)
+
+
+@timed('infertags')
+def infer_tags(task):
+    """ Fill in the tags the items of an import task are missing, from the
+    folders they're in and the titles of the videos they were downloaded from.
+    Tags the items already have are left alone.
+    """
+    items = task.items if task.is_album else [task.item]
+
+    file_paths = [Path(displayable_path(item.path)) for item in items]
+    videos = get_videos(file_paths)
+
+    directory_tags = {}
+    names = set()
+    titles = []
+    for item, file_path in zip(items, file_paths):
+        if file_path.parent not in directory_tags:
+            directory_tags[file_path.parent] = (
+                frompath.get_album_name(file_path),
+                frompath.get_artist_name(file_path),
+            )
+        album_name, artist_name = directory_tags[file_path.parent]
+        names.update((album_name, artist_name))
+        if not item.album:
+            item.album = album_name
+        if not item.artist:
+            item.artist = artist_name
+
+        video = videos.get(file_path) or {}
+        names.add(video.get('uploader'))
+        title = clean_title(video.get('title') or frompath.get_title(file_path),
+                            artist_name, album_name)
+        # A file ytbdl tagged while it downloaded already has this title
+        if not item.title:
+            item.title = title
+        titles.append(title if item.title == title else None)
+
+    # Titles the user or the uploader chose are never changed
+    if None not in titles:
+        for item, title in zip(items, remove_common_affixes(titles, names)):
+            item.title = title
+
+    if task.is_album:
+        set_track_numbers(items, [videos.get(file_path) for file_path in file_paths])
+
+
+def get_videos(file_paths: list) -> dict:
+    """ Get the metadata ytbdl cached about the video each file was downloaded
+    from, by file path. Files that aren't cached are left out.
+    """
+    if open_metadata_cache is None:
+        return {}
+    return open_metadata_cache().get_files(file_paths)
+
+
+def remove_common_affixes(titles: list, names: set) -> list:
+    """ Remove the prefix and suffix that every title has, e.g. the name of the
+    channel the videos were uploaded by, as long as they're separated from the
+    rest of the title, contain one of the names or junk, and no title is left
+    empty.
+    """
+    if len(titles) < MIN_AFFIX_TITLES:
+        return titles
+
+    prefix_length = 0
+    for separator in AFFIX_SEPARATOR.finditer(os.path.commonprefix(titles)):
+        prefix_length = separator.end()
+    if not is_known_affix(titles[0][:prefix_length], names):
+        prefix_length = 0
+
+    suffix_length = 0
+    suffix = os.path.commonprefix([title[::-1] for title in titles])[::-1]
+    separator = AFFIX_SEPARATOR.search(suffix)
+    if separator is not None:
+        suffix_length = len(suffix) - separator.start()
+    if not is_known_affix(suffix[len(suffix) - suffix_length:], names):
+        suffix_length = 0
+
+    new_titles = [
+        title[prefix_length:len(title) - suffix_length].strip() for title in titles
+    ]
+    if not all(new_titles):
+        return titles
+    return new_titles
+
+
+def is_known_affix(affix: str, names: set) -> bool:
+    """ Determine whether a prefix or suffix every title has contains one of
+    the names, e.g. of the album or the uploader, or YouTube title junk.
+    """
+    folded = affix.casefold()
+    return any(name and name.casefold() in folded for name in names) or \
+        YOUTUBE_TITLE_JUNK_SCANNER.search(affix) is not None
+
+
+def set_track_numbers(items: list, videos: list):
+    """ Number the items in the order their videos were in the playlist they
+    were downloaded from. Items are only numbered if none of them have a
+    track number, and each of them has a different place in the playlist.
+    Items numbered before that are being merged with an album in the library
+    are numbered after its tracks instead.
+    """
+    numbered = [item for item in items if item in _NUMBERED_ITEMS]
+    if numbered:
+        offset = max((item.track or 0 for item in items if item not in _NUMBERED_ITEMS),
+                     default=0)
+        numbered.sort(key=lambda item: item.track)
+        for track, item in enumerate(numbered, start=offset + 1):
+            item.track = track
+        return
+    if any(item.track for item in items):
+        return
+    indexes = [(video or {}).get('playlist_index') for video in videos]
+    if None in indexes or len(set(indexes)) != len(indexes):
+        return
+    ordered = sorted(zip(indexes, range(len(items))))
+    for track, (_, position) in enumerate(ordered, start=1):
+        items[position].track = track
+        _NUMBERED_ITEMS.add(items[position])
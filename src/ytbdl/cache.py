@@ -0,0 +1,174 @@
+#pylint: disable=consider-using-f-string
+import json
+import time
+
+from ytbdl.database import Database
+
+
+# The most keys get_many looks up in one statement
+GET_MANY_CHUNK = 500
+
+
+class DiskCache:
+    ''' A key-value cache stored in a SQLite database. Values are stored as
+    JSON, so they must be JSON serializable.
+
+    Entries expire after a fixed time to live. When the total size of the
+    cached values is over the size limit, the least recently used entries are
+    evicted.
+
+    Args:
+        db_path (str): The path to the SQLite database. It is created if it
+            does not exist
+        table (str): The name of the table to store this cache's entries in.
+            Multiple caches may share one database with different tables
+        ttl (float): The number of seconds an entry stays valid for
+        max_bytes (int): The maximum total size of the cached values
+    '''
+
+    def __init__(self, db_path: str, table: str, ttl: float, max_bytes: int):
+        if not table.isidentifier():
+            raise ValueError('Invalid cache table name "{0}"'.format(table))
+        self.db_path = db_path
+        self.table = table
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.database = Database(db_path)
+        with self.database.transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS {0} ('
+                'key TEXT PRIMARY KEY, '
+                'value TEXT NOT NULL, '
+                'size INTEGER NOT NULL, '
+                'created REAL NOT NULL, '
+                'accessed REAL NOT NULL)'.format(self.table)
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS {0}_accessed ON {0} (accessed)'.format(
+                    self.table
+                )
+            )
+
+    def get(self, key: str, default=None):
+        ''' Get a value from the cache
+
+        Args:
+            key (str): The key the value was stored with
+            default: The value to return if the key is not cached or expired
+
+        Returns:
+            The cached value, or the default
+        '''
+        now = time.time()
+        row = self.database.fetchone(
+            'SELECT value, created FROM {0} WHERE key = ?'.format(self.table),
+            (key,)
+        )
+        if row is None:
+            return default
+        value, created = row
+        with self.database.transaction() as connection:
+            if now - created > self.ttl:
+                connection.execute(
+                    'DELETE FROM {0} WHERE key = ?'.format(self.table), (key,)
+                )
+                return default
+            connection.execute(
+                'UPDATE {0} SET accessed = ? WHERE key = ?'.format(self.table),
+                (now, key)
+            )
+        return json.loads(value)
+
+    def get_many(self, keys: list) -> dict:
+        ''' Get several values from the cache at once, which is much faster
+        than getting them one at a time
+
+        Args:
+            keys (list): The keys the values were stored with
+
+        Returns:
+            (dict): The values that are cached and not expired, by key
+        '''
+        now = time.time()
+        keys = list(dict.fromkeys(keys))
+        rows = []
+        # SQLite limits the number of parameters in a statement
+        for start in range(0, len(keys), GET_MANY_CHUNK):
+            chunk = keys[start:start + GET_MANY_CHUNK]
+            rows.extend(self.database.fetchall(
+                'SELECT key, value, created FROM {0} WHERE key IN ({1})'.format(
+                    self.table, ', '.join('?' * len(chunk))
+                ), chunk
+            ))
+        values, expired = {}, []
+        for key, value, created in rows:
+            if now - created > self.ttl:
+                expired.append((key,))
+            else:
+                values[key] = json.loads(value)
+        with self.database.transaction() as connection:
+            connection.executemany(
+                'DELETE FROM {0} WHERE key = ?'.format(self.table), expired
+            )
+            connection.executemany(
+                'UPDATE {0} SET accessed = ? WHERE key = ?'.format(self.table),
+                [(now, key) for key in values]
+            )
+        return values
+
+    def set(self, key: str, value):
+        ''' Store a value in the cache, evicting old entries if the cache is
+        over its size limit
+
+        Args:
+            key (str): The key to store the value with
+            value: A JSON serializable value
+        '''
+        now = time.time()
+        encoded = json.dumps(value)
+        with self.database.transaction() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO {0} (key, value, size, created, accessed) '
+                'VALUES (?, ?, ?, ?, ?)'.format(self.table),
+                (key, encoded, len(encoded), now, now)
+            )
+        self.evict()
+
+    def delete(self, key: str):
+        ''' Remove a value from the cache, if it exists
+
+        Args:
+            key (str): The key the value was stored with
+        '''
+        with self.database.transaction() as connection:
+            connection.execute(
+                'DELETE FROM {0} WHERE key = ?'.format(self.table), (key,)
+            )
+
+    def evict(self):
+        ''' Remove expired entries, then remove the least recently used entries
+        until the cache is within its size limit
+        '''
+        with self.database.transaction() as connection:
+            connection.execute(
+                'DELETE FROM {0} WHERE created < ?'.format(self.table),
+                (time.time() - self.ttl,)
+            )
+            total_size = connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM {0}'.format(self.table)
+            ).fetchone()[0]
+            if total_size <= self.max_bytes:
+                return
+            evicted = []
+            for key, size in connection.execute(
+                    'SELECT key, size FROM {0} ORDER BY accessed'.format(self.table)):
+                if total_size <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                total_size -= size
+            connection.executemany(
+                'DELETE FROM {0} WHERE key = ?'.format(self.table), evicted
+            )
+
+    def close(self):
+        self.database.close()
@@ -0,0 +1,46 @@
+from contextlib import contextmanager
+import sqlite3
+import threading
+
+
+class Database:
+    ''' A connection to a SQLite database that can be shared between threads.
+    beets imports albums in a pipeline of threads, and plugins may use ytbdl's
+    databases from any of them.
+
+    Args:
+        db_path (str): The path to the SQLite database. It is created if it
+            does not exist
+    '''
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # Several processes may use the same database at once, so wait for
+        # locks to be released instead of failing immediately
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.lock = threading.RLock()
+
+    @contextmanager
+    def transaction(self):
+        ''' Run statements in a transaction, which is committed if no exception
+        is raised. No other thread may use the database until it's done
+
+        Yields:
+            (sqlite3.Connection): The connection to execute statements with
+        '''
+        with self.lock, self.connection:
+            yield self.connection
+
+    def fetchone(self, sql: str, parameters=()):
+        ''' Run a query and get the first row it returns, or None '''
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchone()
+
+    def fetchall(self, sql: str, parameters=()) -> list:
+        ''' Run a query and get every row it returns '''
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
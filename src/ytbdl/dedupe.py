@@ -0,0 +1,257 @@
+#pylint: disable=consider-using-f-string
+from pathlib import Path
+import json
+import re
+import shutil
+import subprocess
+
+import confuse
+
+from ytbdl import config
+from ytbdl.beetsplug import tagsfrompath as frompath
+from ytbdl.exceptions import ConfigurationError
+
+
+# The dedupe options used when they're not in the config
+DEFAULT_DEDUPE_OPTIONS = {
+    'duration_tolerance': 3.0,
+    'fingerprint': False,
+    'fingerprint_threshold': 0.85,
+}
+
+# Only the start of each file is fingerprinted, in seconds
+FINGERPRINT_LENGTH = 120
+
+# Characters that don't make two titles different
+TITLE_NOISE = re.compile(r'[\W_]+')
+
+
+def get_dedupe_options() -> dict:
+    ''' Get the dedupe options from the config. Duplicates are only skipped
+    if the dedupe option is set to "yes", or to the options to skip them with,
+    since videos with the same title and duration can still be different
+    versions of a song
+
+    Returns:
+        (dict): The options, or None if duplicates are not skipped
+    '''
+    options = dict(DEFAULT_DEDUPE_OPTIONS)
+    if 'dedupe' not in config:
+        return None
+    try:
+        value = config['dedupe'].get()
+        if value is None or value is False:
+            return None
+        if value is True:
+            return options
+        for key in ('duration_tolerance', 'fingerprint_threshold'):
+            if key in config['dedupe']:
+                options[key] = config['dedupe'][key].as_number()
+        if 'fingerprint' in config['dedupe']:
+            options['fingerprint'] = config['dedupe']['fingerprint'].get(bool)
+    except confuse.ConfigError as exc:
+        raise ConfigurationError(
+            'The dedupe config option is invalid: {0}'.format(str(exc))
+        ) from exc
+    return options
+
+
+def title_key(title: str, artist_name: str, album_name: str) -> str:
+    ''' Get what's left of a video title once the junk fromyoutubetitle removes
+    is gone, ignoring case and punctuation, so that uploads of the same song
+    have the same key
+
+    Args:
+        title (str): The title of the video
+        artist_name (str): The name of the album's artist
+        album_name (str): The name of the album
+
+    Returns:
+        (str): The key, which is empty if nothing is left of the title
+    '''
+    # The plugin imports beets, which is only needed once there's a title
+    #pylint: disable=import-outside-toplevel
+    from ytbdl.beetsplug.fromyoutubetitle import clean_title
+
+    cleaned = clean_title(title, artist_name, album_name)
+    return TITLE_NOISE.sub(' ', cleaned).strip().casefold()
+
+
+class Deduplicator:
+    ''' Finds the entries of the playlists downloaded into an album that are
+    the same song as an entry before them, e.g. the "Lyric Video" and
+    "Visualizer" uploads of a song already in the album as "Official Audio".
+    Entries are the same song if their titles are the same once the junk is
+    removed, and their durations are within a few seconds of each other.
+    Entries without a duration are never considered the same.
+
+    Args:
+        album_dir (Path): The album folder, in an Artist folder
+        duration_tolerance (float): The most the durations of the same song
+            may differ by, in seconds
+    '''
+
+    def __init__(self, album_dir: Path, duration_tolerance: float):
+        # The names are taken from a path inside the album folder, the same way
+        # the plugins take them from the album's files
+        track_path = Path(album_dir) / 'track'
+        self.artist_name = frompath.get_artist_name(track_path)
+        self.album_name = frompath.get_album_name(track_path)
+        self.duration_tolerance = duration_tolerance
+        self.kept = {}
+
+    def filter(self, entries: list) -> tuple:
+        ''' Split playlist entries into those to download, and those that are
+        the same song as an entry kept before them, in this playlist or an
+        earlier one
+
+        Args:
+            entries (list): The entry dicts of a playlist
+
+        Returns:
+            (tuple): The list of entries to download, and a list of
+                (duplicate, original) entry tuples
+        '''
+        kept, duplicates = [], []
+        for entry in entries:
+            original = self.find_original(entry)
+            if original is None:
+                kept.append(entry)
+            else:
+                duplicates.append((entry, original))
+        return kept, duplicates
+
+    def find_original(self, entry: dict) -> dict:
+        ''' Find the entry kept before an entry that is the same song, keeping
+        the entry if there isn't one
+
+        Args:
+            entry (dict): A playlist entry
+
+        Returns:
+            (dict): The original entry, or None if the entry was kept
+        '''
+        title = entry.get('title') if isinstance(entry, dict) else None
+        if not title:
+            return None
+        key = title_key(title, self.artist_name, self.album_name)
+        if not key:
+            return None
+        duration = entry.get('duration')
+        for original in self.kept.get(key, []):
+            if duration is not None and original.get('duration') is not None and \
+                    abs(duration - original['duration']) <= self.duration_tolerance:
+                return original
+        self.kept.setdefault(key, []).append(entry)
+        return None
+
+
+def fingerprint(file_path: Path) -> list:
+    ''' Get the raw Chromaprint fingerprint of the start of an audio file with
+    fpcalc
+
+    Args:
+        file_path (Path): The audio file
+
+    Returns:
+        (list): The fingerprint as a list of 32-bit integers, or None if
+            fpcalc could not fingerprint the file
+    '''
+    try:
+        result = subprocess.run(
+            ['fpcalc', '-raw', '-json', '-length', str(FINGERPRINT_LENGTH), str(file_path)],
+            capture_output=True, check=True, timeout=60,
+        )
+        return json.loads(result.stdout)['fingerprint']
+    except (OSError, subprocess.SubprocessError, ValueError, KeyError):
+        return None
+
+
+def similarity(first: list, second: list) -> float:
+    ''' Compare two raw fingerprints by the fraction of their bits that are
+    the same, over the length of the shorter one
+
+    Args:
+        first (list): A fingerprint
+        second (list): Another fingerprint
+
+    Returns:
+        (float): A number between 0 and 1, which is close to 1 if the files
+            have the same audio, and around 0.5 if they don't
+    '''
+    length = min(len(first), len(second))
+    if length == 0:
+        return 0.0
+    different_bits = sum(bin((a ^ b) & 0xFFFFFFFF).count('1')
+                         for a, b in zip(first, second))
+    return 1 - different_bits / (32 * length)
+
+
+def remove_duplicate_files(album_dir: Path, files: list, logger, state=None) -> list:
+    ''' Delete the downloaded files that have the same audio as a file
+    downloaded before them, if fingerprinting is turned on in the dedupe
+    options. Only files whose titles are the same once the junk is removed are
+    fingerprinted, so this catches the duplicates that could not be found by
+    duration before they were downloaded.
+
+    Fingerprints are made with Chromaprint's fpcalc, which must be installed
+    separately.
+
+    Args:
+        album_dir (Path): The album folder
+        files (list): The Paths of the files downloaded, in order
+        logger: A logging object
+        state (AlbumState): The optional state of the album's download, which
+            the deleted files are removed from
+
+    Returns:
+        (list): The Paths of the files that are left
+    '''
+    #pylint: disable=import-outside-toplevel
+    from ytbdl.metadata import open_metadata_cache
+    from ytbdl.metrics import get_metrics
+
+    options = get_dedupe_options()
+    if options is None or not options['fingerprint'] or len(files) < 2:
+        return list(files)
+    if shutil.which('fpcalc') is None:
+        logger.warning('fpcalc was not found, so downloaded files are not checked '
+                       'for duplicates. Install Chromaprint to check them')
+        return list(files)
+
+    track_path = Path(album_dir) / 'track'
+    artist_name = frompath.get_artist_name(track_path)
+    album_name = frompath.get_album_name(track_path)
+    metadata_cache = open_metadata_cache()
+    groups = {}
+    for file_path in files:
+        title = metadata_cache.get_title(file_path) or frompath.get_title(Path(file_path))
+        groups.setdefault(title_key(title, artist_name, album_name), []).append(file_path)
+
+    removed = set()
+    metrics = get_metrics()
+    for key, group in groups.items():
+        if not key or len(group) < 2:
+            continue
+        with metrics.phase('fingerprint', files=len(group)):
+            fingerprints = [fingerprint(file_path) for file_path in group]
+        originals = []
+        for file_path, file_fingerprint in zip(group, fingerprints):
+            original = next((
+                original for original, original_fingerprint in originals
+                if file_fingerprint and original_fingerprint and
+                similarity(file_fingerprint, original_fingerprint) >=
+                options['fingerprint_threshold']
+            ), None)
+            if original is None:
+                originals.append((file_path, file_fingerprint))
+                continue
+            logger.info(msg='Deleting {0}, which has the same audio as {1}'.format(
+                str(file_path), str(original)
+            ))
+            Path(file_path).unlink()
+            if state is not None:
+                state.forget(file_path)
+            metrics.increment('duplicates_deleted')
+            removed.add(file_path)
+    return [file_path for file_path in files if file_path not in removed]
@@ -1,2 +1,14 @@
 class ConfigurationError(Exception):
     pass
+
+class ManifestError(Exception):
+    pass
+
+class DownloadError(Exception):
+    pass
+
+class ServerError(Exception):
+    pass
+
+class JobCancelled(Exception):
+    pass
@@ -0,0 +1,274 @@
+#pylint: disable=consider-using-f-string
+from typing import NamedTuple
+import os
+import time
+
+from ytbdl import config
+from ytbdl.database import Database
+
+
+# Extractor arguments that stop an extractor from fetching the manifests of
+# formats it can also get without them, by extractor key. They're only used
+# once the formats chosen for an uploader keep coming from outside manifests
+MANIFEST_SKIP_ARGS = {
+    'Youtube': {'youtube': {'skip': ['hls', 'dash']}},
+}
+
+# Formats downloaded with these protocols come from a manifest
+MANIFEST_PROTOCOLS = (
+    'm3u8', 'm3u8_native', 'http_dash_segments', 'http_dash_segments_generator',
+    'f4m', 'ism',
+)
+
+# The fast path is only taken once the same format was downloaded this many
+# times in a row. A failure starts the count again
+MIN_SUCCESSES = 3
+
+# How much each full extraction counts towards the average extraction time
+EXTRACT_SECONDS_WEIGHT = 0.2
+
+# Preferences recorded for every uploader of an extractor use this uploader
+ANY_UPLOADER = ''
+
+# One format cache is opened per process
+_FORMAT_CACHE = None
+
+
+class FormatPreference(NamedTuple):
+    ''' The format an extractor's format selector chose for an uploader's
+    videos, and how downloading it went
+    '''
+    extractor: str
+    uploader: str
+    selector: str
+    format_id: str
+    protocol: str
+    ext: str
+    abr: float
+    filesize: int
+    successes: int
+    failures: int
+    extract_seconds: float
+    updated: float
+
+
+def get_format_cache_path() -> str:
+    ''' Get the path to the format cache database. This path may or may not
+    exist
+
+    Returns:
+        (str): A path to the format cache database in the config directory
+    '''
+    return os.path.join(config.config_dir(), 'formats.db')
+
+
+def format_cache_enabled() -> bool:
+    ''' Determine whether the format cache is turned on in the config. The
+    cache is on unless the format_cache option is set to "no"
+
+    Returns:
+        (bool): True if the cache should be used, False otherwise
+    '''
+    if 'format_cache' not in config:
+        return True
+    return config['format_cache'].get(bool)
+
+
+def open_format_cache() -> 'FormatCache':
+    ''' Open the format cache, or get it if it was already opened in this
+    process
+
+    Returns:
+        (FormatCache): The format cache, or None if it's turned off
+    '''
+    global _FORMAT_CACHE #pylint: disable=global-statement
+    if _FORMAT_CACHE is None and format_cache_enabled():
+        _FORMAT_CACHE = FormatCache(get_format_cache_path())
+    return _FORMAT_CACHE
+
+
+def close_format_cache():
+    ''' Close the format cache if it was opened
+    '''
+    global _FORMAT_CACHE #pylint: disable=global-statement
+    if _FORMAT_CACHE is not None:
+        _FORMAT_CACHE.close()
+        _FORMAT_CACHE = None
+
+
+def uploader_key(info: dict) -> str:
+    ''' Get the key of the uploader of a video, from its info dict or its
+    playlist entry
+
+    Args:
+        info (dict): The info dict or flat playlist entry of the video
+
+    Returns:
+        (str): The uploader's key, which is empty if it's not known
+    '''
+    return str(info.get('channel_id') or info.get('uploader_id') or
+               info.get('uploader') or ANY_UPLOADER)
+
+
+def merge_extractor_args(extractor_args: dict, extra_args: dict) -> dict:
+    ''' Add extractor arguments to those the user passed with
+    --extractor-args
+
+    Args:
+        extractor_args (dict): The extractor_args YoutubeDL param, if any
+        extra_args (dict): The arguments to add, in the same form
+
+    Returns:
+        (dict): A new extractor_args param with both sets of arguments
+    '''
+    merged = {ie: dict(args) for ie, args in (extractor_args or {}).items()}
+    for ie, args in extra_args.items():
+        for key, values in args.items():
+            existing = list(merged.setdefault(ie, {}).get(key) or [])
+            merged[ie][key] = existing + [value for value in values if value not in existing]
+    return merged
+
+
+class FormatCache:
+    ''' Learns which format each extractor's videos end up downloaded in, per
+    uploader and format selector (e.g. -f bestaudio[ext=m4a]), and how long
+    extracting their formats takes.
+
+    Once the same format keeps being chosen for an uploader's videos, and it
+    doesn't come from a manifest, later videos can be extracted without
+    fetching the manifests, for the extractors in MANIFEST_SKIP_ARGS. The
+    format selector still chooses from the formats that are left, and if it
+    doesn't choose the cached format, or the download fails, the video is
+    extracted again in full.
+
+    Args:
+        db_path (str): The path to the SQLite database. It is created if it
+            does not exist
+    '''
+
+    COLUMNS = ('extractor, uploader, selector, format_id, protocol, ext, abr, filesize, '
+               'successes, failures, extract_seconds, updated')
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.database = Database(db_path)
+        with self.database.transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS preferences ('
+                'extractor TEXT NOT NULL, '
+                'uploader TEXT NOT NULL, '
+                'selector TEXT NOT NULL, '
+                'format_id TEXT NOT NULL, '
+                'protocol TEXT, '
+                'ext TEXT, '
+                'abr REAL, '
+                'filesize INTEGER, '
+                'successes INTEGER NOT NULL, '
+                'failures INTEGER NOT NULL, '
+                'extract_seconds REAL, '
+                'updated REAL NOT NULL, '
+                'PRIMARY KEY (extractor, uploader, selector))'
+            )
+
+    def get(self, extractor: str, uploader: str, selector: str) -> FormatPreference:
+        ''' Get the format preference for an uploader's videos, or for every
+        uploader of the extractor if there isn't one for the uploader
+
+        Args:
+            extractor (str): The key of the yt-dlp extractor
+            uploader (str): The uploader's key, see uploader_key
+            selector (str): The format selector, i.e. the format YoutubeDL param
+
+        Returns:
+            (FormatPreference): The preference, or None if there isn't one
+        '''
+        rows = self.database.fetchall(
+            'SELECT {0} FROM preferences WHERE extractor = ? AND selector = ? AND '
+            'uploader IN (?, ?)'.format(self.COLUMNS),
+            (extractor, selector, uploader, ANY_UPLOADER)
+        )
+        preferences = {row[1]: FormatPreference(*row) for row in rows}
+        return preferences.get(uploader) or preferences.get(ANY_UPLOADER)
+
+    def manifest_skip_args(self, preference: FormatPreference) -> dict:
+        ''' Get the extractor arguments that skip fetching manifests, if a
+        preference is trusted enough to take the fast path
+
+        Args:
+            preference (FormatPreference): The preference for the video's
+                uploader, if there is one
+
+        Returns:
+            (dict): Extractor arguments, or None if the manifests are needed
+        '''
+        if preference is None or preference.extractor not in MANIFEST_SKIP_ARGS:
+            return None
+        if preference.successes < MIN_SUCCESSES or \
+                any(protocol in MANIFEST_PROTOCOLS
+                    for protocol in (preference.protocol or '').split('+')):
+            return None
+        return MANIFEST_SKIP_ARGS[preference.extractor]
+
+    def record_success(self, selector: str, info_dict: dict, extract_seconds: float = None):
+        ''' Record that a video was downloaded in the format that was chosen
+        for it, for its uploader and for every uploader of its extractor
+
+        Args:
+            selector (str): The format selector
+            info_dict (dict): The yt-dlp info dict of the video, with the
+                format chosen
+            extract_seconds (float): How long extracting the video took, if
+                its manifests were fetched
+        '''
+        extractor = info_dict.get('extractor_key')
+        format_id = info_dict.get('format_id')
+        if not extractor or not format_id:
+            return
+        now = time.time()
+        values = (
+            info_dict.get('protocol'), info_dict.get('ext'), info_dict.get('abr'),
+            info_dict.get('filesize') or info_dict.get('filesize_approx'),
+        )
+        with self.database.transaction() as connection:
+            for uploader in {uploader_key(info_dict), ANY_UPLOADER}:
+                row = connection.execute(
+                    'SELECT format_id, successes, extract_seconds, failures FROM preferences '
+                    'WHERE extractor = ? AND uploader = ? AND selector = ?',
+                    (extractor, uploader, selector)
+                ).fetchone()
+                successes, average, failures = 1, extract_seconds, 0
+                if row is not None:
+                    failures = row[3]
+                    successes = row[1] + 1 if row[0] == format_id else 1
+                    if row[2] is not None:
+                        average = row[2] if extract_seconds is None else \
+                            row[2] + (extract_seconds - row[2]) * EXTRACT_SECONDS_WEIGHT
+                connection.execute(
+                    'INSERT OR REPLACE INTO preferences ({0}) VALUES '
+                    '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'.format(self.COLUMNS),
+                    (extractor, uploader, selector, format_id, *values, successes,
+                     failures, average, now)
+                )
+
+    def record_failure(self, selector: str, info_dict: dict):
+        ''' Record that downloading a video in the format chosen for it failed,
+        so that the fast path isn't taken for its uploader until the format
+        is downloaded again
+
+        Args:
+            selector (str): The format selector
+            info_dict (dict): The yt-dlp info dict of the video, with the
+                format chosen
+        '''
+        extractor = info_dict.get('extractor_key')
+        if not extractor:
+            return
+        with self.database.transaction() as connection:
+            connection.execute(
+                'UPDATE preferences SET successes = 0, failures = failures + 1, '
+                'updated = ? WHERE extractor = ? AND selector = ? AND uploader IN (?, ?)',
+                (time.time(), extractor, selector, uploader_key(info_dict), ANY_UPLOADER)
+            )
+
+    def close(self):
+        self.database.close()
@@ -0,0 +1,225 @@
+#pylint: disable=consider-using-f-string
+from typing import NamedTuple
+import json
+import os
+import time
+
+from ytbdl import config
+from ytbdl.database import Database
+
+
+# The statuses a job goes through. Jobs that are running when the server
+# stops are queued again the next time it starts
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+# One job queue is opened per process
+_JOB_QUEUE = None
+
+
+class Job(NamedTuple):
+    ''' An album queued to be downloaded and tagged by ytbdl serve
+    '''
+    id: int
+    artist: str
+    album: str
+    urls: list
+    ytdl_args: list
+    directory: str
+    status: str
+    error: str
+    added: float
+    started: float
+    finished: float
+
+
+def get_job_queue_path() -> str:
+    ''' Get the path to the job queue database. This path may or may not
+    exist
+
+    Returns:
+        (str): A path to the job queue database in the config directory
+    '''
+    return os.path.join(config.config_dir(), 'jobs.db')
+
+
+def open_job_queue() -> 'JobQueue':
+    ''' Open the job queue, or get it if it was already opened in this process
+
+    Returns:
+        (JobQueue): The job queue
+    '''
+    global _JOB_QUEUE #pylint: disable=global-statement
+    if _JOB_QUEUE is None:
+        _JOB_QUEUE = JobQueue(get_job_queue_path())
+    return _JOB_QUEUE
+
+
+class JobQueue:
+    ''' A persistent queue of albums for ytbdl serve to download and tag, in
+    the order they were added. Finished jobs are kept so that their status can
+    be looked up.
+
+    Args:
+        db_path (str): The path to the SQLite database. It is created if it
+            does not exist
+    '''
+
+    COLUMNS = 'id, artist, album, urls, ytdl_args, directory, status, error, ' \
+        'added, started, finished'
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.database = Database(db_path)
+        with self.database.transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'artist TEXT NOT NULL, '
+                'album TEXT NOT NULL, '
+                'urls TEXT NOT NULL, '
+                'ytdl_args TEXT NOT NULL, '
+                'directory TEXT NOT NULL, '
+                'status TEXT NOT NULL, '
+                'error TEXT, '
+                'added REAL NOT NULL, '
+                'started REAL, '
+                'finished REAL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)'
+            )
+
+    @staticmethod
+    def _job(row) -> Job:
+        job_id, artist, album, urls, ytdl_args, directory, status, error, \
+            added, started, finished = row
+        return Job(job_id, artist, album, json.loads(urls), json.loads(ytdl_args),
+                   directory, status, error, added, started, finished)
+
+    def add(self, artist: str, album: str, urls: list, ytdl_args: list,
+            directory: str) -> Job:
+        ''' Add an album to the end of the queue
+
+        Args:
+            artist (str): The name of the artist
+            album (str): The name of the album
+            urls (list): One or more URLs to download audio from
+            ytdl_args (list): Extra arguments to pass to yt-dlp, which are
+                combined with the ytdl_args config option
+            directory (str): The directory to create the album folder in
+
+        Returns:
+            (Job): The job that was added
+        '''
+        with self.database.transaction() as connection:
+            cursor = connection.execute(
+                'INSERT INTO jobs (artist, album, urls, ytdl_args, directory, '
+                'status, added) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (artist, album, json.dumps(list(urls)), json.dumps(list(ytdl_args)),
+                 str(directory), QUEUED, time.time())
+            )
+            job_id = cursor.lastrowid
+        return self.get(job_id)
+
+    def get(self, job_id: int) -> Job:
+        ''' Get a job
+
+        Args:
+            job_id (int): The ID of the job
+
+        Returns:
+            (Job): The job, or None if there is no job with the ID
+        '''
+        row = self.database.fetchone(
+            'SELECT {0} FROM jobs WHERE id = ?'.format(self.COLUMNS), (job_id,)
+        )
+        return None if row is None else self._job(row)
+
+    def jobs(self, status: str = None) -> list:
+        ''' Get every job, or every job with a status, oldest first
+
+        Args:
+            status (str): Only get jobs with this status
+
+        Returns:
+            (list): A list of Job objects
+        '''
+        if status is None:
+            rows = self.database.fetchall(
+                'SELECT {0} FROM jobs ORDER BY id'.format(self.COLUMNS)
+            )
+        else:
+            rows = self.database.fetchall(
+                'SELECT {0} FROM jobs WHERE status = ? ORDER BY id'.format(self.COLUMNS),
+                (status,)
+            )
+        return [self._job(row) for row in rows]
+
+    def start_next(self) -> Job:
+        ''' Mark the oldest queued job as running
+
+        Returns:
+            (Job): The job, or None if no job is queued
+        '''
+        with self.database.transaction() as connection:
+            row = connection.execute(
+                'SELECT id FROM jobs WHERE status = ? ORDER BY id LIMIT 1', (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                'UPDATE jobs SET status = ?, started = ?, error = NULL WHERE id = ?',
+                (RUNNING, time.time(), row[0])
+            )
+        return self.get(row[0])
+
+    def finish(self, job_id: int, status: str, error: str = None):
+        ''' Mark a job as done, failed, or cancelled
+
+        Args:
+            job_id (int): The ID of the job
+            status (str): The job's new status
+            error (str): Why the job failed, if it did
+        '''
+        with self.database.transaction() as connection:
+            connection.execute(
+                'UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?',
+                (status, error, time.time(), job_id)
+            )
+
+    def cancel(self, job_id: int) -> Job:
+        ''' Cancel a job if it's queued. Running jobs are cancelled by the
+        server that is running them
+
+        Args:
+            job_id (int): The ID of the job
+
+        Returns:
+            (Job): The job, or None if there is no job with the ID
+        '''
+        with self.database.transaction() as connection:
+            connection.execute(
+                'UPDATE jobs SET status = ?, finished = ? WHERE id = ? AND status = ?',
+                (CANCELLED, time.time(), job_id, QUEUED)
+            )
+        return self.get(job_id)
+
+    def requeue_running(self) -> int:
+        ''' Queue the jobs that were running when the server stopped again
+
+        Returns:
+            (int): The number of jobs queued again
+        '''
+        with self.database.transaction() as connection:
+            cursor = connection.execute(
+                'UPDATE jobs SET status = ?, started = NULL WHERE status = ?',
+                (QUEUED, RUNNING)
+            )
+            return cursor.rowcount
+
+    def close(self):
+        self.database.close()
@@ -0,0 +1,226 @@
+#pylint: disable=consider-using-f-string
+from pathlib import Path
+from typing import NamedTuple
+import json
+
+import yaml
+
+from ytbdl.exceptions import ManifestError
+from ytbdl.split import parse_items, parse_match
+from ytbdl.ytdl_args import ytdl_options, check_ytdl_args
+
+
+class AlbumJob(NamedTuple):
+    ''' A single artist/album to download and tag. Albums split from a
+    playlist have the positions of their entries in the playlist, a regular
+    expression their titles match, or both
+    '''
+    artist: str
+    album: str
+    urls: list
+    ytdl_args: list
+    items: list = None
+    match: str = None
+
+    @property
+    def is_split(self) -> bool:
+        return self.items is not None or self.match is not None
+
+
+def read_manifest(manifest_path: Path) -> list:
+    ''' Read a manifest of album jobs from a YAML or a JSON Lines file.
+
+    A YAML manifest is either a list of jobs, or a mapping with a "jobs" key
+    containing a list of jobs:
+
+    .. code-block:: yaml
+
+        jobs:
+          - artist: Artist
+            album: Album
+            urls:
+              - https://youtube.com/some_playlist
+            ytdl_args: --geo-bypass
+
+    A job can also split a single playlist into several albums, instead of
+    having an album. Each album in the split has the positions of its videos
+    in the playlist as items, a regular expression the titles of its videos
+    match, or both. The playlist is only resolved once for all of them:
+
+    .. code-block:: yaml
+
+        jobs:
+          - artist: Artist
+            urls: https://youtube.com/discography_playlist
+            split:
+              - album: First Album
+                items: 1-10
+              - album: Second Album
+                match: (?i)second album
+
+    A JSON Lines manifest (.jsonl) contains one job object per line. Blank
+    lines and lines starting with # are ignored.
+
+    Args:
+        manifest_path (Path): The path to the manifest file
+
+    Returns:
+        (list): A list of AlbumJob objects, in the order they appear in the
+            manifest
+    '''
+    manifest_path = Path(manifest_path)
+    if not manifest_path.is_file():
+        raise ManifestError('The manifest "{0}" does not exist'.format(
+            str(manifest_path)
+        ))
+
+    if manifest_path.suffix.lower() in ('.jsonl', '.ndjson'):
+        raw_jobs = _read_jsonl(manifest_path)
+    else:
+        raw_jobs = _read_yaml(manifest_path)
+
+    jobs = []
+    for number, raw_job in enumerate(raw_jobs, start=1):
+        location = '{0}, job {1}'.format(manifest_path.name, number)
+        if isinstance(raw_job, dict) and 'split' in raw_job:
+            jobs.extend(parse_split_job(raw_job, location))
+        else:
+            jobs.append(parse_job(raw_job, location))
+    return jobs
+
+
+def parse_job(raw_job, location: str = 'job') -> AlbumJob:
+    ''' Validate and convert a raw job mapping into an AlbumJob
+
+    Args:
+        raw_job: A dict with artist, album, urls, and optionally ytdl_args
+        location (str): A description of where the job came from, used in
+            error messages
+
+    Returns:
+        (AlbumJob): The validated job
+    '''
+    if not isinstance(raw_job, dict):
+        raise ManifestError('{0}: expected a mapping, found {1}'.format(
+            location, type(raw_job).__name__
+        ))
+
+    for key in ('artist', 'album'):
+        if not isinstance(raw_job.get(key), str) or not raw_job[key].strip():
+            raise ManifestError('{0}: "{1}" must be a non-empty string'.format(
+                location, key
+            ))
+
+    urls = raw_job.get('urls')
+    if isinstance(urls, str):
+        urls = [urls]
+    if not urls or not isinstance(urls, list) or \
+        not all(isinstance(url, str) for url in urls):
+        raise ManifestError('{0}: "urls" must be one or more URLs'.format(
+            location
+        ))
+
+    raw_args = raw_job.get('ytdl_args') or []
+    try:
+        if isinstance(raw_args, str):
+            job_args = ytdl_options(raw_args)
+        elif isinstance(raw_args, list):
+            job_args = check_ytdl_args([str(arg) for arg in raw_args])
+        else:
+            raise ValueError('"ytdl_args" must be a string or a list')
+    except ValueError as exc:
+        raise ManifestError('{0}: {1}'.format(location, str(exc))) from exc
+
+    return AlbumJob(
+        artist=raw_job['artist'],
+        album=raw_job['album'],
+        urls=urls,
+        ytdl_args=job_args,
+    )
+
+
+def parse_split_job(raw_job: dict, location: str = 'job') -> list:
+    ''' Validate and convert a raw job mapping that splits a playlist into
+    several albums into an AlbumJob for each album
+
+    Args:
+        raw_job: A dict with artist, urls, split, and optionally ytdl_args.
+            Each album in split has an album, items, match, and optionally its
+            own artist
+        location (str): A description of where the job came from, used in
+            error messages
+
+    Returns:
+        (list): An AlbumJob for each album, in the order of the split
+    '''
+    raw_split = raw_job['split']
+    if not isinstance(raw_split, list) or not raw_split:
+        raise ManifestError('{0}: "split" must be a list of albums'.format(location))
+    if 'album' in raw_job:
+        raise ManifestError('{0}: a job with a "split" has no "album"'.format(location))
+
+    jobs = []
+    for number, raw_album in enumerate(raw_split, start=1):
+        album_location = '{0}, album {1}'.format(location, number)
+        if not isinstance(raw_album, dict):
+            raise ManifestError('{0}: expected a mapping, found {1}'.format(
+                album_location, type(raw_album).__name__
+            ))
+        if 'items' not in raw_album and 'match' not in raw_album:
+            raise ManifestError('{0}: "items" or "match" is needed to choose the '
+                                'videos in the album'.format(album_location))
+        job = parse_job({
+            'artist': raw_album.get('artist', raw_job.get('artist')),
+            'album': raw_album.get('album'),
+            'urls': raw_job.get('urls'),
+            'ytdl_args': raw_job.get('ytdl_args'),
+        }, album_location)
+        if len(job.urls) != 1:
+            raise ManifestError('{0}: only one URL can be split into albums'.format(
+                album_location
+            ))
+        try:
+            items = parse_items(raw_album['items']) if 'items' in raw_album else None
+            match = parse_match(raw_album['match']) if 'match' in raw_album else None
+        except ValueError as exc:
+            raise ManifestError('{0}: {1}'.format(album_location, str(exc))) from exc
+        jobs.append(job._replace(items=items, match=match))
+    return jobs
+
+
+def _read_yaml(manifest_path: Path) -> list:
+    with open(manifest_path, 'r', encoding='utf-8') as file_pointer:
+        try:
+            contents = yaml.safe_load(file_pointer)
+        except yaml.YAMLError as exc:
+            raise ManifestError('Could not parse "{0}": {1}'.format(
+                str(manifest_path), str(exc)
+            )) from exc
+
+    if isinstance(contents, dict):
+        contents = contents.get('jobs')
+    if not isinstance(contents, list):
+        raise ManifestError(
+            'The manifest "{0}" must contain a list of jobs'.format(
+                str(manifest_path)
+            )
+        )
+    return contents
+
+
+def _read_jsonl(manifest_path: Path) -> list:
+    raw_jobs = []
+    with open(manifest_path, 'r', encoding='utf-8') as file_pointer:
+        for line_number, line in enumerate(file_pointer, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                raw_jobs.append(json.loads(line))
+            except json.JSONDecodeError as exc:
+                raise ManifestError(
+                    'Could not parse line {0} of "{1}": {2}'.format(
+                        line_number, str(manifest_path), str(exc)
+                    )
+                ) from exc
+    return raw_jobs
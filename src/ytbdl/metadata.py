@@ -0,0 +1,191 @@
+#pylint: disable=consider-using-f-string
+from pathlib import Path
+import os
+
+from ytbdl import config
+from ytbdl.cache import DiskCache
+
+
+# Playlists change over time, so their entries are only kept for a few hours
+PLAYLIST_TTL = 6 * 60 * 60
+PLAYLIST_MAX_BYTES = 64 * 1024 * 1024
+
+# Downloaded files are kept long enough to be imported, even if the import is
+# put off for a while
+FILE_TTL = 30 * 24 * 60 * 60
+FILE_MAX_BYTES = 16 * 1024 * 1024
+
+# One metadata cache is opened per process
+_METADATA_CACHE = None
+
+
+def get_metadata_cache_path() -> str:
+    ''' Get the path to the metadata cache database. This path may or may not
+    exist
+
+    Returns:
+        (str): A path to the metadata cache database in the config directory
+    '''
+    return os.path.join(config.config_dir(), 'metadata.db')
+
+
+def open_metadata_cache() -> 'MetadataCache':
+    ''' Open the metadata cache, or get it if it was already opened in this
+    process
+
+    Returns:
+        (MetadataCache): The metadata cache
+    '''
+    global _METADATA_CACHE #pylint: disable=global-statement
+    if _METADATA_CACHE is None:
+        _METADATA_CACHE = MetadataCache(get_metadata_cache_path())
+    return _METADATA_CACHE
+
+
+class MetadataCache:
+    ''' Caches the metadata yt-dlp extracts, so that it does not need to be
+    extracted again.
+
+    Playlists are cached by URL, as the flat list of entries yt-dlp finds
+    before extracting each video (i.e., the result of :code:`extract_info` with
+    :code:`process=False`). Only playlists whose entries are all URLs are
+    cached, since the formats of a fully extracted video expire quickly.
+
+    The titles and durations of downloaded files are also cached by file path,
+    so that they can be used while tagging without asking yt-dlp again.
+
+    Args:
+        db_path (str): The path to the SQLite database. It is created if it
+            does not exist
+    '''
+
+    def __init__(self, db_path: str):
+        self.playlists = DiskCache(db_path, 'playlists', PLAYLIST_TTL, PLAYLIST_MAX_BYTES)
+        self.files = DiskCache(db_path, 'files', FILE_TTL, FILE_MAX_BYTES)
+
+    def extract_info(self, ydl, url: str) -> dict:
+        ''' Get the unprocessed info for a URL, from the cache if possible,
+        otherwise by having yt-dlp extract it. The info can be processed with
+        :code:`ydl.process_ie_result`.
+
+        Args:
+            ydl (YoutubeDL): A YoutubeDL object to extract the info with
+            url (str): The URL to get info for
+
+        Returns:
+            (dict): The unprocessed info for the URL, or None if yt-dlp could
+                not extract any
+        '''
+        cached_info = self.playlists.get(url)
+        if cached_info is not None:
+            ydl.to_screen('[ytbdl] {0}: Using cached playlist with {1} entries'.format(
+                url, len(cached_info['entries'])
+            ))
+            return cached_info
+
+        info = ydl.extract_info(url, download=False, process=False)
+        if info is None or info.get('_type') not in ('playlist', 'multi_video'):
+            return info
+
+        entries = info.get('entries') or []
+        if hasattr(entries, 'getslice'):
+            entries = entries.getslice()
+        info['entries'] = list(entries)
+        if all(_is_url_entry(entry) for entry in info['entries']):
+            self.playlists.set(url, ydl.sanitize_info(info))
+        return info
+
+    def forget_playlist(self, url: str):
+        ''' Remove a playlist from the cache, so that its entries are extracted
+        again the next time they're needed
+
+        Args:
+            url (str): The URL of the playlist
+        '''
+        self.playlists.delete(url)
+
+    def record_file(self, file_path: Path, info_dict: dict):
+        ''' Cache the metadata of the video a file was downloaded from
+
+        Args:
+            file_path (Path): The path to the downloaded file
+            info_dict (dict): The yt-dlp info dict of the video
+        '''
+        self.files.set(_file_key(file_path), {
+            'extractor': info_dict.get('extractor_key') or info_dict.get('ie_key'),
+            'id': info_dict.get('id'),
+            'title': info_dict.get('title'),
+            'duration': info_dict.get('duration'),
+            'playlist_index': info_dict.get('playlist_index'),
+            'uploader': info_dict.get('channel') or info_dict.get('uploader'),
+        })
+
+    def get_file(self, file_path: Path) -> dict:
+        ''' Get the cached metadata of the video a file was downloaded from
+
+        Args:
+            file_path (Path): The path to the downloaded file
+
+        Returns:
+            (dict): A dict with the extractor, id, title, duration, playlist
+                index, and uploader of the video, or None if the file is not
+                cached
+        '''
+        return self.files.get(_file_key(file_path))
+
+    def get_files(self, file_paths: list) -> dict:
+        ''' Get the cached metadata of the videos several files were
+        downloaded from, e.g. every track of an album, at once
+
+        Args:
+            file_paths (list): The paths to the downloaded files
+
+        Returns:
+            (dict): The metadata of each file that is cached, by path, as
+                get_file returns it
+        '''
+        keys = {file_path: _file_key(file_path) for file_path in file_paths}
+        cached = self.files.get_many(list(keys.values()))
+        return {
+            file_path: cached[key] for file_path, key in keys.items() if key in cached
+        }
+
+    def get_title(self, file_path: Path) -> str:
+        ''' Get the title of the video a file was downloaded from
+
+        Args:
+            file_path (Path): The path to the downloaded file
+
+        Returns:
+            (str): The title of the video, or None if the file is not cached
+        '''
+        file_metadata = self.get_file(file_path)
+        if file_metadata is None:
+            return None
+        return file_metadata['title']
+
+
+def entry_keys(entry: dict) -> set:
+    ''' Get the keys a playlist entry or a video is known by. Entries don't
+    always have an ID, e.g. those in RSS feeds, so their URLs are used as well
+
+    Args:
+        entry (dict): A flat playlist entry, or a yt-dlp info dict
+
+    Returns:
+        (set): The entry's keys
+    '''
+    return {
+        entry[key] for key in ('id', 'url', 'original_url', 'webpage_url')
+        if isinstance(entry.get(key), str)
+    }
+
+
+def _is_url_entry(entry) -> bool:
+    return isinstance(entry, dict) and \
+        entry.get('_type') in ('url', 'url_transparent') and \
+        bool(entry.get('url'))
+
+
+def _file_key(file_path: Path) -> str:
+    return str(Path(file_path).resolve())
@@ -0,0 +1,220 @@
+#pylint: disable=consider-using-f-string
+from contextlib import contextmanager
+from functools import wraps
+from importlib import metadata
+import json
+import threading
+import time
+
+
+# The packages whose versions are included in reports, so that throughput can
+# be compared across versions
+REPORTED_PACKAGES = ('ytbdl', 'yt-dlp', 'beets')
+
+# One recorder is used per process
+_METRICS = None
+
+
+def get_metrics() -> 'Metrics':
+    ''' Get the metrics recorder for this process, creating it if needed
+
+    Returns:
+        (Metrics): The metrics recorder
+    '''
+    global _METRICS #pylint: disable=global-statement
+    if _METRICS is None:
+        _METRICS = Metrics()
+    return _METRICS
+
+
+def timed(name: str):
+    ''' Decorate a function so that each call is recorded as a phase
+
+    Args:
+        name (str): The name of the phase
+    '''
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with get_metrics().phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Metrics:
+    ''' Records how long each phase of downloading and tagging takes, what
+    happened to each track, and counters like the number of bytes downloaded
+    and the number of retries. Phases may be recorded from any thread.
+
+    Phases are things like extracting a playlist, downloading an album,
+    converting a track, or importing an album. Tracks are identified by the ID
+    of the video they were downloaded from.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.phases = []
+        self.tracks = {}
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name: str, **labels):
+        ''' Record the time it takes to run a block of code
+
+        Args:
+            name (str): The name of the phase
+            **labels: Extra information to record with the phase, like the
+                album or URL
+        '''
+        started = time.time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, started, time.perf_counter() - start, **labels)
+
+    def add_phase(self, name: str, started: float, duration: float, **labels):
+        ''' Record a phase that has already finished
+
+        Args:
+            name (str): The name of the phase
+            started (float): When the phase started, as a UNIX timestamp
+            duration (float): How long the phase took in seconds
+            **labels: Extra information to record with the phase
+        '''
+        with self.lock:
+            self.phases.append({
+                'name': name, 'started': started, 'duration': duration, **labels
+            })
+
+    def increment(self, name: str, amount=1):
+        ''' Add to a counter
+
+        Args:
+            name (str): The name of the counter
+            amount: The amount to add
+        '''
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def update_track(self, track_id: str, **values):
+        ''' Record information about a track
+
+        Args:
+            track_id (str): The ID of the video the track was downloaded from
+            **values: The information to record
+        '''
+        with self.lock:
+            self.tracks.setdefault(track_id, {}).update(values)
+
+    def add_to_track(self, track_id: str, **amounts):
+        ''' Add to the totals recorded for a track, e.g. when it is downloaded
+        in more than one file
+
+        Args:
+            track_id (str): The ID of the video the track was downloaded from
+            **amounts: The amounts to add
+        '''
+        with self.lock:
+            track = self.tracks.setdefault(track_id, {})
+            for name, amount in amounts.items():
+                track[name] = track.get(name, 0) + amount
+
+    def collect(self) -> dict:
+        ''' Get everything recorded so far and start over, e.g. to send the
+        metrics of a worker process to the main process
+
+        Returns:
+            (dict): The phases, tracks, and counters recorded
+        '''
+        with self.lock:
+            collected = {
+                'phases': self.phases,
+                'tracks': self.tracks,
+                'counters': self.counters,
+            }
+            self.phases = []
+            self.tracks = {}
+            self.counters = {}
+        return collected
+
+    def merge(self, collected: dict):
+        ''' Add metrics collected in another process
+
+        Args:
+            collected (dict): The metrics returned by collect
+        '''
+        with self.lock:
+            self.phases.extend(collected['phases'])
+            for track_id, values in collected['tracks'].items():
+                self.tracks.setdefault(track_id, {}).update(values)
+            for name, amount in collected['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self) -> dict:
+        ''' Create a report of everything recorded, with a summary of each
+        phase
+
+        Returns:
+            (dict): A JSON serializable report
+        '''
+        with self.lock:
+            summary = {}
+            for recorded in self.phases:
+                phase = summary.setdefault(recorded['name'], {
+                    'count': 0, 'total': 0.0, 'max': 0.0
+                })
+                phase['count'] += 1
+                phase['total'] += recorded['duration']
+                phase['max'] = max(phase['max'], recorded['duration'])
+            for phase in summary.values():
+                phase['mean'] = phase['total'] / phase['count']
+
+            # e.g. format_cache_hits and format_cache_misses give the hit rate
+            # of format_cache
+            hit_rates = {}
+            for name in self.counters:
+                prefix, _, outcome = name.rpartition('_')
+                if outcome in ('hits', 'misses') and prefix not in hit_rates:
+                    hits = self.counters.get(prefix + '_hits', 0)
+                    lookups = hits + self.counters.get(prefix + '_misses', 0)
+                    hit_rates[prefix] = hits / lookups if lookups else 0.0
+
+            return {
+                'versions': get_versions(),
+                'started': self.started,
+                'duration': time.time() - self.started,
+                'summary': summary,
+                'counters': dict(self.counters),
+                'hit_rates': hit_rates,
+                'tracks': [
+                    {'id': track_id, **values} for track_id, values in self.tracks.items()
+                ],
+                'phases': list(self.phases),
+            }
+
+    def write_report(self, path):
+        ''' Write the report to a JSON file
+
+        Args:
+            path: The path to write the report to
+        '''
+        with open(path, 'w', encoding='utf-8') as report_file:
+            json.dump(self.report(), report_file, indent=2, default=str)
+
+
+def get_versions() -> dict:
+    ''' Get the installed versions of the packages in REPORTED_PACKAGES
+
+    Returns:
+        (dict): The version of each package, or None if it's not installed
+    '''
+    versions = {}
+    for package in REPORTED_PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
@@ -0,0 +1,162 @@
+#pylint: disable=consider-using-f-string
+import json
+import os
+
+import musicbrainzngs
+from musicbrainzngs import musicbrainz as musicbrainzngs_client
+
+from ytbdl import config
+from ytbdl.cache import DiskCache
+from ytbdl.metrics import get_metrics
+
+
+# Releases and recordings are rarely edited once they've been added
+ENTITY_TTL = 7 * 24 * 60 * 60
+ENTITY_MAX_BYTES = 128 * 1024 * 1024
+
+# New releases are added to search results more often
+SEARCH_TTL = 24 * 60 * 60
+SEARCH_MAX_BYTES = 32 * 1024 * 1024
+
+# The musicbrainzngs functions beets uses to look up releases and recordings.
+# The table each function's responses are cached in is keyed by the function
+# name and its arguments
+CACHED_LOOKUPS = {
+    'get_release_by_id': 'entities',
+    'get_recording_by_id': 'entities',
+    'browse_recordings': 'entities',
+    'search_releases': 'searches',
+    'search_recordings': 'searches',
+}
+
+# One MusicBrainz cache is opened per process
+_MUSICBRAINZ_CACHE = None
+
+
+def get_musicbrainz_cache_path() -> str:
+    ''' Get the path to the MusicBrainz cache database. This path may or may
+    not exist
+
+    Returns:
+        (str): A path to the MusicBrainz cache database in the config directory
+    '''
+    return os.path.join(config.config_dir(), 'musicbrainz.db')
+
+
+def open_musicbrainz_cache() -> 'MusicBrainzCache':
+    ''' Open the MusicBrainz cache, or get it if it was already opened in this
+    process
+
+    Returns:
+        (MusicBrainzCache): The MusicBrainz cache
+    '''
+    global _MUSICBRAINZ_CACHE #pylint: disable=global-statement
+    if _MUSICBRAINZ_CACHE is None:
+        _MUSICBRAINZ_CACHE = MusicBrainzCache(get_musicbrainz_cache_path())
+    return _MUSICBRAINZ_CACHE
+
+
+def install_musicbrainz_cache():
+    ''' Make beets look up releases and recordings through the MusicBrainz
+    cache. Does nothing if the cache is already installed
+    '''
+    # Imported here so that the cache can be used without beets
+    from beets.autotag import mb #pylint: disable=import-outside-toplevel
+    if not isinstance(mb.musicbrainzngs, CachedMusicBrainz):
+        mb.musicbrainzngs = CachedMusicBrainz(musicbrainzngs, open_musicbrainz_cache())
+
+
+class MusicBrainzCache:
+    ''' Caches the responses of the MusicBrainz web service, so that the same
+    release is not looked up again for every album and every run. MusicBrainz
+    only allows one request per second, so most of the time beets spends
+    finding a match is spent waiting to make requests.
+
+    Lookups by ID and searches are kept in separate tables, since search
+    results go stale sooner.
+
+    Args:
+        db_path (str): The path to the SQLite database. It is created if it
+            does not exist
+    '''
+
+    def __init__(self, db_path: str):
+        self.tables = {
+            'entities': DiskCache(db_path, 'entities', ENTITY_TTL, ENTITY_MAX_BYTES),
+            'searches': DiskCache(db_path, 'searches', SEARCH_TTL, SEARCH_MAX_BYTES),
+        }
+
+    @staticmethod
+    def make_key(name: str, args: tuple, kwargs: dict) -> str:
+        ''' Create the key a lookup's response is cached with. The MusicBrainz
+        server is part of the key, so that responses from a mirror are not
+        mixed up with responses from musicbrainz.org
+
+        Args:
+            name (str): The name of the musicbrainzngs function
+            args (tuple): The positional arguments the function was called with
+            kwargs (dict): The keyword arguments the function was called with
+
+        Returns:
+            (str): The cache key
+        '''
+        return json.dumps(
+            [musicbrainzngs_client.hostname, name, list(args), kwargs],
+            sort_keys=True,
+            default=str,
+        )
+
+    def lookup(self, name: str, function, *args, **kwargs):
+        ''' Get the response of a lookup from the cache, or call the function
+        and cache its response if it's not cached. Errors are not cached
+
+        Args:
+            name (str): The name of the musicbrainzngs function
+            function: The musicbrainzngs function to call on a cache miss
+            *args: Positional arguments to call the function with
+            **kwargs: Keyword arguments to call the function with
+
+        Returns:
+            The response of the lookup
+        '''
+        table = self.tables[CACHED_LOOKUPS[name]]
+        key = self.make_key(name, args, kwargs)
+        response = table.get(key)
+        metrics = get_metrics()
+        if response is not None:
+            metrics.increment('musicbrainz_cache_hits')
+            return response
+        metrics.increment('musicbrainz_requests')
+        with metrics.phase('musicbrainz', lookup=name):
+            response = function(*args, **kwargs)
+        table.set(key, response)
+        return response
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+
+
+class CachedMusicBrainz:
+    ''' Stands in for the musicbrainzngs module, with its lookup functions
+    going through a MusicBrainzCache. Everything else, such as the exceptions
+    and configuration functions, is taken from the module itself.
+
+    Args:
+        module: The musicbrainzngs module
+        cache (MusicBrainzCache): The cache to store responses in
+    '''
+
+    def __init__(self, module, cache: MusicBrainzCache):
+        self.module = module
+        self.cache = cache
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.module, name)
+        if name not in CACHED_LOOKUPS:
+            return attribute
+
+        def cached_lookup(*args, **kwargs):
+            return self.cache.lookup(name, attribute, *args, **kwargs)
+
+        return cached_lookup
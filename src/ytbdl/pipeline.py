@@ -0,0 +1,238 @@
+#pylint: disable=consider-using-f-string
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import logging
+import multiprocessing.util
+import os
+
+from ytbdl.apps.base import BaseApp
+from ytbdl.archive import open_archive
+from ytbdl.dedupe import remove_duplicate_files
+from ytbdl.exceptions import ConfigurationError, DownloadError
+from ytbdl.metrics import get_metrics
+from ytbdl.postprocess import set_postprocess_workers
+from ytbdl.resume import AlbumState
+from ytbdl.scheduler import set_rate_share
+from ytbdl.split import split_playlist
+from ytbdl.stream import TrackPreparer
+from ytbdl.yt_dlp import download_audio, close_engines, get_engine
+
+
+def resolve_playlist(url: str, extra_args: list) -> tuple:
+    ''' Resolve a playlist in a worker process, so that it can be split into
+    several albums
+
+    Args:
+        url (str): The URL of the playlist
+        extra_args (list): A list of arguments to pass to yt-dlp
+
+    Returns:
+        (tuple): The resolved playlist, see DownloadEngine.resolve, and the
+            metrics the worker recorded since its last album
+    '''
+    info = get_engine(extra_args, logging.getLogger('ytbdl')).resolve(url)
+    return info, get_metrics().collect()
+
+
+def download_album(album_dir: Path, extra_args: list, urls: list,
+                   use_archive: bool = False, playlists: dict = None) -> tuple:
+    ''' Download an album in a worker process. Each worker process has its own
+    download engines, so downloads in different workers cannot interfere with
+    each other.
+
+    Args:
+        album_dir (Path): The directory to download files into
+        extra_args (list): A list of arguments to pass to yt-dlp
+        urls (list): A list of URLs to download music from
+        use_archive (bool): Skip videos found in the download archive
+        playlists (dict): Playlists that were already resolved, by URL
+
+    Returns:
+        (tuple): The album_dir, once every URL has been downloaded and each
+            track has been prepared for import and checks out, and the metrics
+            the worker recorded since its last album
+    '''
+    logger = logging.getLogger('ytbdl')
+    archive = open_archive() if use_archive else None
+    state = AlbumState(album_dir, logger)
+    state.save()
+    with TrackPreparer(logger, on_prepared=state.complete) as preparer:
+        files = download_audio(album_dir, extra_args, urls, logger, archive,
+                               file_hook=preparer.prepare, state=state,
+                               playlists=playlists)
+        preparer.wait()
+    remove_duplicate_files(album_dir, files, logger, state)
+    state.check()
+    state.remove()
+    return album_dir, get_metrics().collect()
+
+
+def _init_worker(logger_name: str, level, postprocess_workers: int, rate_share: float):
+    # Forked workers inherit the parent's handlers, spawned workers do not
+    if not logging.getLogger(logger_name).handlers:
+        BaseApp.get_logger(logger_name, level)
+    # Share the CPUs between the workers' post-processing pools
+    set_postprocess_workers(postprocess_workers)
+    # And the request rate to each host
+    set_rate_share(rate_share)
+    # Worker processes don't run atexit handlers. The engines are closed
+    # before multiprocessing closes the queues of the post-processing pool,
+    # which it does with a priority of 10, so that the pool can still be shut
+    # down
+    multiprocessing.util.Finalize(None, close_engines, exitpriority=20)
+
+
+class AlbumPipeline:
+    ''' A two-stage pipeline for downloading and tagging many albums. A bounded
+    pool of worker processes downloads albums concurrently, and each album is
+    handed to the import stage as soon as its download finishes. There is only
+    ever one import running at a time, in the current process, since beets
+    only supports one writer to its library.
+
+    Albums split from the same playlist share a single resolution of the
+    playlist, which is done by a worker before any of them start downloading.
+    Each of them then downloads its own part of the playlist, in parallel.
+
+    Args:
+        import_album: A function taking an album directory that tags the album
+        logger: A logging object
+        max_workers (int): The maximum number of albums to download at once
+        fail_fast (bool): Cancel the remaining albums when one album fails
+        use_archive (bool): Skip videos found in the download archive
+    '''
+
+    def __init__(self, import_album, logger, max_workers: int = 1,
+                 fail_fast: bool = False, use_archive: bool = False):
+        self.import_album = import_album
+        self.logger = logger
+        self.max_workers = max(1, max_workers)
+        self.fail_fast = fail_fast
+        self.use_archive = use_archive
+
+    def run(self, albums: list) -> list:
+        ''' Download and import albums
+
+        Args:
+            albums (list): A list of (job, album_dir, extra_args) tuples, where
+                job is an AlbumJob
+
+        Returns:
+            (list): A list of (job, exception) tuples for the albums that could
+                not be downloaded or imported
+
+        Raises:
+            ConfigurationError: If the config is invalid, which every album
+                would fail with
+        '''
+        failures = []
+        initargs = (
+            self.logger.name, self.logger.level,
+            (os.cpu_count() or 1) // self.max_workers,
+            1 / self.max_workers,
+        )
+        with ProcessPoolExecutor(max_workers=self.max_workers,
+                                 initializer=_init_worker,
+                                 initargs=initargs) as executor:
+            futures = {}
+            split_playlists = self.split(executor, albums, failures)
+            if failures and self.fail_fast:
+                return failures
+            for index, (job, album_dir, extra_args) in enumerate(albums):
+                playlists = None
+                if job.is_split:
+                    if index not in split_playlists:
+                        continue
+                    playlists = {job.urls[0]: split_playlists[index]}
+                self.logger.info(msg='Queued "{0}" by {1} for download'.format(
+                    job.album, job.artist
+                ))
+                future = executor.submit(download_album, album_dir, extra_args,
+                                         job.urls, self.use_archive, playlists)
+                futures[future] = job
+
+            try:
+                # Import albums in the order their downloads finish, while the
+                # other workers keep downloading
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        album_dir, metrics = future.result()
+                        get_metrics().merge(metrics)
+                        self.logger.info(msg='Autotagging album downloaded to {0}'.format(
+                            str(album_dir)
+                        ))
+                        self.import_album(album_dir)
+                    except ConfigurationError:
+                        # Every album shares the config
+                        raise
+                    except Exception as exc: #pylint: disable=broad-except
+                        # e.g. a worker that died, or beets failing to import,
+                        # only fails this album
+                        failures.append((job, exc))
+                        if self.fail_fast:
+                            self.cancel(futures)
+                            break
+
+            except BaseException:
+                # Don't wait for queued albums on the way out
+                self.cancel(futures)
+                raise
+
+        return failures
+
+    def split(self, executor, albums: list, failures: list) -> dict:
+        ''' Resolve each playlist that albums are split from once, and divide
+        its entries between the albums
+
+        Args:
+            executor (ProcessPoolExecutor): The pool to resolve playlists in
+            albums (list): A list of (job, album_dir, extra_args) tuples
+            failures (list): The list of (job, exception) tuples to add the
+                albums whose playlist could not be resolved to
+
+        Returns:
+            (dict): The part of its playlist each split album downloads, by
+                the album's index in albums
+        '''
+        # Albums are split from the same playlist if they use the same URL and
+        # the same yt-dlp arguments
+        splits = {}
+        for index, (job, _, extra_args) in enumerate(albums):
+            if job.is_split:
+                splits.setdefault((job.urls[0], tuple(extra_args)), []).append(index)
+
+        futures = {
+            executor.submit(resolve_playlist, url, list(extra_args)): indexes
+            for (url, extra_args), indexes in splits.items()
+        }
+        split_playlists = {}
+        for future in as_completed(futures):
+            indexes = futures[future]
+            jobs = [albums[index][0] for index in indexes]
+            try:
+                info, metrics = future.result()
+            except ConfigurationError:
+                raise
+            except Exception as exc: #pylint: disable=broad-except
+                failures.extend((job, exc) for job in jobs)
+                continue
+            get_metrics().merge(metrics)
+            self.logger.info(msg='Splitting {0} videos in {1} into {2} album(s)'.format(
+                len(info['entries']), jobs[0].urls[0], len(jobs)
+            ))
+            for index, job, playlist in zip(indexes, jobs, split_playlist(info, jobs,
+                                                                          self.logger)):
+                if playlist['entries']:
+                    split_playlists[index] = playlist
+                else:
+                    failures.append((job, DownloadError(
+                        'None of the videos in {0} are in the album'.format(job.urls[0])
+                    )))
+        return split_playlists
+
+    @staticmethod
+    def cancel(futures):
+        ''' Cancel every album download that has not started yet
+        '''
+        for future in futures:
+            future.cancel()
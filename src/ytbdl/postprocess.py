@@ -0,0 +1,292 @@
+#pylint: disable=consider-using-f-string
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+import os
+import signal
+import time
+
+from mediafile import MediaFile, UnreadableFileError
+
+from ytbdl.metrics import timed
+from ytbdl.resources import open_resources
+
+
+# yt-dlp post processors that run at these stages are done before a file is
+# moved into the album folder, so converting the audio afterwards does not
+# change the order they run in
+EARLY_STAGES = ('pre_process', 'after_filter', 'video', 'before_dl', 'playlist')
+
+# The YoutubeDL params that the audio conversion uses
+CONVERSION_PARAMS = (
+    'ffmpeg_location', 'postprocessor_args', 'keepvideo', 'quiet', 'no_warnings',
+    'verbose',
+)
+
+# One pool is created per process, the first time it is needed
+_POOL = None
+_POOL_WORKERS = None
+
+# The YoutubeDL object used by the post processors in a worker process
+_WORKER_YDL = None
+_WORKER_PARAMS = None
+
+# beets' own embed_album, while it's replaced by the one in this module
+_BEETS_EMBED_ALBUM = None
+
+
+def set_postprocess_workers(max_workers: int):
+    ''' Set the number of processes the post-processing pool is created with.
+    Defaults to the number of CPUs. Has no effect once the pool is created
+
+    Args:
+        max_workers (int): The number of processes
+    '''
+    global _POOL_WORKERS #pylint: disable=global-statement
+    _POOL_WORKERS = max(1, max_workers)
+
+
+def get_postprocess_pool() -> ProcessPoolExecutor:
+    ''' Get the pool of processes that convert audio and write tags, creating
+    it if it does not exist yet in this process
+
+    Returns:
+        (ProcessPoolExecutor): The post-processing pool
+    '''
+    global _POOL #pylint: disable=global-statement
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(max_workers=_POOL_WORKERS or os.cpu_count() or 1,
+                                    initializer=_ignore_interrupts)
+    return _POOL
+
+
+def _ignore_interrupts():
+    # Ctrl+C is handled by the main process, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def close_postprocess_pool():
+    ''' Wait for the post-processing pool to finish and shut it down
+    '''
+    global _POOL #pylint: disable=global-statement
+    if _POOL is not None:
+        _POOL.shutdown(wait=True)
+        _POOL = None
+
+
+def split_extract_audio(params: dict) -> tuple:
+    ''' Take yt-dlp's audio extraction out of a set of YoutubeDL params, so
+    that it can be run in the post-processing pool once each file is in the
+    album folder, instead of by yt-dlp one file at a time.
+
+    The extraction is left alone if any other post processor runs after it,
+    since it would then run before the extraction instead.
+
+    Args:
+        params (dict): YoutubeDL parameters
+
+    Returns:
+        (tuple): The params without the extraction, and the options of the
+            FFmpegExtractAudio post processor, or the params as they were and
+            None if the extraction can't be taken out
+    '''
+    postprocessors = params.get('postprocessors') or []
+    extract_audio = [pp for pp in postprocessors if pp['key'] == 'FFmpegExtractAudio']
+    others = [pp for pp in postprocessors if pp['key'] != 'FFmpegExtractAudio']
+    if len(extract_audio) != 1 or extract_audio[0].get('when', 'post_process') != 'post_process':
+        return params, None
+    if any(pp.get('when', 'post_process') not in EARLY_STAGES for pp in others):
+        return params, None
+    options = {
+        key: value for key, value in extract_audio[0].items() if key not in ('key', 'when')
+    }
+    return {**params, 'postprocessors': others}, options
+
+
+def rewrites_file(ext: str, options: dict) -> bool:
+    ''' Determine whether yt-dlp's audio extraction writes a new file for a
+    downloaded file with an extension, without looking at the file. When it's
+    not known for sure, e.g. because it depends on the codec in the file, the
+    file is assumed to be left alone
+
+    Args:
+        ext (str): The extension of the downloaded file
+        options (dict): The options of the FFmpegExtractAudio post processor
+
+    Returns:
+        (bool): True if the audio is converted, or copied into a new container
+    '''
+    #pylint: disable=import-outside-toplevel
+    from yt_dlp.postprocessor.ffmpeg import ACODECS, FFmpegExtractAudioPP, resolve_mapping
+
+    target_format, _ = resolve_mapping(ext, options.get('preferredcodec') or 'best')
+    if not target_format:
+        return False
+    if target_format == 'best':
+        return ext not in FFmpegExtractAudioPP.COMMON_AUDIO_EXTS
+    if target_format not in ACODECS:
+        return False
+    # ALAC is always encoded, the other codecs are copied if the file already
+    # has them in the right container
+    return ACODECS[target_format][0] != ext or target_format == 'alac'
+
+
+def conversion_params(params: dict) -> dict:
+    ''' Get the YoutubeDL params needed to convert audio in a worker process
+
+    Args:
+        params (dict): YoutubeDL parameters
+
+    Returns:
+        (dict): The params used by the audio conversion
+    '''
+    return {key: params[key] for key in CONVERSION_PARAMS if key in params}
+
+
+def extract_audio(info: dict, options: dict, params: dict) -> tuple:
+    ''' Extract the audio from a downloaded file in a worker process, in the
+    same way yt-dlp does with --extract-audio. The extracted audio is written
+    next to the downloaded file, which is deleted unless --keep-video was used.
+
+    Args:
+        info (dict): The filepath, ext, vcodec, acodec, and filetime of the
+            file from its yt-dlp info dict
+        options (dict): The options of the FFmpegExtractAudio post processor
+        params (dict): The YoutubeDL params from conversion_params
+
+    Returns:
+        (tuple): The path to the audio file and its extension, or None and an
+            error message if the audio could not be extracted, followed by the
+            number of seconds the extraction took
+    '''
+    # Imported here so that embedding album art doesn't need yt-dlp
+    #pylint: disable=import-outside-toplevel
+    from yt_dlp import YoutubeDL
+    from yt_dlp.postprocessor import FFmpegExtractAudioPP
+    from yt_dlp.utils import PostProcessingError
+
+    global _WORKER_YDL, _WORKER_PARAMS #pylint: disable=global-statement
+    if _WORKER_YDL is None or _WORKER_PARAMS != params:
+        _WORKER_YDL = YoutubeDL(params)
+        _WORKER_PARAMS = params
+    resources = open_resources()
+    # FFmpeg processes are shared with every other ytbdl process
+    with nullcontext() if resources is None else resources.conversion():
+        start = time.perf_counter()
+        try:
+            files_to_delete, info = FFmpegExtractAudioPP(_WORKER_YDL, **options).run(dict(info))
+        except PostProcessingError as exc:
+            return None, str(exc), time.perf_counter() - start
+    if not params.get('keepvideo'):
+        for file_path in files_to_delete:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+    return info['filepath'], info['ext'], time.perf_counter() - start
+
+
+def write_tags(path: bytes, tags: dict, id3v23: bool) -> str:
+    ''' Write tags into a media file in a worker process, like beets'
+    Item.write does
+
+    Args:
+        path (bytes): The path to the media file
+        tags (dict): The tags to write
+        id3v23 (bool): Write ID3v2.3 tags instead of ID3v2.4
+
+    Returns:
+        (str): An error message, or None if the tags were written
+    '''
+    try:
+        media_file = MediaFile(path, id3v23=id3v23)
+        media_file.update(tags)
+        media_file.save()
+    except (UnreadableFileError, OSError) as exc:
+        return str(exc)
+    return None
+
+
+def install_parallel_embedding():
+    ''' Make beets embed album art with embed_album, until
+    uninstall_parallel_embedding is called. Does nothing if it's already
+    installed
+    '''
+    global _BEETS_EMBED_ALBUM #pylint: disable=global-statement
+    #pylint: disable=import-outside-toplevel
+    from beets import art
+    if art.embed_album is not embed_album:
+        _BEETS_EMBED_ALBUM = art.embed_album
+        art.embed_album = embed_album
+
+
+def uninstall_parallel_embedding():
+    ''' Give beets back its own embed_album. Does nothing if embed_album is
+    not installed
+    '''
+    global _BEETS_EMBED_ALBUM #pylint: disable=global-statement
+    if _BEETS_EMBED_ALBUM is None:
+        return
+    #pylint: disable=import-outside-toplevel
+    from beets import art
+    art.embed_album = _BEETS_EMBED_ALBUM
+    _BEETS_EMBED_ALBUM = None
+
+
+@timed('embedart')
+def embed_album(log, album, maxwidth=None, quiet=False, compare_threshold=0,
+                ifempty=False, quality=0):
+    ''' Embed album art into all of an album's items, like
+    beets.art.embed_album does, except that the cover is resized and read
+    once for the whole album and the items are written in the post-processing
+    pool in parallel. The write and after_write plugin events are still sent
+    for each item in this process.
+    '''
+    #pylint: disable=import-outside-toplevel,unused-argument
+    from beets import art, plugins
+    from beets import config as beetsconfig
+    from beets.util import displayable_path, syspath
+
+    imagepath = album.artpath
+    if not imagepath:
+        log.info('No album art present for {0}', album)
+        return
+    if not os.path.isfile(syspath(imagepath)):
+        log.info('Album art not found at {0} for {1}', displayable_path(imagepath), album)
+        return
+    if maxwidth:
+        imagepath = art.resize_image(log, imagepath, maxwidth, quality)
+
+    try:
+        log.debug('embedding {0}', displayable_path(imagepath))
+        image = art.mediafile_image(imagepath, maxwidth)
+    except IOError as exc:
+        log.warning('could not read image file: {0}', exc)
+        return
+    if image.mime_type not in ('image/jpeg', 'image/png'):
+        log.info('not embedding image of unsupported type: {}', image.mime_type)
+        return
+
+    log.info('Embedding album art into {0}', album)
+
+    id3v23 = beetsconfig['id3v23'].get(bool)
+    pool = get_postprocess_pool()
+    writes = []
+    for item in album.items():
+        if compare_threshold and \
+            not art.check_art_similarity(log, item, imagepath, compare_threshold):
+            log.info('Image not similar; skipping.')
+            continue
+        if ifempty and art.get_art(log, item):
+            log.info('media file already contained art')
+            continue
+        # pylint: disable=protected-access
+        tags = {key: value for key, value in dict(item).items() if key in item._media_fields}
+        tags['images'] = [image]
+        plugins.send('write', item=item, path=item.path, tags=tags)
+        writes.append((item, pool.submit(write_tags, syspath(item.path), tags, id3v23)))
+
+    for item, future in writes:
+        error = future.result()
+        if error is not None:
+            log.error('error writing {0}: {1}', displayable_path(item.path), error)
+            continue
+        item.mtime = item.current_mtime()
+        plugins.send('after_write', item=item, path=item.path)
@@ -0,0 +1,436 @@
+#pylint: disable=consider-using-f-string
+from contextlib import contextmanager
+from pathlib import Path
+import os
+import shutil
+import threading
+import time
+
+import confuse
+
+from ytbdl import config
+from ytbdl.database import Database
+from ytbdl.exceptions import ConfigurationError, DownloadError
+from ytbdl.metrics import get_metrics
+
+
+# The resources options used when they're not in the config. Sizes and rates
+# are in bytes, and 0 means no limit. conversions defaults to the number of
+# CPUs
+DEFAULT_RESOURCE_OPTIONS = {
+    'download_rate': 0,
+    'transfers': 8,
+    'conversions': None,
+    'scratch_space': 0,
+    'min_free_space': 0,
+}
+
+# The options that are sizes or rates, which may be given like 500K or 2G
+SIZE_OPTIONS = ('download_rate', 'scratch_space', 'min_free_space')
+
+# The size of an album is estimated from the durations of its videos, at this
+# many bytes per second of audio (160 kbit/s). Videos without a duration are
+# assumed to be this many seconds long
+ESTIMATED_BYTES_PER_SECOND = 20000
+ESTIMATED_TRACK_SECONDS = 300
+
+# A lease is given up if the process holding it doesn't renew it for this many
+# seconds, e.g. because it was killed. Leases are renewed well before then
+LEASE_TTL = 60
+LEASE_RENEW_INTERVAL = 15
+
+# How often to check whether a resource that's used up has been released
+POLL_INTERVAL = 0.5
+
+# How often each transfer's share of the download rate is worked out again, as
+# transfers start and finish in other processes
+RATE_REFRESH_INTERVAL = 2.0
+
+# Leases on these resources are taken by each file while it downloads, while
+# its audio is extracted, and by each album while it's downloading
+TRANSFER = 'transfer'
+CONVERSION = 'conversion'
+SCRATCH = 'scratch'
+
+# One resource manager is used per process
+_RESOURCES = None
+
+
+def get_resource_options() -> dict:
+    ''' Get the resources options from the config. Resources are shared
+    between ytbdl processes unless the resources option is set to "no"
+
+    Returns:
+        (dict): The options, or None if resources are not shared
+    '''
+    options = dict(DEFAULT_RESOURCE_OPTIONS, conversions=os.cpu_count() or 1)
+    if 'resources' not in config:
+        return options
+    try:
+        if config['resources'].get() is False:
+            return None
+        for key in options:
+            if key not in config['resources']:
+                continue
+            if key in SIZE_OPTIONS:
+                options[key] = parse_size(config['resources'][key].get())
+            else:
+                options[key] = int(config['resources'][key].as_number())
+    except confuse.ConfigError as exc:
+        raise ConfigurationError(
+            'The resources config option is invalid: {0}'.format(str(exc))
+        ) from exc
+    return options
+
+
+def parse_size(value) -> float:
+    ''' Parse a size or rate in bytes, which may be a number or a string like
+    yt-dlp's --limit-rate, e.g. 500K or 4.2M
+
+    Args:
+        value: The size
+
+    Returns:
+        (float): The number of bytes
+
+    Raises:
+        ConfigurationError: If the value is not a size
+    '''
+    #pylint: disable=import-outside-toplevel
+    from yt_dlp.utils import parse_bytes
+
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    size = parse_bytes(value) if isinstance(value, str) else None
+    if size is None:
+        raise ConfigurationError(
+            'The resources config option is invalid: {0} is not a size'.format(value)
+        )
+    return size
+
+
+def get_resources_path() -> str:
+    ''' Get the path to the database resources are shared with. This path may
+    or may not exist
+
+    Returns:
+        (str): A path to the resources database in the config directory
+    '''
+    return os.path.join(config.config_dir(), 'resources.db')
+
+
+def open_resources() -> 'ResourceManager':
+    ''' Create the resource manager from the config, or get it if it was
+    already created in this process
+
+    Returns:
+        (ResourceManager): The resource manager, or None if resources are not
+            shared
+    '''
+    global _RESOURCES #pylint: disable=global-statement
+    if _RESOURCES is None:
+        options = get_resource_options()
+        if options is None:
+            return None
+        _RESOURCES = ResourceManager(get_resources_path(), **options)
+    return _RESOURCES
+
+
+def close_resources():
+    ''' Give up the leases held by this process, and close the resource
+    manager if it was created
+    '''
+    global _RESOURCES #pylint: disable=global-statement
+    if _RESOURCES is not None:
+        _RESOURCES.close()
+        _RESOURCES = None
+
+
+def _forget_resources():
+    # A forked process has its own leases, and must not use its parent's
+    # database connection
+    global _RESOURCES #pylint: disable=global-statement
+    _RESOURCES = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_resources)
+
+
+def estimate_size(entries: list) -> float:
+    ''' Estimate the disk space downloading videos takes, from their playlist
+    entries or info dicts
+
+    Args:
+        entries (list): The flat playlist entries or info dicts of the videos
+
+    Returns:
+        (float): The estimated number of bytes
+    '''
+    size = 0
+    for entry in entries:
+        entry = entry if isinstance(entry, dict) else {}
+        size += entry.get('filesize') or entry.get('filesize_approx') or \
+            (entry.get('duration') or ESTIMATED_TRACK_SECONDS) * ESTIMATED_BYTES_PER_SECOND
+    return size
+
+
+def _free_space(path: Path) -> int:
+    # The album folder may not exist yet, in which case its closest existing
+    # parent is on the disk it will be created on
+    path = Path(path).absolute()
+    while not path.exists() and path != path.parent:
+        path = path.parent
+    return shutil.disk_usage(path).free
+
+
+class ResourceManager:
+    ''' Shares the network, CPUs, and disk between every ytbdl process on the
+    computer, e.g. cron jobs that run at the same time, and the workers of
+    each of them, so that ytbdl doesn't starve other services.
+
+    A process takes a lease on a resource while it uses it, e.g. a transfer
+    slot while a file downloads, and waits while the resource's limit is used
+    up by other leases. The leases are kept in a database in the config
+    directory, and SQLite's locks make sure only one process takes a lease at
+    a time. A background thread renews the process' leases, so that the
+    leases of a process that was killed expire after LEASE_TTL seconds.
+
+    Albums are admitted by the disk space their playlist entries are estimated
+    to take. An album waits while other albums have the scratch space
+    reserved, and fails if the disk is too full for it once they're done.
+
+    Args:
+        db_path (str): The path to the SQLite database. It is created if it
+            does not exist
+        download_rate (float): The most bytes per second downloaded by every
+            process together, shared evenly between the files downloading
+        transfers (int): The most files downloading at once
+        conversions (int): The most files having their audio extracted by
+            FFmpeg at once
+        scratch_space (float): The most bytes albums downloading at once can
+            be estimated to take. An album on its own is always admitted
+        min_free_space (float): The bytes to leave free on the disk albums
+            are downloaded to
+    '''
+
+    def __init__(self, db_path: str, download_rate: float, transfers: int,
+                 conversions: int, scratch_space: float, min_free_space: float):
+        self.db_path = db_path
+        self.download_rate = download_rate
+        self.transfers = transfers
+        self.conversions = conversions
+        self.scratch_space = scratch_space
+        self.min_free_space = min_free_space
+        self.database = Database(db_path)
+        self.held = set()
+        self.lock = threading.Lock()
+        self._renewer = None
+        self._closed = threading.Event()
+        self._rate = None
+        self._rate_checked = 0.0
+        with self.database.transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS leases ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'kind TEXT NOT NULL, '
+                'amount REAL NOT NULL, '
+                'pid INTEGER NOT NULL, '
+                'renewed REAL NOT NULL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS leases_kind ON leases (kind)'
+            )
+
+    def try_acquire(self, kind: str, amount: float, admit) -> int:
+        ''' Take a lease on a resource if it's available, without waiting
+
+        Args:
+            kind (str): The resource
+            amount (float): How much of the resource the lease is for
+            admit: A function taking the amount of the resource leased by
+                others and the number of their leases, which tells whether
+                this lease can be taken too
+
+        Returns:
+            (int): The ID of the lease, or None if it could not be taken
+        '''
+        now = time.time()
+        with self.database.transaction() as connection:
+            # Lock the database before reading it, so that no other process
+            # can take the same resource before this lease is added
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'DELETE FROM leases WHERE renewed < ?', (now - LEASE_TTL,)
+            )
+            used, count = connection.execute(
+                'SELECT COALESCE(SUM(amount), 0), COUNT(*) FROM leases WHERE kind = ?',
+                (kind,)
+            ).fetchone()
+            if not admit(used, count):
+                return None
+            lease_id = connection.execute(
+                'INSERT INTO leases (kind, amount, pid, renewed) VALUES (?, ?, ?, ?)',
+                (kind, amount, os.getpid(), now)
+            ).lastrowid
+        with self.lock:
+            self.held.add(lease_id)
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew, daemon=True,
+                                                 name='resources')
+                self._renewer.start()
+        return lease_id
+
+    def acquire(self, kind: str, amount: float, admit, logger=None,
+                description: str = None) -> int:
+        ''' Take a lease on a resource, waiting until it's available
+
+        Args:
+            kind (str): The resource
+            amount (float): How much of the resource the lease is for
+            admit: A function telling whether the lease can be taken, see
+                try_acquire
+            logger: An optional logging object to say the lease is waited for
+            description (str): What is waiting, for the log message
+
+        Returns:
+            (int): The ID of the lease
+        '''
+        lease_id = self.try_acquire(kind, amount, admit)
+        if lease_id is not None:
+            return lease_id
+        if logger is not None:
+            logger.info(msg='Waiting for other ytbdl downloads to free up {0}{1}'.format(
+                kind, ' for {0}'.format(description) if description else ''
+            ))
+        started = time.time()
+        start = time.perf_counter()
+        while lease_id is None:
+            time.sleep(POLL_INTERVAL)
+            lease_id = self.try_acquire(kind, amount, admit)
+        get_metrics().add_phase('resource_wait', started, time.perf_counter() - start,
+                                resource=kind)
+        return lease_id
+
+    def release(self, lease_id: int):
+        ''' Give up a lease, so that other processes can use the resource
+
+        Args:
+            lease_id (int): The ID of the lease
+        '''
+        with self.lock:
+            self.held.discard(lease_id)
+        with self.database.transaction() as connection:
+            connection.execute('DELETE FROM leases WHERE id = ?', (lease_id,))
+
+    @contextmanager
+    def lease(self, kind: str, amount: float, admit, logger=None,
+              description: str = None):
+        ''' Hold a lease on a resource while running a block of code, see
+        acquire
+        '''
+        lease_id = self.acquire(kind, amount, admit, logger, description)
+        try:
+            yield
+        finally:
+            self.release(lease_id)
+
+    @contextmanager
+    def transfer(self, logger=None, description: str = None):
+        ''' Hold a transfer slot while a file downloads. A slot is needed to
+        share the download rate, even if the number of transfers isn't limited
+
+        Args:
+            logger: An optional logging object to say the slot is waited for
+            description (str): The file that is waiting, for the log message
+        '''
+        if not self.transfers and not self.download_rate:
+            yield
+            return
+        with self.lease(TRANSFER, 1, lambda _, count: not self.transfers or
+                        count < self.transfers, logger, description):
+            self._rate_checked = 0.0
+            yield
+
+    @contextmanager
+    def conversion(self):
+        ''' Hold a conversion slot while FFmpeg extracts the audio of a file
+        '''
+        if not self.conversions:
+            yield
+            return
+        with self.lease(CONVERSION, 1, lambda _, count: count < self.conversions):
+            yield
+
+    @contextmanager
+    def reserve_space(self, album_dir: Path, size: float, logger=None):
+        ''' Reserve scratch space for an album while it downloads. The album
+        waits while the space is reserved by other albums, or while the disk
+        doesn't have room for it and the other albums downloading to it
+
+        Args:
+            album_dir (Path): The folder the album is downloaded to
+            size (float): The estimated size of the album in bytes
+            logger: An optional logging object to say the album is waiting
+
+        Raises:
+            DownloadError: If the disk doesn't have room for the album even
+                though no other album is downloading
+        '''
+        def admit(used, count):
+            fits = _free_space(album_dir) - self.min_free_space >= used + size
+            if count == 0:
+                if not fits:
+                    raise DownloadError(
+                        'There is not enough free space for {0}, which is estimated to '
+                        'take {1:.0f} MB'.format(str(album_dir), size / 1e6)
+                    )
+                return True
+            return fits and (not self.scratch_space or used + size <= self.scratch_space)
+
+        with self.lease(SCRATCH, size, admit, logger, str(album_dir)):
+            yield
+
+    def transfer_rate(self) -> float:
+        ''' Get the download rate each file that is downloading may use, which
+        is the download_rate shared evenly between every transfer in every
+        process. It's worked out again every RATE_REFRESH_INTERVAL seconds
+
+        Returns:
+            (float): The most bytes per second, or None if the download rate
+                isn't limited
+        '''
+        if not self.download_rate:
+            return None
+        now = time.monotonic()
+        if now - self._rate_checked >= RATE_REFRESH_INTERVAL:
+            count = self.database.fetchone(
+                'SELECT COUNT(*) FROM leases WHERE kind = ? AND renewed >= ?',
+                (TRANSFER, time.time() - LEASE_TTL)
+            )[0]
+            self._rate = self.download_rate / max(1, count)
+            self._rate_checked = now
+        return self._rate
+
+    def _renew(self):
+        while not self._closed.wait(LEASE_RENEW_INTERVAL):
+            now = time.time()
+            with self.lock:
+                held = [(now, lease_id) for lease_id in self.held]
+            if not held:
+                continue
+            with self.database.transaction() as connection:
+                connection.executemany(
+                    'UPDATE leases SET renewed = ? WHERE id = ?', held
+                )
+
+    def close(self):
+        ''' Give up every lease held by this process, and close the database
+        '''
+        self._closed.set()
+        with self.lock:
+            held = [(lease_id,) for lease_id in self.held]
+            self.held = set()
+        with self.database.transaction() as connection:
+            connection.executemany('DELETE FROM leases WHERE id = ?', held)
+        self.database.close()
@@ -0,0 +1,273 @@
+#pylint: disable=consider-using-f-string
+from pathlib import Path
+import hashlib
+import json
+import os
+import threading
+import time
+
+from ytbdl.exceptions import DownloadError
+
+
+# The state file is hidden, so beets does not try to import it
+STATE_FILE_NAME = '.ytbdl-state.json'
+
+# The most often the state file is written while a track is downloading, in
+# seconds. Progress is only a hint, since yt-dlp continues from the size of the
+# partial file
+SAVE_INTERVAL = 1.0
+
+# Tracks that are downloading, and tracks that are downloaded and tagged
+PARTIAL = 'partial'
+COMPLETE = 'complete'
+
+
+def has_state(album_dir: Path) -> bool:
+    ''' Determine whether an album folder has the state of an unfinished
+    download in it
+
+    Args:
+        album_dir (Path): The album folder
+
+    Returns:
+        (bool): True if the album's download can be resumed
+    '''
+    return (Path(album_dir) / STATE_FILE_NAME).is_file()
+
+
+def file_digest(file_path: Path) -> str:
+    ''' Get the SHA-256 digest of a file
+
+    Args:
+        file_path (Path): The file to hash
+
+    Returns:
+        (str): The hex digest
+    '''
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class AlbumState:
+    ''' Keeps track of an album's download in a state file in the album folder,
+    so that the download can be resumed if it's interrupted.
+
+    The state file records each track that is downloading, along with its
+    partial file and how many of its bytes were downloaded, and each track that
+    is complete, along with its size and modification time. When the download
+    is resumed, yt-dlp continues the partial files where they left off, and
+    complete tracks are re-used if their size and modification time are
+    unchanged. Tracks that don't check out are downloaded again.
+
+    Args:
+        album_dir (Path): The album folder
+        logger: A logging object
+    '''
+
+    def __init__(self, album_dir: Path, logger):
+        self.album_dir = Path(album_dir)
+        self.state_path = self.album_dir / STATE_FILE_NAME
+        self.logger = logger
+        self.tracks = {}
+        self.saved = 0.0
+        self.lock = threading.Lock()
+        if self.state_path.is_file():
+            self.load()
+
+    def load(self):
+        ''' Read the state file, and delete partial files that can't be
+        continued
+        '''
+        try:
+            state = json.loads(self.state_path.read_text(encoding='utf-8'))
+            self.tracks = dict(state['tracks'])
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            self.logger.warning(msg='Could not read {0}, starting over: {1}'.format(
+                str(self.state_path), str(exc)
+            ))
+            self.tracks = {}
+            return
+
+        for track in self.tracks.values():
+            if track['status'] != PARTIAL or not track.get('part'):
+                continue
+            part_path = self.album_dir / track['part']
+            if not part_path.is_file():
+                continue
+            size = part_path.stat().st_size
+            if track.get('total_bytes') and size > track['total_bytes']:
+                self.logger.warning(msg='Deleting {0}, which is larger than the track'.format(
+                    str(part_path)
+                ))
+                part_path.unlink()
+            else:
+                self.logger.info(msg='Continuing {0} from {1} bytes'.format(
+                    track.get('title') or track['part'], size
+                ))
+
+    def save(self, force: bool = True):
+        ''' Write the state file, replacing the old one at once so that it's
+        never left half written
+
+        Args:
+            force (bool): Write the file even if it was written less than
+                SAVE_INTERVAL seconds ago
+        '''
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.saved < SAVE_INTERVAL:
+                return
+            self.saved = now
+            contents = json.dumps({'tracks': self.tracks}, indent=2)
+            self.album_dir.mkdir(parents=True, exist_ok=True)
+            temp_path = self.state_path.with_name(self.state_path.name + '.tmp')
+            temp_path.write_text(contents, encoding='utf-8')
+            os.replace(temp_path, self.state_path)
+
+    def update_progress(self, progress: dict):
+        ''' Record how much of a track has been downloaded. Use as a
+        DownloadEngine progress hook
+
+        Args:
+            progress (dict): A yt-dlp progress dict
+        '''
+        info_dict = progress.get('info_dict') or {}
+        if progress.get('status') != 'downloading' or not info_dict.get('id'):
+            return
+        with self.lock:
+            track = self.tracks.setdefault(info_dict['id'], {'status': PARTIAL})
+            if track['status'] != PARTIAL:
+                return
+            track.update({
+                'title': info_dict.get('title'),
+                'part': Path(progress.get('tmpfilename') or '').name or None,
+                'downloaded_bytes': progress.get('downloaded_bytes'),
+                'total_bytes': progress.get('total_bytes') or
+                               progress.get('total_bytes_estimate'),
+            })
+        self.save(force=False)
+
+    def complete(self, file_path: Path, info_dict: dict):
+        ''' Record a track that is downloaded and tagged, so that it can be
+        checked before it's re-used
+
+        Args:
+            file_path (Path): The path to the downloaded file
+            info_dict (dict): The yt-dlp info dict of the video the file was
+                downloaded from
+        '''
+        if not info_dict.get('id'):
+            return
+        file_path = Path(file_path)
+        stat = file_path.stat()
+        track = {
+            'status': COMPLETE,
+            'title': info_dict.get('title'),
+            'file': file_path.name,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+        }
+        with self.lock:
+            self.tracks[info_dict['id']] = track
+        self.save()
+
+    def get_path(self, video_id: str) -> Path:
+        ''' Get the file of a complete track, if it still checks out. If it
+        doesn't, it's deleted so that it's downloaded again
+
+        Args:
+            video_id (str): The ID of the video
+
+        Returns:
+            (Path): The path to the file, or None if the track is not complete
+        '''
+        with self.lock:
+            track = self.tracks.get(video_id)
+        if track is None or track['status'] != COMPLETE:
+            return None
+        file_path = self.album_dir / track['file']
+        problem = self.check_track(track)
+        if problem is None:
+            return file_path
+        self.logger.warning(msg='Downloading {0} again: {1}'.format(str(file_path), problem))
+        if file_path.is_file():
+            file_path.unlink()
+        with self.lock:
+            del self.tracks[video_id]
+        self.save()
+        return None
+
+    def forget(self, file_path: Path):
+        ''' Stop keeping track of a complete track whose file was deleted on
+        purpose, so that the album still checks out without it
+
+        Args:
+            file_path (Path): The path to the track's file
+        '''
+        with self.lock:
+            self.tracks = {
+                video_id: track for video_id, track in self.tracks.items()
+                if track.get('file') != Path(file_path).name
+            }
+        self.save()
+
+    def check_track(self, track: dict) -> str:
+        ''' Check that a complete track's file has not changed since it was
+        downloaded. Files are not hashed when they complete, so a file that
+        was touched is only hashed if it's from a state file that has its
+        SHA-256 digest
+
+        Args:
+            track (dict): The track's state
+
+        Returns:
+            (str): What's wrong with the file, or None if it checks out
+        '''
+        file_path = self.album_dir / track['file']
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            return 'the file is missing'
+        if stat.st_size != track['size']:
+            return 'expected {0} bytes, found {1}'.format(track['size'], stat.st_size)
+        if stat.st_mtime_ns == track['mtime_ns']:
+            return None
+        if 'sha256' not in track or file_digest(file_path) != track['sha256']:
+            return 'the file was modified'
+        with self.lock:
+            track['mtime_ns'] = stat.st_mtime_ns
+        return None
+
+    def check(self):
+        ''' Check that every track in the album is complete and checks out,
+        before the album is imported
+
+        Raises:
+            DownloadError: If any track is not complete or does not check out
+        '''
+        with self.lock:
+            tracks = list(self.tracks.values())
+        problems = []
+        for track in tracks:
+            if track['status'] != COMPLETE:
+                problems.append('{0}: not finished downloading'.format(
+                    track.get('title') or track.get('part')
+                ))
+                continue
+            problem = self.check_track(track)
+            if problem is not None:
+                problems.append('{0}: {1}'.format(track['file'], problem))
+        if problems:
+            raise DownloadError('{0} track(s) in {1} did not check out: {2}'.format(
+                len(problems), str(self.album_dir), '; '.join(problems)
+            ))
+
+    def remove(self):
+        ''' Delete the state file once the album no longer needs to be resumed
+        '''
+        with self.lock:
+            if self.state_path.exists():
+                self.state_path.unlink()
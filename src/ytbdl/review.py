@@ -0,0 +1,124 @@
+#pylint: disable=consider-using-f-string
+from pathlib import Path
+from typing import NamedTuple
+import json
+import os
+import time
+
+from ytbdl import config
+from ytbdl.database import Database
+
+
+# One review queue is opened per process
+_REVIEW_QUEUE = None
+
+
+class ReviewEntry(NamedTuple):
+    ''' An album that could not be imported without asking the user
+    '''
+    path: str
+    reason: str
+    artist: str
+    album: str
+    candidates: list
+    added: float
+
+
+def get_review_queue_path() -> str:
+    ''' Get the path to the review queue database. This path may or may not
+    exist
+
+    Returns:
+        (str): A path to the review queue database in the config directory
+    '''
+    return os.path.join(config.config_dir(), 'review.db')
+
+
+def open_review_queue() -> 'ReviewQueue':
+    ''' Open the review queue, or get it if it was already opened in this
+    process
+
+    Returns:
+        (ReviewQueue): The review queue
+    '''
+    global _REVIEW_QUEUE #pylint: disable=global-statement
+    if _REVIEW_QUEUE is None:
+        _REVIEW_QUEUE = ReviewQueue(get_review_queue_path())
+    return _REVIEW_QUEUE
+
+
+class ReviewQueue:
+    ''' A queue of albums that were downloaded, but that were left where they
+    were downloaded instead of being imported, because beets could not find a
+    match for them with high enough confidence. The candidates beets found are
+    kept, so that the user can see them when reviewing the album later.
+
+    Args:
+        db_path (str): The path to the SQLite database. It is created if it
+            does not exist
+    '''
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.database = Database(db_path)
+        with self.database.transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS review ('
+                'path TEXT PRIMARY KEY, '
+                'reason TEXT NOT NULL, '
+                'artist TEXT, '
+                'album TEXT, '
+                'candidates TEXT NOT NULL, '
+                'added REAL NOT NULL)'
+            )
+
+    def add(self, album_dir: Path, reason: str, artist: str = None,
+            album: str = None, candidates: list = None):
+        ''' Add an album to the queue, replacing it if it's already queued
+
+        Args:
+            album_dir (Path): The directory the album was downloaded to
+            reason (str): Why the album needs to be reviewed
+            artist (str): The artist beets found in the album's files
+            album (str): The album name beets found in the album's files
+            candidates (list): A list of dicts describing each match beets
+                found for the album
+        '''
+        with self.database.transaction() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO review '
+                '(path, reason, artist, album, candidates, added) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (str(Path(album_dir).resolve()), reason, artist, album,
+                 json.dumps(candidates or []), time.time())
+            )
+
+    def entries(self) -> list:
+        ''' Get every album in the queue, oldest first
+
+        Returns:
+            (list): A list of ReviewEntry objects
+        '''
+        rows = self.database.fetchall(
+            'SELECT path, reason, artist, album, candidates, added FROM review '
+            'ORDER BY added'
+        )
+        return [
+            ReviewEntry(path, reason, artist, album, json.loads(candidates), added)
+            for path, reason, artist, album, candidates, added in rows
+        ]
+
+    def remove(self, album_dir: Path):
+        ''' Remove an album from the queue
+
+        Args:
+            album_dir (Path): The directory the album was downloaded to
+        '''
+        with self.database.transaction() as connection:
+            connection.execute(
+                'DELETE FROM review WHERE path = ?',
+                (str(Path(album_dir).resolve()),)
+            )
+
+    def close(self):
+        self.database.close()
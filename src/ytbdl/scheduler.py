@@ -0,0 +1,310 @@
+#pylint: disable=consider-using-f-string
+from urllib.parse import urlsplit
+import random
+import threading
+import time
+
+import confuse
+
+from ytbdl import config
+from ytbdl.exceptions import ConfigurationError
+from ytbdl.metrics import get_metrics
+
+
+# Responses with these statuses mean the host wants fewer requests
+THROTTLE_STATUSES = (429, 503)
+
+# The rate_limit options used when they're not in the config
+DEFAULT_SCHEDULER_OPTIONS = {
+    'requests_per_second': 10.0,
+    'burst': 20,
+    'track_retries': 3,
+    'backoff': 2.0,
+    'max_backoff': 60.0,
+}
+
+# What each rate_limit option must be, and a check for it. Rate limiting is
+# turned off with "rate_limit: no" rather than a rate of 0
+SCHEDULER_OPTION_CHECKS = {
+    'requests_per_second': ('more than 0', lambda value: value > 0),
+    'burst': ('at least 1', lambda value: value >= 1),
+    'track_retries': ('a whole number of at least 0',
+                      lambda value: value >= 0 and value == int(value)),
+    'backoff': ('at least 0', lambda value: value >= 0),
+    'max_backoff': ('at least 0', lambda value: value >= 0),
+}
+
+# A host is never slowed down below this fraction of the configured rate
+MINIMUM_RATE_FRACTION = 1 / 64
+
+# One scheduler is used per process
+_SCHEDULER = None
+_RATE_SHARE = 1.0
+
+
+def get_scheduler_options() -> dict:
+    ''' Get the rate_limit options from the config. Rate limiting is on
+    unless the rate_limit option is set to "no"
+
+    Returns:
+        (dict): The options, or None if rate limiting is turned off
+
+    Raises:
+        ConfigurationError: If an option is not a number, or is out of range
+    '''
+    options = dict(DEFAULT_SCHEDULER_OPTIONS)
+    if 'rate_limit' not in config:
+        return options
+    try:
+        if config['rate_limit'].get() is False:
+            return None
+        for key in options:
+            if key in config['rate_limit']:
+                options[key] = config['rate_limit'][key].as_number()
+    except confuse.ConfigError as exc:
+        raise ConfigurationError(
+            'The rate_limit config option is invalid: {0}'.format(str(exc))
+        ) from exc
+    for key, (requirement, check) in SCHEDULER_OPTION_CHECKS.items():
+        if not check(options[key]):
+            raise ConfigurationError(
+                'The rate_limit config option is invalid: {0} must be {1}, not '
+                '{2}'.format(key, requirement, options[key])
+            )
+    return options
+
+
+def set_rate_share(share: float):
+    ''' Set the fraction of the configured request rate this process may use,
+    e.g. when several processes download at the same time. Has no effect once
+    the scheduler is opened
+
+    Args:
+        share (float): A fraction between 0 and 1
+    '''
+    global _RATE_SHARE #pylint: disable=global-statement
+    _RATE_SHARE = min(1.0, max(share, MINIMUM_RATE_FRACTION))
+
+
+def open_scheduler() -> 'DownloadScheduler':
+    ''' Create the download scheduler from the config, or get it if it was
+    already created in this process
+
+    Returns:
+        (DownloadScheduler): The scheduler, or None if rate limiting is off
+    '''
+    global _SCHEDULER #pylint: disable=global-statement
+    if _SCHEDULER is None:
+        options = get_scheduler_options()
+        if options is None:
+            return None
+        _SCHEDULER = DownloadScheduler(
+            requests_per_second=options['requests_per_second'] * _RATE_SHARE,
+            burst=max(1, options['burst'] * _RATE_SHARE),
+            track_retries=int(options['track_retries']),
+            backoff=options['backoff'],
+            max_backoff=options['max_backoff'],
+        )
+    return _SCHEDULER
+
+
+def backoff_delay(attempt: int, backoff: float, max_backoff: float) -> float:
+    ''' Get how long to wait before a retry, growing exponentially with each
+    attempt. The delay is picked at random up to the exponential limit (full
+    jitter), so that retries from many downloads don't all happen at once
+
+    Args:
+        attempt (int): The number of attempts that have failed, minus one
+        backoff (float): The limit for the first retry in seconds
+        max_backoff (float): The most the limit grows to in seconds
+
+    Returns:
+        (float): The number of seconds to wait
+    '''
+    return random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+
+
+def is_transient(exc: BaseException) -> bool:
+    ''' Determine whether a failed request might work if it is retried: it
+    was throttled, the server had an error, or the network failed
+
+    Args:
+        exc (BaseException): The error the request failed with
+
+    Returns:
+        (bool): True if retrying might work
+    '''
+    #pylint: disable=import-outside-toplevel
+    from yt_dlp.networking.exceptions import HTTPError, TransportError
+
+    if isinstance(exc, HTTPError):
+        return exc.status in THROTTLE_STATUSES or exc.status >= 500
+    return isinstance(exc, TransportError)
+
+
+class TokenBucket:
+    ''' Limits the rate of requests to one host. Requests take tokens from the
+    bucket, which refills at the current rate up to its capacity, so short
+    bursts are allowed.
+
+    The rate adapts to the host: it's halved whenever the host throttles a
+    request, and recovers a little with every request that isn't throttled, up
+    to the configured rate.
+
+    Args:
+        rate (float): The most requests per second
+        capacity (float): The most requests that can be made at once
+    '''
+
+    def __init__(self, rate: float, capacity: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> float:
+        ''' Take a token, waiting until one is available
+
+        Returns:
+            (float): The number of seconds spent waiting
+        '''
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def slow_down(self, retry_after: float = None) -> float:
+        ''' Halve the rate after the host throttled a request, and stop
+        requests until the host says they may start again
+
+        Args:
+            retry_after (float): The number of seconds the host asked to wait
+
+        Returns:
+            (float): The new rate
+        '''
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.max_rate * MINIMUM_RATE_FRACTION, self.rate / 2)
+            self.tokens = 0
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            return self.rate
+
+    def speed_up(self):
+        ''' Recover some of the rate after a request that was not throttled
+        '''
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 32)
+
+
+class DownloadScheduler:
+    ''' Decides when requests are made and when failed tracks are retried.
+    Every download in the process shares the scheduler, so albums downloaded
+    one after another, or at the same time, share each host's rate limit.
+
+    Args:
+        requests_per_second (float): The most requests per second to any one
+            host
+        burst (float): The most requests that can be made to a host at once
+        track_retries (int): The most times a track is retried after it failed
+            with an error that might go away
+        backoff (float): The longest wait before the first retry of a track,
+            in seconds. The limit doubles with each retry
+        max_backoff (float): The longest wait before any retry, in seconds
+    '''
+
+    def __init__(self, requests_per_second: float, burst: float, track_retries: int,
+                 backoff: float, max_backoff: float):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.track_retries = track_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, url: str) -> TokenBucket:
+        ''' Get the token bucket for the host of a URL
+
+        Args:
+            url (str): The URL being requested
+
+        Returns:
+            (TokenBucket): The host's bucket
+        '''
+        host = urlsplit(url).netloc.lower()
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.requests_per_second, self.burst)
+            return self.buckets[host]
+
+    def before_request(self, url: str):
+        ''' Wait until a request can be made to the host of a URL
+
+        Args:
+            url (str): The URL being requested
+        '''
+        bucket = self.get_bucket(url)
+        started = time.time()
+        waited = bucket.acquire()
+        if waited:
+            get_metrics().add_phase('rate_limit_wait', started, waited,
+                                    host=urlsplit(url).netloc, rate=bucket.rate)
+
+    def after_response(self, url: str, status: int, retry_after=None) -> float:
+        ''' Adapt the host's rate to the response to a request
+
+        Args:
+            url (str): The URL that was requested
+            status (int): The status of the response
+            retry_after: The value of the response's Retry-After header
+
+        Returns:
+            (float): The host's new rate if the request was throttled, or None
+        '''
+        bucket = self.get_bucket(url)
+        if status not in THROTTLE_STATUSES:
+            bucket.speed_up()
+            return None
+        try:
+            retry_after = min(self.max_backoff, float(retry_after)) if retry_after else None
+        except ValueError:
+            # An HTTP date, which hosts rarely send
+            retry_after = None
+        rate = bucket.slow_down(retry_after)
+        metrics = get_metrics()
+        metrics.increment('throttled_requests')
+        metrics.add_phase('throttle', time.time(), retry_after or 0.0,
+                          host=urlsplit(url).netloc, rate=rate)
+        return rate
+
+    def retry_delay(self, attempt: int) -> float:
+        ''' Get how long to wait before retrying a track
+
+        Args:
+            attempt (int): The number of attempts that have failed, minus one
+
+        Returns:
+            (float): The number of seconds to wait
+        '''
+        return backoff_delay(attempt, self.backoff, self.max_backoff)
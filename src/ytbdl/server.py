@@ -0,0 +1,323 @@
+#pylint: disable=consider-using-f-string
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import json
+import logging
+import os
+import secrets
+import threading
+
+from ytbdl import config, jobs
+from ytbdl.exceptions import ServerError
+
+
+# The header every request to the server must have the server's token in
+TOKEN_HEADER = 'X-Ytbdl-Token'
+
+# How long clients wait for the server to respond, in seconds
+CLIENT_TIMEOUT = 5
+
+
+def get_server_file_path() -> str:
+    ''' Get the path to the file a running server writes its address and token
+    to. This path may or may not exist
+
+    Returns:
+        (str): A path to the server file in the config directory
+    '''
+    return os.path.join(config.config_dir(), 'server.json')
+
+
+def find_server() -> 'JobClient':
+    ''' Get a client for the server running for this config, if there is one
+
+    Returns:
+        (JobClient): A client for the server, or None if no server is running
+    '''
+    try:
+        with open(get_server_file_path(), 'r', encoding='utf-8') as server_file:
+            server = json.load(server_file)
+        client = JobClient(server['port'], server['token'])
+    except (OSError, ValueError, KeyError):
+        return None
+    try:
+        client.jobs(jobs.RUNNING)
+    except ServerError:
+        # The server stopped without removing its file
+        return None
+    return client
+
+
+class JobServer(ThreadingHTTPServer):
+    ''' Serves an API to queue, list, and cancel jobs over HTTP on localhost,
+    in a background thread. Every request needs the token written to the
+    server file, which only the user can read.
+
+    The API uses JSON:
+
+    - :code:`GET /jobs[?status=...]` lists the jobs
+    - :code:`POST /jobs` queues a job, with the artist, album, urls,
+      ytdl_args, and directory to create the album folder in
+    - :code:`GET /jobs/<id>` gets a job
+    - :code:`DELETE /jobs/<id>` cancels a job
+
+    Args:
+        job_queue (JobQueue): The queue to serve
+        cancel_running: A function taking the ID of a running job, which
+            cancels it
+        port (int): The port to listen on, or 0 to use any free port
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, job_queue, cancel_running, port: int = 0):
+        super().__init__(('127.0.0.1', port), JobRequestHandler)
+        self.job_queue = job_queue
+        self.cancel_running = cancel_running
+        self.token = secrets.token_urlsafe(24)
+        self.job_added = threading.Event()
+        self.thread = None
+
+    def start(self):
+        ''' Serve in a background thread, and write the server file so that
+        clients can find the server
+        '''
+        self.thread = threading.Thread(target=self.serve_forever, name='server',
+                                       daemon=True)
+        self.thread.start()
+        server_file_path = get_server_file_path()
+        file_descriptor = os.open(server_file_path,
+                                  os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as server_file:
+            json.dump({
+                'pid': os.getpid(),
+                'port': self.server_port,
+                'token': self.token,
+            }, server_file)
+
+    def stop(self):
+        ''' Stop serving, and remove the server file if it's still this
+        server's
+        '''
+        self.shutdown()
+        self.server_close()
+        server_file_path = get_server_file_path()
+        try:
+            with open(server_file_path, 'r', encoding='utf-8') as server_file:
+                if json.load(server_file).get('token') == self.token:
+                    os.remove(server_file_path)
+        except (OSError, ValueError):
+            pass
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    ''' Handles the requests to a JobServer
+    '''
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        path, query = self.route()
+        if path == ['jobs']:
+            status = (query.get('status') or [None])[0]
+            self.send_json(200, [job._asdict() for job in self.server.job_queue.jobs(status)])
+        elif len(path) == 2 and path[0] == 'jobs' and path[1].isdigit():
+            job = self.server.job_queue.get(int(path[1]))
+            if job is None:
+                self.send_json(404, {'error': 'No job {0}'.format(path[1])})
+            else:
+                self.send_json(200, job._asdict())
+        else:
+            self.send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        path, _ = self.route()
+        if path != ['jobs']:
+            self.send_json(404, {'error': 'Not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}')
+            job = self.server.job_queue.add(**self.validate_job(body))
+        except (ValueError, TypeError) as exc:
+            self.send_json(400, {'error': str(exc)})
+            return
+        self.server.job_added.set()
+        self.send_json(201, job._asdict())
+
+    def do_DELETE(self):
+        if not self.authorized():
+            return
+        path, _ = self.route()
+        if len(path) != 2 or path[0] != 'jobs' or not path[1].isdigit():
+            self.send_json(404, {'error': 'Not found'})
+            return
+        job = self.server.job_queue.cancel(int(path[1]))
+        if job is None:
+            self.send_json(404, {'error': 'No job {0}'.format(path[1])})
+            return
+        if job.status == jobs.RUNNING:
+            self.server.cancel_running(job.id)
+            self.send_json(202, job._asdict())
+            return
+        self.send_json(200, job._asdict())
+
+    @staticmethod
+    def validate_job(body: dict) -> dict:
+        ''' Check that a job submitted to the server is complete
+
+        Args:
+            body (dict): The job
+
+        Returns:
+            (dict): The arguments to add the job to the queue with
+
+        Raises:
+            ValueError: If the job is not valid
+        '''
+        if not isinstance(body, dict):
+            raise ValueError('The job must be an object')
+        for key in ('artist', 'album', 'directory'):
+            if not isinstance(body.get(key), str) or not body[key]:
+                raise ValueError('The job\'s {0} must be a non-empty string'.format(key))
+        if not os.path.isabs(body['directory']):
+            raise ValueError('The job\'s directory must be an absolute path')
+        urls = body.get('urls')
+        if not isinstance(urls, list) or not urls or \
+                not all(isinstance(url, str) for url in urls):
+            raise ValueError('The job\'s urls must be a non-empty list of strings')
+        ytdl_args = body.get('ytdl_args') or []
+        if not isinstance(ytdl_args, list) or \
+                not all(isinstance(arg, str) for arg in ytdl_args):
+            raise ValueError('The job\'s ytdl_args must be a list of strings')
+        return {
+            'artist': body['artist'],
+            'album': body['album'],
+            'urls': urls,
+            'ytdl_args': ytdl_args,
+            'directory': body['directory'],
+        }
+
+    def authorized(self) -> bool:
+        token = self.headers.get(TOKEN_HEADER) or ''
+        if secrets.compare_digest(token, self.server.token):
+            return True
+        self.send_json(403, {'error': 'Missing or incorrect {0} header'.format(TOKEN_HEADER)})
+        return False
+
+    def route(self) -> tuple:
+        parts = urlsplit(self.path)
+        return [part for part in parts.path.split('/') if part], parse_qs(parts.query)
+
+    def send_json(self, status: int, value):
+        body = json.dumps(value).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): #pylint: disable=redefined-builtin
+        logging.getLogger('serve').debug(msg=format % args)
+
+
+class JobClient:
+    ''' A client for a JobServer running on localhost
+
+    Args:
+        port (int): The port the server listens on
+        token (str): The server's token
+    '''
+
+    def __init__(self, port: int, token: str):
+        self.base_url = 'http://127.0.0.1:{0}'.format(port)
+        self.token = token
+
+    def submit(self, artist: str, album: str, urls: list, ytdl_args: list,
+               directory: str) -> dict:
+        ''' Queue an album to be downloaded and tagged by the server
+
+        Args:
+            artist (str): The name of the artist
+            album (str): The name of the album
+            urls (list): One or more URLs to download audio from
+            ytdl_args (list): Extra arguments to pass to yt-dlp
+            directory (str): The directory to create the album folder in
+
+        Returns:
+            (dict): The job that was queued
+        '''
+        return self.request('POST', '/jobs', {
+            'artist': artist,
+            'album': album,
+            'urls': list(urls),
+            'ytdl_args': list(ytdl_args),
+            'directory': os.path.abspath(directory),
+        })
+
+    def jobs(self, status: str = None) -> list:
+        ''' Get the server's jobs
+
+        Args:
+            status (str): Only get jobs with this status
+
+        Returns:
+            (list): A list of job dicts
+        '''
+        return self.request('GET', '/jobs' if status is None else
+                            '/jobs?status={0}'.format(status))
+
+    def cancel(self, job_id: int) -> dict:
+        ''' Cancel a job. A running job is stopped at the next chance
+
+        Args:
+            job_id (int): The ID of the job
+
+        Returns:
+            (dict): The job
+        '''
+        return self.request('DELETE', '/jobs/{0}'.format(job_id))
+
+    def request(self, method: str, path: str, body=None):
+        ''' Make a request to the server
+
+        Args:
+            method (str): The HTTP method
+            path (str): The path to request
+            body: An optional value to send as JSON
+
+        Returns:
+            The JSON value the server responded with
+
+        Raises:
+            ServerError: If the server could not be reached, or responded with
+                an error
+        '''
+        #pylint: disable=import-outside-toplevel
+        from urllib.error import HTTPError, URLError
+        from urllib.request import Request, build_opener, ProxyHandler
+
+        data = None if body is None else json.dumps(body).encode('utf-8')
+        request = Request(self.base_url + path, data=data, method=method, headers={
+            TOKEN_HEADER: self.token,
+            'Content-Type': 'application/json',
+        })
+        # The server is local, proxies would get in the way
+        opener = build_opener(ProxyHandler({}))
+        try:
+            with opener.open(request, timeout=CLIENT_TIMEOUT) as response:
+                return json.loads(response.read())
+        except HTTPError as exc:
+            try:
+                message = json.loads(exc.read()).get('error')
+            except ValueError:
+                message = exc.reason
+            raise ServerError('The ytbdl server responded with {0}: {1}'.format(
+                exc.code, message
+            )) from exc
+        except (URLError, OSError, ValueError) as exc:
+            raise ServerError('Could not reach the ytbdl server: {0}'.format(
+                str(exc)
+            )) from exc
@@ -0,0 +1,121 @@
+#pylint: disable=consider-using-f-string
+import re
+
+
+def parse_items(items) -> list:
+    ''' Parse the positions of the entries in a playlist that belong to an
+    album, e.g. "1-10,12" or "13-" for the 13th entry to the end. Positions
+    start at 1
+
+    Args:
+        items: A string of comma separated positions and ranges, a single
+            position, or a list of positions and ranges
+
+    Returns:
+        (list): A list of (start, end) tuples, where end is None if the range
+            continues to the end of the playlist
+
+    Raises:
+        ValueError: If the items are not valid
+    '''
+    if isinstance(items, bool):
+        raise ValueError('"items" must be positions in the playlist, like "1-10,12"')
+    if isinstance(items, int):
+        items = [items]
+    elif isinstance(items, str):
+        items = items.split(',')
+    elif not isinstance(items, list) or not items:
+        raise ValueError('"items" must be positions in the playlist, like "1-10,12"')
+
+    ranges = []
+    for item in items:
+        match = re.fullmatch(r'\s*(\d+)\s*(?:(-)\s*(\d*)\s*)?', str(item))
+        if match is None or int(match.group(1)) < 1:
+            raise ValueError('"{0}" is not a position or range in the playlist'.format(item))
+        start = int(match.group(1))
+        if match.group(2) is None:
+            end = start
+        else:
+            end = int(match.group(3)) if match.group(3) else None
+        if end is not None and end < start:
+            raise ValueError('The range "{0}" ends before it starts'.format(item))
+        ranges.append((start, end))
+    return ranges
+
+
+def parse_match(match: str) -> str:
+    ''' Check the regular expression that the titles of the entries in an
+    album match
+
+    Args:
+        match (str): The regular expression
+
+    Returns:
+        (str): The regular expression
+
+    Raises:
+        ValueError: If the regular expression is not valid
+    '''
+    if not isinstance(match, str) or not match:
+        raise ValueError('"match" must be a regular expression')
+    try:
+        re.compile(match)
+    except re.error as exc:
+        raise ValueError('"match" is not a valid regular expression: {0}'.format(
+            str(exc)
+        )) from exc
+    return match
+
+
+def selects(job, position: int, entry: dict) -> bool:
+    ''' Determine whether an entry of a playlist belongs to the album of a job
+    that is split from the playlist
+
+    Args:
+        job (AlbumJob): A job with items, a match, or both
+        position (int): The position of the entry in the playlist, from 1
+        entry (dict): The entry
+
+    Returns:
+        (bool): True if the entry is in the job's positions, and its title
+            matches the job's regular expression
+    '''
+    if job.items is not None and not any(
+            start <= position and (end is None or position <= end)
+            for start, end in job.items):
+        return False
+    if job.match is not None:
+        title = entry.get('title') if isinstance(entry, dict) else None
+        if not title or re.search(job.match, title) is None:
+            return False
+    return True
+
+
+def split_playlist(info: dict, jobs: list, logger) -> list:
+    ''' Divide the entries of a resolved playlist between the albums split from
+    it. Each entry goes to the first album that selects it, in the order of
+    the jobs, so an album with the items "1-" can come last to catch the rest.
+    Entries no album selects are not downloaded
+
+    Args:
+        info (dict): The resolved playlist, see DownloadEngine.resolve
+        jobs (list): The AlbumJobs split from the playlist
+        logger: A logging object
+
+    Returns:
+        (list): A playlist info dict for each job, in the same order, with
+            only the entries of that job's album
+    '''
+    groups = [[] for _ in jobs]
+    unselected = 0
+    for position, entry in enumerate(info['entries'], start=1):
+        for group, job in zip(groups, jobs):
+            if selects(job, position, entry):
+                group.append(entry)
+                break
+        else:
+            unselected += 1
+    if unselected:
+        logger.warning(msg='{0} video(s) in {1} are not in any album, and will not be '
+                       'downloaded'.format(unselected, jobs[0].urls[0]))
+    return [dict(info, entries=group) for group in groups]
@@ -0,0 +1,113 @@
+#pylint: disable=consider-using-f-string
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from mediafile import MediaFile, UnreadableFileError
+
+from ytbdl.beetsplug import tagsfrompath as frompath
+from ytbdl.beetsplug.fromyoutubetitle import clean_title
+from ytbdl.metrics import timed
+
+
+@timed('prepare')
+def prepare_track(file_path: Path, youtube_title: str = None) -> bool:
+    ''' Tag a downloaded file with the artist, album, and title that the
+    fromdirname and fromyoutubetitle plugins would give it, so that the plugins
+    have nothing left to do when the album is imported. Tags that the file
+    already has are left alone, as the plugins do.
+
+    Args:
+        file_path (Path): The path to the downloaded file, in an Artist/Album
+            folder
+        youtube_title (str): The title of the video the file was downloaded
+            from. The file name is used if it's not given
+
+    Returns:
+        (bool): True if any tags were written
+    '''
+    media_file = MediaFile(str(file_path))
+    changed = False
+    if not media_file.album:
+        media_file.album = frompath.get_album_name(file_path)
+        changed = True
+    if not media_file.artist:
+        media_file.artist = frompath.get_artist_name(file_path)
+        changed = True
+    if not media_file.title:
+        media_file.title = clean_title(
+            youtube_title or frompath.get_title(file_path),
+            frompath.get_artist_name(file_path),
+            frompath.get_album_name(file_path),
+        )
+        changed = True
+    if changed:
+        media_file.save()
+    return changed
+
+
+class TrackPreparer:
+    ''' Prepares each track of an album for import as soon as it is finished
+    downloading, in background threads, so that the per-track work overlaps
+    with the rest of the album's downloads. Only the album-level work is left
+    for beets to do once the download finishes.
+
+    Use prepare as a DownloadEngine file hook, and call wait before importing
+    the album. A track that can't be prepared is left for the plugins to tag
+    when it's imported.
+
+    Args:
+        logger: A logging object
+        max_workers (int): The maximum number of tracks to prepare at once
+        on_prepared: An optional function to call with the path and the
+            yt-dlp info dict of each track once it's prepared, whether or not
+            it could be tagged
+    '''
+
+    def __init__(self, logger, max_workers: int = 2, on_prepared=None):
+        self.logger = logger
+        self.on_prepared = on_prepared
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='prepare')
+        self.futures = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def prepare(self, file_path: Path, info_dict: dict):
+        ''' Queue a downloaded file to be prepared for import
+
+        Args:
+            file_path (Path): The path to the downloaded file
+            info_dict (dict): The yt-dlp info dict of the video the file was
+                downloaded from
+        '''
+        future = self.executor.submit(self._prepare, file_path, dict(info_dict))
+        self.futures[future] = file_path
+
+    def _prepare(self, file_path: Path, info_dict: dict) -> bool:
+        try:
+            return prepare_track(file_path, info_dict.get('title'))
+        finally:
+            if self.on_prepared is not None:
+                self.on_prepared(file_path, info_dict)
+
+    def wait(self):
+        ''' Wait for every queued file to be prepared
+        '''
+        for future, file_path in self.futures.items():
+            try:
+                if future.result():
+                    self.logger.debug(msg='Tagged {0} while downloading'.format(
+                        str(file_path)
+                    ))
+            except (UnreadableFileError, OSError) as exc:
+                self.logger.debug(msg='Could not tag {0} while downloading: {1}'.format(
+                    str(file_path), str(exc)
+                ))
+        self.futures = {}
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,198 @@
+#pylint: disable=consider-using-f-string
+from typing import NamedTuple
+import json
+import os
+import time
+
+from ytbdl import config
+from ytbdl.database import Database
+from ytbdl.metadata import entry_keys
+
+
+# One sync store is opened per process
+_SYNC_STORE = None
+
+
+class SyncedAlbum(NamedTuple):
+    ''' An album that is kept up to date with the playlists it was downloaded
+    from
+    '''
+    id: int
+    artist: str
+    album: str
+    urls: list
+    ytdl_args: list
+    directory: str
+    added: float
+    synced: float
+
+
+def get_sync_store_path() -> str:
+    ''' Get the path to the sync database. This path may or may not exist
+
+    Returns:
+        (str): A path to the sync database in the config directory
+    '''
+    return os.path.join(config.config_dir(), 'sync.db')
+
+
+def open_sync_store() -> 'SyncStore':
+    ''' Open the sync store, or get it if it was already opened in this process
+
+    Returns:
+        (SyncStore): The sync store
+    '''
+    global _SYNC_STORE #pylint: disable=global-statement
+    if _SYNC_STORE is None:
+        _SYNC_STORE = SyncStore(get_sync_store_path())
+    return _SYNC_STORE
+
+
+class SyncStore:
+    ''' Keeps a snapshot of the playlists each synced album was downloaded
+    from, so that only the videos added to the playlists since the last sync
+    are downloaded.
+
+    Args:
+        db_path (str): The path to the SQLite database. It is created if it
+            does not exist
+    '''
+
+    COLUMNS = 'id, artist, album, urls, ytdl_args, directory, added, synced'
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.database = Database(db_path)
+        with self.database.transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS albums ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'artist TEXT NOT NULL, '
+                'album TEXT NOT NULL, '
+                'urls TEXT NOT NULL, '
+                'ytdl_args TEXT NOT NULL, '
+                'directory TEXT NOT NULL, '
+                'added REAL NOT NULL, '
+                'synced REAL, '
+                'UNIQUE (artist, album, directory))'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'album_id INTEGER NOT NULL, '
+                'key TEXT NOT NULL, '
+                'title TEXT, '
+                'added REAL NOT NULL, '
+                'PRIMARY KEY (album_id, key))'
+            )
+
+    @staticmethod
+    def _album(row) -> SyncedAlbum:
+        album_id, artist, album, urls, ytdl_args, directory, added, synced = row
+        return SyncedAlbum(album_id, artist, album, json.loads(urls),
+                           json.loads(ytdl_args), directory, added, synced)
+
+    def track(self, artist: str, album: str, urls: list, ytdl_args: list,
+              directory: str) -> SyncedAlbum:
+        ''' Start syncing an album, or change the playlists and yt-dlp
+        arguments of an album that is already synced
+
+        Args:
+            artist (str): The name of the artist
+            album (str): The name of the album
+            urls (list): The URLs of the playlists to sync the album with
+            ytdl_args (list): Extra arguments to pass to yt-dlp
+            directory (str): The directory the artist folder is in
+
+        Returns:
+            (SyncedAlbum): The album
+        '''
+        with self.database.transaction() as connection:
+            connection.execute(
+                'INSERT INTO albums (artist, album, urls, ytdl_args, directory, added) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (artist, album, directory) '
+                'DO UPDATE SET urls = excluded.urls, ytdl_args = excluded.ytdl_args',
+                (artist, album, json.dumps(list(urls)), json.dumps(list(ytdl_args)),
+                 str(directory), time.time())
+            )
+        return self.get(artist, album, directory)
+
+    def get(self, artist: str, album: str, directory: str) -> SyncedAlbum:
+        ''' Get a synced album
+
+        Args:
+            artist (str): The name of the artist
+            album (str): The name of the album
+            directory (str): The directory the artist folder is in
+
+        Returns:
+            (SyncedAlbum): The album, or None if it is not synced
+        '''
+        row = self.database.fetchone(
+            'SELECT {0} FROM albums WHERE artist = ? AND album = ? AND '
+            'directory = ?'.format(self.COLUMNS), (artist, album, str(directory))
+        )
+        return None if row is None else self._album(row)
+
+    def albums(self) -> list:
+        ''' Get every synced album, in the order they were added
+
+        Returns:
+            (list): A list of SyncedAlbum objects
+        '''
+        rows = self.database.fetchall(
+            'SELECT {0} FROM albums ORDER BY id'.format(self.COLUMNS)
+        )
+        return [self._album(row) for row in rows]
+
+    def new_entries(self, album: SyncedAlbum, entries: list) -> list:
+        ''' Find the entries of a playlist that are not in the album's snapshot
+
+        Args:
+            album (SyncedAlbum): The album
+            entries (list): The flat entries of one of the album's playlists
+
+        Returns:
+            (list): The entries that were added since the last sync
+        '''
+        known = {row[0] for row in self.database.fetchall(
+            'SELECT key FROM entries WHERE album_id = ?', (album.id,)
+        )}
+        return [
+            entry for entry in entries
+            if isinstance(entry, dict) and known.isdisjoint(entry_keys(entry))
+        ]
+
+    def record(self, album: SyncedAlbum, entries: list):
+        ''' Add entries to the album's snapshot, so that they're not
+        downloaded by the next sync, and record when the album was synced
+
+        Args:
+            album (SyncedAlbum): The album
+            entries (list): The flat playlist entries that were downloaded
+        '''
+        now = time.time()
+        rows = [
+            (album.id, key, entry.get('title'), now)
+            for entry in entries for key in entry_keys(entry)
+        ]
+        with self.database.transaction() as connection:
+            connection.executemany(
+                'INSERT OR IGNORE INTO entries (album_id, key, title, added) '
+                'VALUES (?, ?, ?, ?)', rows
+            )
+            connection.execute(
+                'UPDATE albums SET synced = ? WHERE id = ?', (now, album.id)
+            )
+
+    def untrack(self, album: SyncedAlbum):
+        ''' Stop syncing an album, and forget its snapshot
+
+        Args:
+            album (SyncedAlbum): The album
+        '''
+        with self.database.transaction() as connection:
+            connection.execute('DELETE FROM entries WHERE album_id = ?', (album.id,))
+            connection.execute('DELETE FROM albums WHERE id = ?', (album.id,))
+
+    def close(self):
+        self.database.close()
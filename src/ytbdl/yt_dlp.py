@@ -1,104 +1,1135 @@
 #pylint: disable=consider-using-f-string
+from contextlib import ExitStack, nullcontext
 from pathlib import Path
-from subprocess import CalledProcessError
-import shlex
-import sys
+from urllib.parse import urlsplit
+import shutil
+import time
 
-from yt_dlp import main as yt_dlp_main
+from yt_dlp import YoutubeDL, parse_options
+from yt_dlp.networking.exceptions import HTTPError, TransportError
+from yt_dlp.postprocessor.common import PostProcessor
+from yt_dlp.utils import (
+    DownloadCancelled, DownloadError as YtDlpDownloadError, PlaylistEntries, ReExtractInfo,
+    YoutubeDLError
+)
 
-class SysExitSignal(Exception):
-    ''' Signals a sys.exit() call
-    '''
-    def __init__(self, exit_code, *args, **kwargs):
-        self.exit_code = exit_code
-        super().__init__(*args, **kwargs)
+from ytbdl.dedupe import Deduplicator, get_dedupe_options
+from ytbdl.exceptions import ConfigurationError, DownloadError
+from ytbdl.formats import (
+    MANIFEST_SKIP_ARGS, close_format_cache, merge_extractor_args, open_format_cache,
+    uploader_key
+)
+from ytbdl.metadata import entry_keys, open_metadata_cache
+from ytbdl.metrics import get_metrics
+from ytbdl.postprocess import (
+    close_postprocess_pool, conversion_params, extract_audio, get_postprocess_pool,
+    rewrites_file, split_extract_audio
+)
+from ytbdl.resources import close_resources, estimate_size, open_resources
+from ytbdl.scheduler import is_transient, open_scheduler
+
+
+# Files are named after the title of the video they were extracted from. The
+# album directory is set with the "home" path for each download
+OUTPUT_TEMPLATE = '%(title)s.%(ext)s'
+
+# The kinds of retries yt-dlp accepts a --retry-sleep for, each of which is
+# counted in the metrics
+RETRY_KINDS = ('http', 'fragment', 'file_access', 'extractor')
+
+# yt-dlp fixes up the files downloaded with these protocols, or in these
+# containers, e.g. DASH m4a files and HLS streams with MPEG-TS in them
+FIXUP_PROTOCOLS = ('http_dash_segments', 'm3u8', 'm3u8_native')
+FIXUP_CONTAINERS = ('m4a_dash', 'mp4_dash')
 
+# Engines that have already been created in this process, keyed by the extra
+# arguments they were created with
+_ENGINES = {}
 
-def download_audio(album_dir: Path, extra_args: list, urls: list, logger):
+
+def download_audio(album_dir: Path, extra_args: list, urls: list, logger,
+                   archive=None, file_hook=None, state=None, playlists=None) -> list:
     ''' Downloads one or more songs using yt-dlp into the album_dir. If the
     album_dir does not exist, yt-dlp will create it.
 
-    To trigger yt-dlp, its main() function is called. Because the main()
-    function may exit with sys.exit(), it is necessary to patch the sys.exit
-    function temporarily while yt-dlp does its thing, so as not to exit from
-    the ytbdl application.
+    The download is run by a DownloadEngine, which is created the first time a
+    set of extra_args is used and re-used for every download with the same
+    arguments afterwards.
 
     Args:
         album_dir (Path): The directory to download files into
         extra_args (list): A list of arguments to pass to yt-dlp
         urls (list): A list of URLs to download music from.
         logger: A logging object
+        archive (DownloadArchive): An optional archive of previously
+            downloaded videos, which are not downloaded again
+        file_hook: An optional function to call with each file downloaded
+            into this album, see DownloadEngine.add_file_hook
+        state (AlbumState): The optional state of the album's download, to
+            record progress in and re-use complete tracks from
+        playlists (dict): Playlists that were already resolved, by URL, see
+            DownloadEngine.resolve
+
+    Returns:
+        (list): A list of Paths to the files that were downloaded
     '''
-    if extra_args:
-        logger.info(
-            msg='Using extra arguments for yt-dlp: {0}'.format(
-            ' '.join(extra_args)
-        ))
-    else:
-        logger.debug('No extra arguments for yt-dlp found')
-
-    # Arguments used instead of sys.argv
-    override_argv = [
-        '--extract-audio',
-        '--output',
-        str(album_dir / '%(title)s.%(ext)s'),
-        *extra_args,
-        '--',
-        *urls
-    ]
-
-    logger.debug(msg=(
-        'Using the following yt-dlp args in place of sys.argv: {0}'.format(
-        ' '.join(override_argv)
-    )))
-
-    # Patch sys.exit() so yt-dlp can't hijack the current process and exit too
-    # early
-    unpatched_exit = getattr(sys, 'exit')
+    engine = get_engine(extra_args, logger)
+    if file_hook is None:
+        return engine.download(album_dir, urls, archive, state, playlists)
+    engine.add_file_hook(file_hook)
     try:
-        def patched_exit(*args, **_):
-            exit_code = args[0]
-            raise SysExitSignal(exit_code, 'yt-dlp exited with code {0}'.format(
-                exit_code
+        return engine.download(album_dir, urls, archive, state, playlists)
+    finally:
+        engine.remove_file_hook(file_hook)
+
+
+def get_engine(extra_args: list, logger) -> 'DownloadEngine':
+    ''' Get the DownloadEngine for a set of extra arguments, creating it if
+    it does not exist yet in this process.
+
+    Args:
+        extra_args (list): A list of arguments to pass to yt-dlp
+        logger: A logging object
+
+    Returns:
+        (DownloadEngine): An engine that can be used to download many albums
+    '''
+    key = tuple(extra_args)
+    if key not in _ENGINES:
+        if extra_args:
+            logger.info(
+                msg='Using extra arguments for yt-dlp: {0}'.format(
+                ' '.join(extra_args)
             ))
-        setattr(sys, 'exit', patched_exit)
+        else:
+            logger.debug('No extra arguments for yt-dlp found')
+        _ENGINES[key] = DownloadEngine(extra_args, logger, open_metadata_cache(),
+                                       open_scheduler(), open_resources(),
+                                       open_format_cache())
+    return _ENGINES[key]
 
-        # Run yt-dlp's main() function
-        yt_dlp_main(argv=override_argv)
 
-    except SysExitSignal as exc:
-        if exc.exit_code != 0:
-            raise CalledProcessError(
-                exc.exit_code, ['yt-dlp', *override_argv]
-            ) from exc
+def close_engines():
+    ''' Close every DownloadEngine created in this process, and the
+    post-processing pool, resource manager, and format cache they share
+    '''
+    while _ENGINES:
+        _, engine = _ENGINES.popitem()
+        engine.close()
+    close_postprocess_pool()
+    close_resources()
+    close_format_cache()
 
-    finally:
-        sys.exit = unpatched_exit
+
+def ytdl_params(extra_args: list) -> dict:
+    ''' Translate yt-dlp command line arguments into the parameters used to
+    create a YoutubeDL object. The --extract-audio and --output options are
+    always added.
+
+    Args:
+        extra_args (list): A list of arguments to pass to yt-dlp
+
+    Returns:
+        (dict): YoutubeDL parameters
+    '''
+    argv = ['--extract-audio', '--output', OUTPUT_TEMPLATE, *extra_args]
+    try:
+        parsed = parse_options(argv)
+    except SystemExit as exc:
+        # yt-dlp's option parser exits when an option is invalid
+        raise ConfigurationError(
+            'Invalid yt-dlp arguments: {0}'.format(' '.join(extra_args))
+        ) from exc
+    if parsed.urls:
+        raise ConfigurationError(
+            'The yt-dlp arguments contain values that are not options: {0}. '
+            'Pass URLs to ytbdl directly'.format(' '.join(parsed.urls))
+        )
+    return parsed.ydl_opts
 
 
-def ytdl_options(value: str) -> list:
-    ''' Convert a string into a set of command line arguments for yt-dlp
+def may_need_fixup(info_dict: dict) -> bool:
+    ''' Determine whether yt-dlp may fix up the container of a file once it's
+    downloaded, from the format chosen for it
 
     Args:
-        value (str): Input string received
+        info_dict (dict): The yt-dlp info dict of the video, with the format
+            chosen
 
     Returns:
-        (list): A valid list of command line arguments for yt-dlp
+        (bool): True if the file is downloaded with a DASH or HLS protocol, or
+            into a DASH container
+    '''
+    protocols = str(info_dict.get('protocol') or '').split('+')
+    return info_dict.get('container') in FIXUP_CONTAINERS or \
+        any(protocol in FIXUP_PROTOCOLS for protocol in protocols)
+
+
+def modified_before(info: dict, timestamp: float) -> bool:
+    ''' Determine whether a playlist says it was last modified before a time.
+    yt-dlp only knows the day a playlist was modified, in the time zone of the
+    site, so the playlist must have been modified before the day before
+
+    Args:
+        info (dict): The unprocessed info of the playlist
+        timestamp (float): The time
+
+    Returns:
+        (bool): True if the playlist was not modified since the time, False
+            if it was or it's not known
+    '''
+    modified_date = info.get('modified_date')
+    if not modified_date:
+        return False
+    return str(modified_date) < time.strftime('%Y%m%d', time.gmtime(timestamp - 24 * 60 * 60))
+
+
+def _same_filesystem(first: Path, second: Path) -> bool:
+    # Either path may not exist yet, in which case its closest existing parent
+    # is where it will be created
+    devices = []
+    for path in (Path(first).absolute(), Path(second).absolute()):
+        while not path.exists() and path != path.parent:
+            path = path.parent
+        devices.append(path.stat().st_dev)
+    return devices[0] == devices[1]
+
+
+class _FileFinishedPP(PostProcessor):
+    ''' Runs after every other post processor, once a file is in its final
+    location
+    '''
+    def __init__(self, engine, downloader=None):
+        super().__init__(downloader)
+        self.engine = engine
+
+    def run(self, information):
+        self.engine.file_moved(Path(information['filepath']), information)
+        return [], information
+
+
+class _BeforeDownloadPP(PostProcessor):
+    ''' Runs once a video's format is chosen, right before it's downloaded
+    '''
+    def __init__(self, engine, downloader=None):
+        super().__init__(downloader)
+        self.engine = engine
+
+    def run(self, information):
+        self.engine.before_download(information)
+        return [], information
+
+
+class _FormatFallback(ReExtractInfo):
+    ''' Raised to extract a video again in full after the format cache's fast
+    path did not work out
     '''
-    if not value:
-        return []
-
-    args = shlex.split(value)
-    for arg in ('-x', '--extract-audio'):
-        if arg in args:
-            raise ValueError(
-                f'The {arg} yt-dlp option is already specified for you, you do '
-                'not need to add it'
+
+
+class _EngineYoutubeDL(YoutubeDL):
+    ''' Waits for the engine's scheduler before each request, and tells it
+    how each request went
+    '''
+    def __init__(self, engine, params):
+        self.engine = engine
+        super().__init__(params)
+
+    def urlopen(self, req):
+        scheduler = self.engine.scheduler
+        if scheduler is None:
+            return super().urlopen(req)
+        url = req if isinstance(req, str) else getattr(req, 'url', None) or req.full_url
+        scheduler.before_request(url)
+        try:
+            response = super().urlopen(req)
+        except (HTTPError, TransportError) as exc:
+            self.engine.request_failed(url, exc)
+            raise
+        scheduler.after_response(url, response.status)
+        return response
+
+
+class DownloadEngine:
+    ''' Downloads audio with a single YoutubeDL object that is kept alive
+    across many URLs and albums, so that yt-dlp's options are only parsed once,
+    and its extractors, cookies, and HTTP connections are re-used.
+
+    The tracks of a URL are downloaded one at a time, so that a track that
+    fails doesn't stop the others, and it's known which tracks failed. Hooks
+    can be added to be notified of yt-dlp's download progress, and of each
+    file that is finished downloading and post-processing.
+
+    Args:
+        extra_args (list): A list of arguments to pass to yt-dlp
+        logger: A logging object
+        metadata_cache (MetadataCache): An optional cache for yt-dlp metadata
+        scheduler (DownloadScheduler): An optional scheduler for requests and
+            retries
+        resources (ResourceManager): An optional manager of the resources
+            shared with other processes
+        format_cache (FormatCache): An optional cache of the formats videos
+            are downloaded in
+    '''
+
+    def __init__(self, extra_args: list, logger, metadata_cache=None, scheduler=None,
+                 resources=None, format_cache=None):
+        self.extra_args = list(extra_args)
+        self.logger = logger
+        self.metadata_cache = metadata_cache
+        self.scheduler = scheduler
+        self.resources = resources
+        self.format_cache = format_cache
+        self.params, self.extract_audio_options = split_extract_audio(
+            ytdl_params(self.extra_args)
+        )
+        # The extraction options, whether or not yt-dlp runs the extraction
+        self._extraction = self.extract_audio_options or next((
+            pp for pp in self.params.get('postprocessors') or []
+            if pp['key'] == 'FFmpegExtractAudio'
+        ), None)
+        self._checked_temp = False
+        # Errors stop yt-dlp, and are caught for each track instead, unless
+        # the user asked to stop at the first error with --abort-on-error
+        self._abort_on_error = self.params.get('ignoreerrors') is False
+        self._format_spec = str(self.params.get('format'))
+        self._fast_path = None
+        self._extraction_started = None
+        self._extraction_seconds = None
+        self.progress_hooks = []
+        self.file_hooks = []
+        self._ydl = None
+        self._finished_files = []
+        self._album_dir = None
+        self._archive = None
+        self._state = None
+        self._conversions = []
+        self._conversion_errors = []
+        self._done_keys = set()
+        self._deduplicator = None
+        self._playlists = {}
+        self._transient_errors = 0
+        self._errors = []
+        self._transfer = ExitStack()
+        self._track_info = None
+
+    @property
+    def ydl(self) -> YoutubeDL:
+        ''' The YoutubeDL object, created the first time it is needed
+        '''
+        if self._ydl is None:
+            params = dict(self.params)
+            params['progress_hooks'] = [
+                *params.get('progress_hooks', []), self._call_progress_hooks
+            ]
+            params['ignoreerrors'] = False
+            params['match_filter'] = self._match_filter(params.get('match_filter'))
+            params['retry_sleep_functions'] = {
+                kind: self._counted_retry_sleep(kind, function)
+                for kind, function in {
+                    **dict.fromkeys(RETRY_KINDS),
+                    **(params.get('retry_sleep_functions') or {}),
+                }.items()
+            }
+            self._ydl = _EngineYoutubeDL(self, params)
+            self._ydl.add_post_processor(_BeforeDownloadPP(self), when='before_dl')
+            self._ydl.add_post_processor(_FileFinishedPP(self), when='after_move')
+        return self._ydl
+
+    def add_progress_hook(self, hook):
+        ''' Add a function to be called with each of yt-dlp's progress
+        dictionaries while files are downloading
+
+        Args:
+            hook: A function taking a yt-dlp progress dict
+        '''
+        self.progress_hooks.append(hook)
+
+    def add_file_hook(self, hook):
+        ''' Add a function to be called whenever a file has been downloaded
+        and post-processed
+
+        Args:
+            hook: A function taking the Path to the file and the yt-dlp info
+                dict of the video it was downloaded from
+        '''
+        self.file_hooks.append(hook)
+
+    def remove_file_hook(self, hook):
+        ''' Remove a function added with add_file_hook
+
+        Args:
+            hook: The function to remove
+        '''
+        self.file_hooks.remove(hook)
+
+    def download(self, album_dir: Path, urls: list, archive=None, state=None,
+                 playlists: dict = None) -> list:
+        ''' Download one or more URLs into an album directory
+
+        Args:
+            album_dir (Path): The directory to download files into
+            urls (list): A list of URLs to download music from
+            archive (DownloadArchive): An optional archive of previously
+                downloaded videos, which are not downloaded again
+            state (AlbumState): The optional state of the album's download.
+                The progress of each track is recorded in it, and the tracks
+                it has as complete are not downloaded again
+            playlists (dict): Playlists that were already resolved, by URL,
+                which are downloaded without extracting them again, see
+                resolve
+
+        Returns:
+            (list): A list of Paths to the files that were downloaded
+
+        Raises:
+            DownloadError: If any URL or track could not be downloaded, once
+                every other track has been
+        '''
+        ydl = self.ydl
+        paths = dict(self.params.get('paths') or {})
+        paths['home'] = str(album_dir)
+        ydl.params['paths'] = paths
+        if paths.get('temp') and not self._checked_temp:
+            self._checked_temp = True
+            if not _same_filesystem(paths['temp'], album_dir):
+                self.logger.warning(msg='The temporary path {0} is on a different file '
+                                    'system than {1}, so each file is copied into the album '
+                                    'instead of being moved'.format(paths['temp'],
+                                                                    str(album_dir)))
+        self._errors = []
+        self._finished_files = []
+        self._album_dir = Path(album_dir)
+        self._archive = archive
+        self._state = state
+        self._conversions = []
+        self._conversion_errors = []
+        self._done_keys = set()
+        self._playlists = dict(playlists or {})
+        dedupe_options = get_dedupe_options()
+        self._deduplicator = None if dedupe_options is None else \
+            Deduplicator(album_dir, dedupe_options['duration_tolerance'])
+
+        self.logger.debug(msg='Downloading {0} to {1}'.format(
+            ' '.join(urls), str(album_dir)
+        ))
+        try:
+            infos = self.extract_urls(ydl, urls)
+            with self.reserve_space(infos):
+                for url, info in infos:
+                    self.download_url(ydl, url, info)
+        except DownloadCancelled as exc:
+            # e.g. --max-downloads was reached
+            ydl.to_screen('[info] {0}'.format(exc.msg))
+        except YtDlpDownloadError as exc:
+            # Only with --abort-on-error
+            raise DownloadError(
+                'yt-dlp could not download {0}: {1}'.format(' '.join(urls), str(exc))
+            ) from exc
+        finally:
+            conversion_errors = self._conversion_errors + self.wait_for_conversions()
+        if conversion_errors:
+            raise DownloadError(
+                'yt-dlp could not extract the audio of {0} file(s): {1}'.format(
+                    len(conversion_errors), '; '.join(conversion_errors)
+                )
             )
-    for arg in ('-o', '--output'):
-        if arg in args:
-            raise ValueError(
-                f'The {arg} yt-dlp option is already in use, you may not '
-                'specify a custom output format'
+        if self._errors:
+            raise DownloadError(
+                'yt-dlp could not download all of {0}: {1} error(s)'.format(
+                    ' '.join(urls), len(self._errors)
+                )
             )
-    return args
+        return list(self._finished_files)
+
+    def extract_urls(self, ydl: YoutubeDL, urls: list) -> list:
+        ''' Get the unprocessed info of each URL of an album, before any of
+        them is downloaded. The URLs that could not be extracted are recorded
+        as errors
+
+        Args:
+            ydl (YoutubeDL): The YoutubeDL object to extract the info with
+            urls (list): The URLs to download music from
+
+        Returns:
+            (list): A list of (url, info) tuples for the URLs that were
+                extracted
+        '''
+        infos = []
+        for url in urls:
+            if url in self._playlists:
+                infos.append((url, self._playlists[url]))
+                continue
+            try:
+                info = self.extract(ydl, url)
+            except YtDlpDownloadError as exc:
+                if self._abort_on_error:
+                    raise
+                self._errors.append(str(exc))
+                continue
+            if info is not None:
+                infos.append((url, info))
+        return infos
+
+    def reserve_space(self, infos: list):
+        ''' Reserve the disk space an album is estimated to take while it
+        downloads, waiting until it's available, see ResourceManager
+
+        Args:
+            infos (list): The (url, info) tuples of the album, see extract_urls
+
+        Returns:
+            A context manager that holds the reservation
+        '''
+        if self.resources is None:
+            return nullcontext()
+        entries = []
+        for _, info in infos:
+            entries.extend(info['entries'] if isinstance(info.get('entries'), list)
+                           else [info])
+        return self.resources.reserve_space(self._album_dir, estimate_size(entries),
+                                            self.logger)
+
+    def share_download_rate(self):
+        ''' Limit yt-dlp's download rate to this file's share of the download
+        rate of every ytbdl process, or to --limit-rate if it's lower
+        '''
+        rate = self.resources.transfer_rate()
+        if rate is None:
+            return
+        limit_rate = self.params.get('ratelimit')
+        self.ydl.params['ratelimit'] = rate if limit_rate is None else min(rate, limit_rate)
+
+    def download_url(self, ydl: YoutubeDL, url: str, info: dict):
+        ''' Download the tracks of a single URL. If a scheduler is used, the
+        tracks that failed with an error that might go away, e.g. because they
+        were throttled, are retried once the rest of the URL is downloaded,
+        waiting longer after each attempt. The tracks that could not be
+        downloaded are recorded as errors
+
+        Args:
+            ydl (YoutubeDL): The YoutubeDL object to download with
+            url (str): The URL to download music from
+            info (dict): The unprocessed info of the URL, see extract_urls
+        '''
+        metrics = get_metrics()
+        info = self.skip_duplicates(info)
+        if info is None:
+            return
+        failed = []
+        with metrics.phase('download', url=url):
+            for entry, extra_info in self.requested_tracks(ydl, info):
+                if extra_info is not None:
+                    ydl.to_screen('[download] Downloading item {0} of {1}'.format(
+                        extra_info['playlist_autonumber'], extra_info['n_entries']
+                    ))
+                error = self.download_track(ydl, entry, extra_info)
+                if error is None:
+                    continue
+                if self._transient_errors and self.scheduler is not None:
+                    failed.append((entry, extra_info, error))
+                else:
+                    self._errors.append(error)
+
+        attempts = self.scheduler.track_retries if failed else 0
+        for attempt in range(attempts):
+            self.wait_to_retry(attempt, '{0} track(s) from {1} failed'.format(
+                len(failed), url
+            ))
+            retrying, failed = failed, []
+            for entry, extra_info, _ in retrying:
+                metrics.increment('track_retries')
+                with metrics.phase('download', url=entry.get('url') or url, retry=attempt + 1):
+                    error = self.download_track(ydl, entry, extra_info)
+                if error is None:
+                    continue
+                if self._transient_errors:
+                    failed.append((entry, extra_info, error))
+                else:
+                    self._errors.append(error)
+            if not failed:
+                break
+        if failed:
+            self.logger.error(msg='Gave up on {0} track(s) from {1} after {2} retries'.format(
+                len(failed), url, attempts
+            ))
+            self._errors.extend(error for _, _, error in failed)
+
+    def requested_tracks(self, ydl: YoutubeDL, info: dict) -> list:
+        ''' Get the tracks of a URL to download, honouring --playlist-items,
+        --playlist-start and --playlist-end
+
+        Args:
+            ydl (YoutubeDL): The YoutubeDL object to download with
+            info (dict): The unprocessed info of the URL
+
+        Returns:
+            (list): A list of (entry, extra_info) tuples, where extra_info is
+                the playlist's info to add to the entry's, or None if the URL
+                is a single video
+        '''
+        if not isinstance(info.get('entries'), list):
+            return [(info, None)]
+        playlist = {
+            'playlist': info.get('title') or info.get('id'),
+            'playlist_id': info.get('id'),
+            'playlist_title': info.get('title'),
+            'playlist_uploader': info.get('uploader'),
+            'playlist_uploader_id': info.get('uploader_id'),
+            'playlist_count': info.get('playlist_count') or len(info['entries']),
+        }
+        requested = [
+            (index, entry) for index, entry in
+            PlaylistEntries(ydl, info).get_requested_items() if entry
+        ]
+        return [
+            (entry, dict(playlist, n_entries=len(requested), playlist_index=index,
+                         playlist_autonumber=number))
+            for number, (index, entry) in enumerate(requested, start=1)
+        ]
+
+    def download_track(self, ydl: YoutubeDL, entry: dict, extra_info: dict = None,
+                       fast_path: bool = True) -> str:
+        ''' Download a single track, a playlist entry or a video
+
+        Args:
+            ydl (YoutubeDL): The YoutubeDL object to download with
+            entry (dict): The unprocessed info of the track
+            extra_info (dict): The playlist's info to add to the track's
+            fast_path (bool): Whether the track may be extracted without the
+                manifests of its formats, see start_extraction
+
+        Returns:
+            (str): The error the track failed with, or None if it was
+                downloaded or didn't need to be
+        '''
+        self._transient_errors = 0
+        self._track_info = None
+        self._fast_path = None
+        if self.is_done(entry) or self.archived(entry):
+            return None
+        extractor_args = None
+        if fast_path and entry.get('_type') in ('url', 'url_transparent'):
+            extractor_args = self.start_extraction(entry)
+        try:
+            if extractor_args is not None:
+                ydl.params['extractor_args'] = extractor_args
+            try:
+                ydl.process_ie_result(dict(entry), download=True, extra_info=extra_info)
+            except _FormatFallback:
+                # yt-dlp only extracts url entries again by itself. Others, like
+                # url_transparent entries, are extracted again here
+                ydl.process_ie_result(dict(entry), download=True, extra_info=extra_info)
+            return None
+        except DownloadCancelled:
+            raise
+        except Exception as exc: #pylint: disable=broad-except
+            # yt-dlp reports any error in a video unless it was asked to
+            # abort on errors, and only raises its own errors after reporting
+            if self._abort_on_error:
+                raise
+            if not isinstance(exc, YtDlpDownloadError):
+                self.logger.error(msg='Could not download {0}: {1}'.format(
+                    entry.get('title') or entry.get('url') or entry.get('id'), str(exc)
+                ))
+            if not self.format_failed():
+                return str(exc)
+        finally:
+            ydl.params['extractor_args'] = self.params.get('extractor_args')
+            self._transfer.close()
+        # Downloading in the cached format failed, see format_failed
+        return self.download_track(ydl, entry, extra_info, fast_path=False)
+
+    def extract(self, ydl: YoutubeDL, url: str, use_cache: bool = True) -> dict:
+        ''' Get the unprocessed info of a URL, retrying while it fails with an
+        error that might go away
+
+        Args:
+            ydl (YoutubeDL): The YoutubeDL object to extract the info with
+            url (str): The URL to extract
+            use_cache (bool): Get the info from the metadata cache, if there is
+                one. Otherwise, the entries of a playlist may not have been
+                extracted yet
+
+        Returns:
+            (dict): The unprocessed info
+
+        Raises:
+            yt_dlp.utils.DownloadError: If the URL could not be extracted
+        '''
+        attempts = self.scheduler.track_retries + 1 if self.scheduler else 1
+        for attempt in range(attempts):
+            if attempt:
+                self.wait_to_retry(attempt - 1, 'Could not resolve {0}'.format(url))
+            self._transient_errors = 0
+            try:
+                with get_metrics().phase('extract', url=url):
+                    if self.metadata_cache is None or not use_cache:
+                        return ydl.extract_info(url, download=False, process=False)
+                    return self.metadata_cache.extract_info(ydl, url)
+            except YtDlpDownloadError:
+                if not self._transient_errors or attempt == attempts - 1:
+                    raise
+        return None
+
+    def resolve(self, url: str, fresh: bool = False, synced: float = None) -> dict:
+        ''' Extract the entries of a playlist without downloading them, so that
+        parts of the playlist can be downloaded later without extracting it
+        again
+
+        Args:
+            url (str): The URL of the playlist
+            fresh (bool): Extract the playlist again even if it's in the
+                metadata cache, to find the videos that were just added
+            synced (float): When the playlist's entries were last looked at, as
+                a timestamp. If the playlist says it has not been modified
+                since, its entries are not paged through, see
+                modified_before
+
+        Returns:
+            (dict): The unprocessed info of the playlist, which can be pickled,
+                with a list of entries, or None if it was not modified since
+                synced
+
+        Raises:
+            DownloadError: If the playlist could not be extracted
+        '''
+        ydl = self.ydl
+        if fresh and self.metadata_cache is not None:
+            self.metadata_cache.forget_playlist(url)
+        try:
+            # The metadata cache pages through every entry
+            info = self.extract(ydl, url, use_cache=synced is None)
+            if info is not None and synced is not None and modified_before(info, synced):
+                return None
+            entries = info.get('entries') if info is not None else None
+            if entries is not None and not isinstance(entries, list):
+                info['entries'] = list(entries.getslice() if hasattr(entries, 'getslice')
+                                       else entries)
+        except YoutubeDLError as exc:
+            raise DownloadError(
+                'yt-dlp could not resolve {0}: {1}'.format(url, str(exc))
+            ) from exc
+        if info is None:
+            raise DownloadError('yt-dlp could not resolve {0}'.format(url))
+        info = ydl.sanitize_info(info)
+        if not isinstance(info.get('entries'), list):
+            info = {'_type': 'playlist', 'id': info.get('id'), 'title': info.get('title'),
+                    'webpage_url': url, 'entries': [info]}
+        return info
+
+    def skip_duplicates(self, info: dict) -> dict:
+        ''' Leave the entries that are the same song as an entry before them
+        in this album out of a playlist, so that they're not downloaded
+
+        Args:
+            info (dict): The unprocessed info dict of a URL
+
+        Returns:
+            (dict): The info dict to download, which is a copy if any entries
+                were left out, or None if the URL is a single video that's a
+                duplicate. The info dict may be cached, so it's not changed
+        '''
+        if self._deduplicator is None:
+            return info
+        entries = info['entries'] if isinstance(info.get('entries'), list) else [info]
+        kept, duplicates = self._deduplicator.filter(entries)
+        if not duplicates:
+            return info
+        for duplicate, original in duplicates:
+            self.logger.info(msg='Skipping "{0}", a duplicate of "{1}"'.format(
+                duplicate.get('title'), original.get('title')
+            ))
+        get_metrics().increment('duplicates_skipped', len(duplicates))
+        if not isinstance(info.get('entries'), list):
+            return None
+        return dict(info, entries=kept)
+
+    def track_done(self, info_dict: dict):
+        ''' Remember that a track does not need to be downloaded again in
+        this album
+
+        Args:
+            info_dict (dict): The yt-dlp info dict of the track
+        '''
+        self._done_keys.update(entry_keys(info_dict))
+
+    def is_done(self, info_dict: dict) -> bool:
+        ''' Determine whether a track was downloaded, or was already in the
+        archive. The track can be a flat playlist entry, which may only have a
+        URL
+
+        Args:
+            info_dict (dict): The yt-dlp info dict of the track
+
+        Returns:
+            (bool): True if the track does not need to be downloaded again
+        '''
+        return not self._done_keys.isdisjoint(entry_keys(info_dict))
+
+    def wait_to_retry(self, attempt: int, reason: str):
+        ''' Wait before retrying, for longer after each attempt
+
+        Args:
+            attempt (int): The number of attempts that have failed, minus one
+            reason (str): Why a retry is needed
+        '''
+        delay = self.scheduler.retry_delay(attempt)
+        self.logger.warning(msg='{0}, retrying in {1:.1f} seconds'.format(reason, delay))
+        with get_metrics().phase('backoff', attempt=attempt + 1):
+            time.sleep(delay)
+
+    def request_failed(self, url: str, exc: BaseException):
+        ''' Called when one of yt-dlp's requests fails. If the host throttled
+        the request, the scheduler slows down requests to it
+
+        Args:
+            url (str): The URL that was requested
+            exc (BaseException): The error the request failed with
+        '''
+        if is_transient(exc):
+            self._transient_errors += 1
+            get_metrics().increment('transient_errors')
+        if not isinstance(exc, HTTPError):
+            return
+        rate = self.scheduler.after_response(
+            url, exc.status, exc.response.headers.get('Retry-After')
+        )
+        if rate is not None:
+            self.logger.warning(msg='{0} is throttling requests, slowing down to {1:.2f} '
+                                    'requests per second'.format(urlsplit(url).netloc, rate))
+
+    def needs_fixup(self, info_dict: dict) -> bool:
+        ''' Determine whether yt-dlp should fix the container of a downloaded
+        file, e.g. a DASH m4a, as it normally does. It's not needed if the
+        audio extraction is going to write the audio into a new container,
+        unless the user chose how files are fixed up with --fixup
+
+        Args:
+            info_dict (dict): The yt-dlp info dict of the video, with the
+                format chosen
+
+        Returns:
+            (bool): True if yt-dlp should fix the file up as usual
+        '''
+        if self.params.get('fixup') is not None or self._extraction is None:
+            return True
+        return not rewrites_file(info_dict.get('ext'), self._extraction)
+
+    def start_extraction(self, entry: dict) -> dict:
+        ''' Called by yt-dlp before a playlist entry is extracted. Decides
+        whether the entry can be extracted without the manifests of its
+        formats, because the format its uploader's videos are downloaded in
+        is known
+
+        Args:
+            entry (dict): The flat playlist entry
+
+        Returns:
+            (dict): The extractor_args YoutubeDL param to extract the entry
+                with, or None to extract it as usual
+        '''
+        self._extraction_started = time.perf_counter()
+        self._fast_path = None
+        if self.format_cache is None or entry.get('ie_key') not in MANIFEST_SKIP_ARGS:
+            return None
+        preference = self.format_cache.get(entry['ie_key'], uploader_key(entry),
+                                           self._format_spec)
+        skip_args = self.format_cache.manifest_skip_args(preference)
+        if skip_args is None:
+            get_metrics().increment('format_cache_misses')
+            return None
+        get_metrics().increment('format_cache_hits')
+        self._fast_path = preference
+        return merge_extractor_args(self.params.get('extractor_args'), skip_args)
+
+    def before_download(self, info_dict: dict):
+        ''' Called by yt-dlp once a video's format is chosen, right before it's
+        downloaded. The video's container is only fixed up if it needs to be,
+        see needs_fixup, and the download waits for a transfer slot shared
+        with other processes, which is held until the file is in the album
+
+        Args:
+            info_dict (dict): The yt-dlp info dict of the video, with the
+                format chosen
+
+        Raises:
+            ReExtractInfo: If the video needs to be extracted again, see
+                check_format
+        '''
+        self.check_format(info_dict)
+        self._track_info = dict(info_dict)
+        if self.needs_fixup(info_dict):
+            self.ydl.params['fixup'] = self.params.get('fixup')
+        else:
+            if may_need_fixup(info_dict):
+                get_metrics().increment('fixups_skipped')
+            self.ydl.params['fixup'] = 'never'
+        if self.resources is not None:
+            self._transfer.close()
+            self._transfer.enter_context(
+                self.resources.transfer(self.logger, info_dict.get('title'))
+            )
+            self.share_download_rate()
+
+    def check_format(self, info_dict: dict):
+        ''' Check the format chosen for a video before it's downloaded. A video
+        extracted on the fast path is extracted again in full if the format
+        chosen isn't the one its uploader's videos are downloaded in, since a
+        better format may be in the manifests
+
+        Args:
+            info_dict (dict): The yt-dlp info dict of the video, with the
+                format chosen
+
+        Raises:
+            ReExtractInfo: If the video needs to be extracted again
+        '''
+        if self._extraction_started is not None:
+            self._extraction_seconds = time.perf_counter() - self._extraction_started
+        if self._fast_path is not None and \
+                info_dict.get('format_id') != self._fast_path.format_id:
+            reason = 'Format {0} was chosen instead of the usual {1}, extracting all ' \
+                     'formats'.format(info_dict.get('format_id'), self._fast_path.format_id)
+            self.fall_back()
+            raise _FormatFallback(reason, expected=True)
+
+    def format_downloaded(self, info_dict: dict):
+        ''' Record the format a video was downloaded in in the format cache
+
+        Args:
+            info_dict (dict): The yt-dlp info dict of the video, with the
+                format chosen
+        '''
+        if self.format_cache is None:
+            return
+        if self._fast_path is None:
+            self.format_cache.record_success(self._format_spec, info_dict,
+                                             self._extraction_seconds)
+        else:
+            self.format_cache.record_success(self._format_spec, info_dict)
+            if self._fast_path.extract_seconds and self._extraction_seconds is not None:
+                get_metrics().increment('format_cache_seconds_saved', max(
+                    0.0, self._fast_path.extract_seconds - self._extraction_seconds
+                ))
+        self._fast_path = None
+        self._extraction_started = None
+        self._extraction_seconds = None
+
+    def format_failed(self) -> bool:
+        ''' Record the format of the track that failed to download as failing
+        in the format cache
+
+        Returns:
+            (bool): True if the track was extracted on the fast path, so that
+                it's extracted again in full, and downloaded in the format
+                chosen from all of its formats
+        '''
+        if self.format_cache is None or self._track_info is None:
+            return False
+        self.format_cache.record_failure(self._format_spec, self._track_info)
+        if self._fast_path is None:
+            return False
+        self.logger.warning(msg='Format {0} could not be downloaded, extracting all '
+                                'formats'.format(self._track_info.get('format_id')))
+        self.fall_back()
+        return True
+
+    def fall_back(self):
+        ''' Extract the video being downloaded again in full, after the fast
+        path did not work out
+        '''
+        get_metrics().increment('format_cache_fallbacks')
+        self._fast_path = None
+        self._extraction_started = time.perf_counter()
+        self.ydl.params['extractor_args'] = self.params.get('extractor_args')
+
+    def file_moved(self, file_path: Path, info_dict: dict):
+        ''' Called by yt-dlp when a file has been moved into the album folder.
+        The file is finished unless its audio still needs to be extracted
+        '''
+        self._transfer.close()
+        self.track_done(info_dict)
+        self.format_downloaded(info_dict)
+        if self.extract_audio_options is None:
+            self.file_finished(file_path, info_dict)
+            return
+
+        conversion_info = {
+            key: info_dict.get(key) for key in ('ext', 'vcodec', 'acodec', 'filetime')
+        }
+        conversion_info['filepath'] = str(file_path)
+        future = get_postprocess_pool().submit(
+            extract_audio, conversion_info, self.extract_audio_options,
+            conversion_params(self.params)
+        )
+        # yt-dlp clears the info dict once it's done with the video
+        self._conversions.append((future, file_path, dict(info_dict)))
+        # Hand on the files that were converted while this one downloaded
+        self._conversion_errors.extend(self.wait_for_conversions(block=False))
+
+    def wait_for_conversions(self, block: bool = True) -> list:
+        ''' Finish the files whose audio has been extracted, in the order they
+        were downloaded
+
+        Args:
+            block (bool): Wait for the audio of every file downloaded so far
+                to be extracted. Otherwise, stop at the first file whose audio
+                is still being extracted
+
+        Returns:
+            (list): A list of error messages for the files whose audio could
+                not be extracted
+        '''
+        errors = []
+        while self._conversions:
+            future, file_path, info_dict = self._conversions[0]
+            if not block and not future.done():
+                break
+            self._conversions.pop(0)
+            new_path, result, seconds = future.result()
+            get_metrics().add_phase('convert', time.time() - seconds, seconds,
+                                    path=str(file_path))
+            if info_dict.get('id'):
+                get_metrics().update_track(info_dict['id'], convert_seconds=seconds)
+            if new_path is None:
+                self.logger.error(msg='Could not extract audio from {0}: {1}'.format(
+                    str(file_path), result
+                ))
+                errors.append(result)
+                continue
+            self.file_finished(Path(new_path), {
+                **info_dict, 'filepath': new_path, 'ext': result
+            })
+        return errors
+
+    def file_finished(self, file_path: Path, info_dict: dict):
+        ''' Called by yt-dlp when a file is in its final location
+        '''
+        self.logger.debug(msg='Finished {0}'.format(str(file_path)))
+        self._finished_files.append(file_path)
+        if info_dict.get('id'):
+            get_metrics().update_track(
+                info_dict['id'], title=info_dict.get('title'), path=str(file_path),
+                album=str(self._album_dir)
+            )
+        if self._archive is not None and info_dict.get('id'):
+            extractor = info_dict.get('extractor_key') or info_dict.get('ie_key')
+            self._archive.record(extractor, info_dict['id'], file_path, self._album_dir)
+        if self.metadata_cache is not None:
+            self.metadata_cache.record_file(file_path, info_dict)
+        for hook in self.file_hooks:
+            hook(file_path, info_dict)
+
+    def archived(self, info_dict: dict) -> bool:
+        ''' Determine whether a track has already been downloaded, see
+        in_archive. The track can be a flat playlist entry
+
+        Args:
+            info_dict (dict): The yt-dlp info dict of the track
+
+        Returns:
+            (bool): True if the track does not need to be downloaded
+        '''
+        extractor = info_dict.get('extractor_key') or info_dict.get('ie_key')
+        if not extractor or not info_dict.get('id') or \
+                not self.in_archive(extractor, info_dict['id']):
+            return False
+        self.track_done(info_dict)
+        return True
+
+    def in_archive(self, extractor: str, video_id: str) -> bool:
+        ''' Determine whether a video has already been downloaded. A video
+        downloaded for another album is downloaded again, since beets tags its
+        file for that album. The file of a video downloaded for this album
+        that beets has since moved is copied back into the album directory
+
+        Args:
+            extractor (str): The name of the yt-dlp extractor
+            video_id (str): The ID of the video
+
+        Returns:
+            (bool): True if the video does not need to be downloaded
+        '''
+        if self._state is not None and self._state.get_path(video_id) is not None:
+            self.logger.debug(msg='{0} was already downloaded into this album'.format(
+                video_id
+            ))
+            return True
+        if self._archive is None:
+            return False
+        archived_path = self._archive.get_path(extractor, video_id, self._album_dir)
+        if archived_path is None:
+            return False
+
+        album_dir = self._album_dir.resolve()
+        if archived_path.parent != album_dir:
+            copied_path = album_dir / archived_path.name
+            if not copied_path.exists():
+                self.logger.info(msg='Copying {0}, which was already downloaded'.format(
+                    str(archived_path)
+                ))
+                album_dir.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(archived_path, copied_path)
+        return True
+
+    def _match_filter(self, user_filter=None):
+        ''' Wrap the --match-filter passed to yt-dlp, if any, so that yt-dlp
+        skips the tracks that were already downloaded, see archived
+        '''
+        def match_filter(info_dict, incomplete=False):
+            if user_filter is not None:
+                try:
+                    reason = user_filter(info_dict, incomplete=incomplete)
+                except TypeError:
+                    reason = user_filter(info_dict)
+                if reason is not None:
+                    return reason
+            if self.archived(info_dict):
+                return '{0} has already been downloaded'.format(
+                    info_dict.get('title') or info_dict['id']
+                )
+            return None
+        return match_filter
+
+    def _call_progress_hooks(self, progress: dict):
+        if progress.get('status') == 'finished':
+            self._record_transfer(progress)
+        elif self.resources is not None and progress.get('status') == 'downloading':
+            # Transfers start and finish in other processes while this one
+            # downloads
+            self.share_download_rate()
+        if self._state is not None:
+            self._state.update_progress(progress)
+        for hook in self.progress_hooks:
+            hook(progress)
+
+    @staticmethod
+    def _record_transfer(progress: dict):
+        size = progress.get('downloaded_bytes') or progress.get('total_bytes') or 0
+        metrics = get_metrics()
+        metrics.increment('bytes_downloaded', size)
+        video_id = (progress.get('info_dict') or {}).get('id')
+        if video_id:
+            metrics.add_to_track(video_id, bytes=size,
+                                 transfer_seconds=progress.get('elapsed') or 0)
+
+    def _counted_retry_sleep(self, kind: str, sleep_function=None):
+        ''' Wrap one of yt-dlp's retry sleep functions, which yt-dlp calls
+        before each retry, so that retries are counted. Without a --retry-sleep
+        for the kind of retry, yt-dlp backs off like the scheduler does
+        '''
+        def retry_sleep(n):
+            metrics = get_metrics()
+            metrics.increment('retries')
+            metrics.increment('{0}_retries'.format(kind))
+            if sleep_function is not None:
+                return sleep_function(n=n)
+            return self.scheduler.retry_delay(n) if self.scheduler is not None else 0
+        return retry_sleep
+
+    def close(self):
+        ''' Close the YoutubeDL object, saving any cookies
+        '''
+        if self._ydl is not None:
+            self._ydl.close()
+            self._ydl = None
@@ -0,0 +1,41 @@
+import shlex
+
+
+def ytdl_options(value: str) -> list:
+    ''' Convert a string into a set of command line arguments for yt-dlp
+
+    Args:
+        value (str): Input string received
+
+    Returns:
+        (list): A valid list of command line arguments for yt-dlp
+    '''
+    if not value:
+        return []
+
+    return check_ytdl_args(shlex.split(value))
+
+
+def check_ytdl_args(args: list) -> list:
+    ''' Verify that a list of command line arguments for yt-dlp does not
+    contain any of the options that ytbdl already uses
+
+    Args:
+        args (list): A list of command line arguments for yt-dlp
+
+    Returns:
+        (list): The same list of arguments, if they are valid
+    '''
+    for arg in ('-x', '--extract-audio'):
+        if arg in args:
+            raise ValueError(
+                f'The {arg} yt-dlp option is already specified for you, you do '
+                'not need to add it'
+            )
+    for arg in ('-o', '--output'):
+        if arg in args:
+            raise ValueError(
+                f'The {arg} yt-dlp option is already in use, you may not '
+                'specify a custom output format'
+            )
+    return args